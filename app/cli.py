@@ -0,0 +1,180 @@
+"""
+Headless batch ingestion: run the same parse -> push -> Chainsaw -> results pipeline as /upload over a
+local directory, without going through the browser.
+
+    python cli.py /evidence/case42 --case-name "Case 42" --destination splunk --workers 8
+    python cli.py /evidence/case42 --resume Case_42_1a2b3c4d
+
+The session's results.json lands in OUTPUT_DIR, so /results/<session_id> displays it in the web UI.
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config import OUTPUT_DIR
+from services.archive import is_archive
+from services.pipeline import IngestSession
+from services.profiles import INGEST_PROFILES
+
+logger = logging.getLogger("evtx_uploader")
+
+PROGRESS_FILENAME = "cli_progress.json"
+
+def find_inputs(root: str) -> list[str]:
+    """All EVTX files and archives below root, in a stable order."""
+    found = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.lower().endswith(".evtx") or is_archive(name):
+                found.append(os.path.join(dirpath, name))
+    return sorted(found)
+
+def load_progress(session_folder: str) -> dict:
+    path = os.path.join(session_folder, PROGRESS_FILENAME)
+    if not os.path.exists(path):
+        return {"files": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_progress(session_folder: str, progress: dict):
+    path = os.path.join(session_folder, PROGRESS_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(progress, f, indent=2)
+    os.replace(tmp_path, path)
+
+async def run(args) -> int:
+    root = os.path.abspath(args.path)
+    if not os.path.isdir(root):
+        logger.error(f"Not a directory: {root}")
+        return 2
+
+    # Parsing runs in the default executor; size it so --workers files really parse in parallel
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=args.workers))
+
+    progress = load_progress(os.path.join(OUTPUT_DIR, args.resume)) if args.resume else {"files": {}}
+    progress["case_name"] = args.case_name or progress.get("case_name") or "Untitled Case"
+
+    filters = None
+    if args.filters:
+        with open(args.filters, "r") as f:
+            filters = json.load(f)
+
+    sequences = None
+    if args.sequences:
+        with open(args.sequences, "r") as f:
+            sequences = json.load(f)
+
+    iocs = None
+    if args.iocs:
+        with open(args.iocs, "r", errors="replace") as f:
+            iocs = f.read()
+
+    try:
+        session = IngestSession(
+            case_name=progress["case_name"],
+            destination=args.destination,
+            index=args.index,
+            splunk_url=args.splunk_url,
+            splunk_token=args.splunk_token,
+            es_host=args.es_host,
+            es_port=args.es_port,
+            es_index=args.es_index,
+            session_id=args.resume,
+            concurrency=args.workers,
+            incremental=args.incremental,
+            profile=args.profile,
+            filters=filters,
+            iocs=iocs,
+            sequences=sequences,
+            detection_engine=args.engine,
+        )
+    except ValueError as e:
+        logger.error(str(e))
+        return 2
+
+    # Files already handled by an earlier run of this session are skipped unless they changed since
+    done = progress["files"]
+    inputs = find_inputs(root)
+    pending = []
+    restored = []
+    for path in inputs:
+        rel = os.path.relpath(path, root)
+        st = os.stat(path)
+        entry = done.get(rel)
+        if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+            restored += entry["results"]
+        else:
+            pending.append((rel, path, st))
+    # Before any new file, so de-duplication already knows every record of the earlier run
+    await asyncio.gather(*(session.restore(result) for result in restored))
+
+    session.progress["total"] = len(pending)
+    session.progress["status"] = "parsing"
+    logger.info(f"Session {session.session_id}: {len(inputs)} input(s), {len(pending)} to process, {len(inputs) - len(pending)} already done")
+
+    lock = asyncio.Lock()
+
+    async def process(rel: str, path: str, st: os.stat_result):
+        if is_archive(path):
+            with open(path, "rb") as f:
+                results = await session.process_archive(f, os.path.basename(path))
+        else:
+            result = await session.process_evtx(session.reserve_name(os.path.basename(path)), path)
+            results = [result] if result else []
+
+        async with lock:
+            if results:
+                done[rel] = {"size": st.st_size, "mtime": st.st_mtime, "results": results}
+                save_progress(session.session_folder, progress)
+            logger.info(f"[{session.progress['completed']}/{session.progress['total']}] {rel}")
+
+    await asyncio.gather(*(process(rel, path, st) for rel, path, st in pending))
+
+    if args.no_hunt:
+        await session.flush()
+        logger.info(f"Ingest finished; skipping Chainsaw. Resume with --resume {session.session_id}")
+        return 0
+
+    response_data = await session.finalize(cleanup_delay=None)
+    if response_data is None:
+        logger.error("No .evtx files were processed")
+        return 1
+
+    summary = response_data.get("summary", {})
+    logger.info(f"Done: {len(response_data['uploaded'])} file(s), {summary.get('total', 0)} detection(s)")
+    logger.info(f"Results: {os.path.join(OUTPUT_DIR, session.session_id, 'results.json')} (web UI: /results/{session.session_id})")
+    return 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the EVTXorcist ingest pipeline over a local directory.")
+    parser.add_argument("path", help="Directory containing .evtx files and/or ZIP/tar.gz archives (searched recursively)")
+    parser.add_argument("--case-name", default=None, help="Defaults to the resumed session's case name, else 'Untitled Case'")
+    parser.add_argument("--destination", default="splunk", help="Comma-separated: splunk, elasticsearch, file (session events.ndjson), sqlite (session event store) or none")
+    parser.add_argument("--index", default="main")
+    parser.add_argument("--splunk-url", default=None)
+    parser.add_argument("--splunk-token", default=None)
+    parser.add_argument("--es-host", default="elasticsearch")
+    parser.add_argument("--es-port", type=int, default=9200)
+    parser.add_argument("--es-index", default=None, help="Elasticsearch index when fanning out together with Splunk (default: --index)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="EVTX files processed concurrently")
+    parser.add_argument("--resume", metavar="SESSION_ID", default=None, help="Continue an interrupted run of this session")
+    parser.add_argument("--incremental", action="store_true", help="Only ingest records newer than the EventRecordID checkpoints")
+    parser.add_argument("--profile", choices=sorted(INGEST_PROFILES), default=None, help="Ingest profile (default: INGEST_PROFILE)")
+    parser.add_argument("--filters", metavar="RULES_JSON", default=None, help="Case filter rules applied before the global FILTER_RULES_FILE")
+    parser.add_argument("--iocs", metavar="IOC_FILE", default=None, help="IOC list (one per line or JSON) swept over every record; hits become detections")
+    parser.add_argument("--sequences", metavar="SEQUENCES_JSON", default=None, help="Case correlation sequences applied with the global CORRELATION_RULES_FILE")
+    parser.add_argument("--engine", choices=["chainsaw", "inline"], default=None, help="Detection engine (default: DETECTION_ENGINE)")
+    parser.add_argument("--no-hunt", action="store_true", help="Only parse and push; skip Chainsaw and results")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    return asyncio.run(run(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,8 +6,90 @@ OUTPUT_DIR = "/tmp/output"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Persistent state (checkpoints) lives on the mounted uploads volume so it survives container restarts
+STATE_DIR = os.environ.get("STATE_DIR", os.path.join(UPLOAD_DIR, ".state"))
+os.makedirs(STATE_DIR, exist_ok=True)
+
+# Archive ingestion limits (zip-bomb protection)
+ARCHIVE_MAX_MEMBERS = int(os.environ.get("ARCHIVE_MAX_MEMBERS", "5000"))
+ARCHIVE_MAX_TOTAL_BYTES = int(os.environ.get("ARCHIVE_MAX_TOTAL_BYTES", str(64 * 1024 ** 3)))
+ARCHIVE_MAX_RATIO = int(os.environ.get("ARCHIVE_MAX_RATIO", "1000"))
+
+# Resumable chunked uploads
+RESUMABLE_CHUNK_SIZE = int(os.environ.get("RESUMABLE_CHUNK_SIZE", str(8 * 1024 * 1024)))
+RESUMABLE_MAX_CHUNK_SIZE = int(os.environ.get("RESUMABLE_MAX_CHUNK_SIZE", str(64 * 1024 * 1024)))
+RESUMABLE_TTL = int(os.environ.get("RESUMABLE_TTL", str(24 * 3600)))
+
+# Cross-file record de-duplication within a case: "exact" (64-bit digests), "bloom" or "off"
+DEDUP_MODE = os.environ.get("DEDUP_MODE", "exact")
+# Records the first Bloom filter holds; further filters of growing size are added as the case needs them
+DEDUP_BLOOM_CAPACITY = int(os.environ.get("DEDUP_BLOOM_CAPACITY", "1000000"))
+DEDUP_BLOOM_ERROR_RATE = float(os.environ.get("DEDUP_BLOOM_ERROR_RATE", "0.0001"))
+
+# Ingest profile applied to parsed records before they are stored and pushed (raw, flat, compact or a custom one)
+INGEST_PROFILE = os.environ.get("INGEST_PROFILE", "raw")
+# Optional JSON file of extra profiles: {"name": {"flatten": true, "drop_empty": true, "fields": {"4624": [...]}}}
+INGEST_PROFILES_FILE = os.environ.get("INGEST_PROFILES_FILE", os.path.join(STATE_DIR, "ingest_profiles.json"))
+
+# Global ingest filter rules (JSON list of {name, when, action, rate}); cases can add their own at upload time
+FILTER_RULES_FILE = os.environ.get("FILTER_RULES_FILE", os.path.join(STATE_DIR, "filter_rules.json"))
+
+# Global correlation sequences (JSON list of {name, window, steps}); cases can add their own at upload time
+CORRELATION_RULES_FILE = os.environ.get("CORRELATION_RULES_FILE", os.path.join(STATE_DIR, "correlation_rules.json"))
+
+# Detection engine: "chainsaw" runs the Chainsaw binary after ingest; "inline" matches the Sigma rules against
+# records as they are parsed, using a compiled rule set cached in SIGMA_CACHE_FILE
+DETECTION_ENGINE = os.environ.get("DETECTION_ENGINE", "chainsaw")
+SIGMA_RULES_DIR = os.environ.get("SIGMA_RULES_DIR", "/opt/sigma/rules")
+SIGMA_CACHE_FILE = os.environ.get("SIGMA_CACHE_FILE", os.path.join(STATE_DIR, "sigma_rules.pickle"))
+
+# Destination fan-out: records are queued per sink in batches; a full queue throttles the parser for that sink only
+SINK_BATCH_SIZE = int(os.environ.get("SINK_BATCH_SIZE", "5000"))
+SINK_QUEUE_BATCHES = int(os.environ.get("SINK_QUEUE_BATCHES", "16"))
+SINK_WORKERS = int(os.environ.get("SINK_WORKERS", "4"))
+
+# Embedded per-session event stores (destination "sqlite"); kept with the state so they outlive session cleanup
+STORE_DIR = os.environ.get("STORE_DIR", os.path.join(STATE_DIR, "stores"))
+os.makedirs(STORE_DIR, exist_ok=True)
+
+# Per-session summary statistics (EventIDs, hosts, channels, users, hourly volume) used to seed the chat
+CASE_STATS_DIR = os.environ.get("CASE_STATS_DIR", os.path.join(STATE_DIR, "case_stats"))
+os.makedirs(CASE_STATS_DIR, exist_ok=True)
+
+# Per-session detections (NDJSON) and their rule/host index behind the paginated results API; kept with the state
+# so the results page keeps working after session cleanup
+RESULTS_DIR = os.environ.get("RESULTS_DIR", os.path.join(STATE_DIR, "results"))
+os.makedirs(RESULTS_DIR, exist_ok=True)
+
+# Per-session time-sorted timeline files merged by /api/timeline; kept with the state so they outlive session cleanup
+TIMELINE_DIR = os.environ.get("TIMELINE_DIR", os.path.join(STATE_DIR, "timelines"))
+os.makedirs(TIMELINE_DIR, exist_ok=True)
+
+# Per-session vector index of detection rules and hosts, used to pick the chat context relevant to each question
+VECTOR_DIR = os.environ.get("VECTOR_DIR", os.path.join(STATE_DIR, "vectors"))
+os.makedirs(VECTOR_DIR, exist_ok=True)
+CONTEXT_TOP_K = int(os.environ.get("CONTEXT_TOP_K", "8"))
+
+# Drop-folder watcher (disabled unless WATCH_DIR is set)
+WATCH_DIR = os.environ.get("WATCH_DIR", "")
+WATCH_POLL_INTERVAL = float(os.environ.get("WATCH_POLL_INTERVAL", "2"))
+WATCH_SETTLE_SECONDS = float(os.environ.get("WATCH_SETTLE_SECONDS", "5"))
+WATCH_DESTINATION = os.environ.get("WATCH_DESTINATION", "splunk")
+WATCH_INDEX = os.environ.get("WATCH_INDEX", "main")
+WATCH_CASE_NAME = os.environ.get("WATCH_CASE_NAME", "Drop Folder")
+WATCH_HUNT = os.environ.get("WATCH_HUNT", "true").lower() == "true"
+# Grown files only push records above the per-(Computer, Channel) EventRecordID checkpoints
+WATCH_INCREMENTAL = os.environ.get("WATCH_INCREMENTAL", "true").lower() == "true"
+
 # External Services
-OLLAMA_HOST = "http://host.docker.internal:11434"
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://host.docker.internal:11434")
 OLLAMA_BASE = OLLAMA_HOST
-MCP_SSE_URL = "http://splunk-mcp:8000/sse"
+# Model manager: model loaded at startup, listing cache, and the bounds of the adaptive keep_alive (seconds)
+OLLAMA_DEFAULT_MODEL = os.environ.get("OLLAMA_DEFAULT_MODEL", "")
+OLLAMA_MODELS_TTL = float(os.environ.get("OLLAMA_MODELS_TTL", "60"))
+OLLAMA_KEEP_ALIVE_MIN = int(os.environ.get("OLLAMA_KEEP_ALIVE_MIN", "300"))
+OLLAMA_KEEP_ALIVE_MAX = int(os.environ.get("OLLAMA_KEEP_ALIVE_MAX", "3600"))
+# Embedding model for the context index; empty (or unavailable) falls back to hashed bag-of-words vectors
+OLLAMA_EMBED_MODEL = os.environ.get("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+MCP_SSE_URL = os.environ.get("MCP_SSE_URL", "http://splunk-mcp:8000/sse")
 MCP_TOKEN = os.environ.get("MCP_TOKEN", "evtxorcist_secret_token")
@@ -1,3 +1,5 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -5,13 +7,31 @@ from fastapi.responses import JSONResponse
 import httpx
 import logging
 
-from routes import render, upload, chat, downloads
+from config import WATCH_DIR
+from routes import render, upload, resumable, chat, downloads, search, ioc, timeline
+from routes.resumable import purge_expired_uploads
+from services.watcher import DropFolderWatcher
+from services.ollama_models import model_manager
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("evtx_uploader")
 
+watcher = DropFolderWatcher(WATCH_DIR) if WATCH_DIR else None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    watcher_task = asyncio.create_task(watcher.run()) if watcher else None
+    # In the background, so startup doesn't wait for Ollama
+    warm_task = asyncio.create_task(model_manager.warm())
+    purge_task = asyncio.create_task(purge_expired_uploads())
+    yield
+    warm_task.cancel()
+    purge_task.cancel()
+    if watcher_task:
+        watcher_task.cancel()
+
 # App setup
-app = FastAPI(title="EVTX Uploader")
+app = FastAPI(title="EVTX Uploader", lifespan=lifespan)
 
 # Allow CORS (adjust for production)
 app.add_middleware(
@@ -37,8 +57,18 @@ async def check_splunk_health():
     except httpx.RequestError:
         return JSONResponse(content={"status": "starting"})
 
+@app.get("/api/watcher")
+async def watcher_status():
+    if watcher is None:
+        return JSONResponse(content={"enabled": False})
+    return JSONResponse(content={"enabled": True, **watcher.status()})
+
 # Include Routers
 app.include_router(render.router)
 app.include_router(upload.router)
+app.include_router(resumable.router)
 app.include_router(chat.router)
-app.include_router(downloads.router)
\ No newline at end of file
+app.include_router(downloads.router)
+app.include_router(search.router)
+app.include_router(ioc.router)
+app.include_router(timeline.router)
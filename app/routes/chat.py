@@ -1,11 +1,16 @@
 import json
-import httpx
+import time
+import asyncio
 import logging
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from config import OLLAMA_HOST, OLLAMA_BASE
+from config import OLLAMA_HOST, CONTEXT_TOP_K
 from services.mcp_client import get_mcp_tools, call_mcp_tool, format_tools_for_ollama
+from services.case_stats import find_case_stats, format_case_context
+from services.tool_calls import SpeculativeToolRunner, detect_tool_calls
+from services.ollama_models import model_manager
+from services.vector_index import search_context, format_context
 
 logger = logging.getLogger("evtx_uploader")
 
@@ -24,32 +29,58 @@ class PreloadRequest(BaseModel):
 @router.get("/api/models")
 async def list_models():
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            resp = await client.get(f"{OLLAMA_BASE}/api/tags")
-            resp.raise_for_status()
-            data = resp.json()
-            models = [{"name": m["name"], "size": m.get("size", 0)} for m in data.get("models", [])]
-            return JSONResponse(content={"models": models})
+        models = await model_manager.list_models()
+        try:
+            resident = await model_manager.resident()
+        except Exception:
+            resident = {}
+        return JSONResponse(content={"models": [{**m, "loaded": m["name"] in resident} for m in models]})
     except Exception as e:
         return JSONResponse(status_code=503, content={"error": str(e), "models": []})
 
+@router.get("/api/models/status")
+async def models_status():
+    """Resident models, adaptive keep_alive per model, and load / unload timings."""
+    return JSONResponse(content=await model_manager.status())
+
 @router.post("/api/preload")
 async def preload_model(req: PreloadRequest):
     try:
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            resp = await client.post(
-                f"{OLLAMA_BASE}/api/generate",
-                json={"model": req.model, "stream": False, "keep_alive": "5m"}
-            )
-            resp.raise_for_status()
-            return JSONResponse(content={"status": "loaded"})
+        result = await model_manager.load(req.model)
+        return JSONResponse(content={"status": "loaded", **result})
     except Exception as e:
         logger.error(f"Error preloading model {req.model}: {e}")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+@router.post("/api/unload")
+async def unload_model(req: PreloadRequest):
+    try:
+        result = await model_manager.unload(req.model)
+        return JSONResponse(content={"status": "unloaded" if result["released"] else "pending", **result})
+    except Exception as e:
+        logger.error(f"Error unloading model {req.model}: {e}")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
 @router.get("/api/context")
-async def get_chat_context():
-    """Fetches a summary of Chainsaw detections from Splunk to seed the AI's context."""
+async def get_chat_context(session_id: str = None, q: str = None, k: int = CONTEXT_TOP_K):
+    """
+    Seeds the AI's context from the stored case stats, falling back to a Chainsaw summary search in Splunk.
+    With q, returns the k detections and host summaries of the case most relevant to that question instead.
+    """
+    stats = await asyncio.to_thread(find_case_stats, session_id)
+    if stats and q:
+        hits = await asyncio.to_thread(search_context, stats["session_id"], q, max(1, min(k, 50)))
+        if hits is None:
+            return JSONResponse(status_code=404, content={"error": "No context index for this session"})
+        return JSONResponse(content={"session_id": stats["session_id"], "context": format_context(hits), "results": hits})
+    if stats:
+        context_prompt = (
+            "Here are the precomputed facts about the current case (no search needed for these):\n"
+            f"{format_case_context(stats)}\n\n"
+            "Use this context to guide the user's investigation."
+        )
+        return JSONResponse(content={"context": context_prompt, "session_id": stats.get("session_id")})
+
     query = 'search index=main sourcetype=chainsaw | stats count by level, name | sort - count | head 20'
     try:
         result = await call_mcp_tool("search_splunk", {"search_query": query})
@@ -67,238 +98,310 @@ async def get_chat_context():
         logger.error(f"Error fetching chat context: {e}")
         return JSONResponse(content={"context": ""})
 
+class ChatChannel:
+    """
+    One conversation's side of the chat socket. Frames of a conversation carry its conversation_id; clients that
+    don't send one get the original frames (raw text chunks, then {"done": true}).
+    """
+
+    def __init__(self, websocket: WebSocket, lock: asyncio.Lock, conversation_id: str = None):
+        self.websocket = websocket
+        self.lock = lock
+        self.conversation_id = conversation_id
+
+    async def text(self, content: str):
+        async with self.lock:
+            if self.conversation_id is None:
+                await self.websocket.send_text(content)
+            else:
+                await self.websocket.send_json({"conversation_id": self.conversation_id, "content": content})
+
+    async def event(self, payload: dict):
+        if self.conversation_id is not None:
+            payload = {"conversation_id": self.conversation_id, **payload}
+        async with self.lock:
+            await self.websocket.send_json(payload)
+
+async def _relevant_context(session_id: str, messages: list[dict]) -> str:
+    """The detections and hosts of the case most relevant to the latest question, ranked by the context index."""
+    if not messages or messages[-1].get("role") != "user" or CONTEXT_TOP_K <= 0:
+        return ""
+    try:
+        stats = await asyncio.to_thread(find_case_stats, session_id)
+        if not stats:
+            return ""
+        hits = await asyncio.to_thread(search_context, stats["session_id"], messages[-1].get("content", ""), CONTEXT_TOP_K)
+    except Exception as e:
+        logger.warning(f"Context retrieval failed: {e}")
+        return ""
+    if not hits:
+        return ""
+    return (
+        f"Detections and hosts of case '{stats.get('case_name')}' most relevant to the next question "
+        f"(precomputed, no search needed for these):\n{format_context(hits)}"
+    )
+
+def _seconds(started: float) -> float:
+    return round(time.perf_counter() - started, 4)
+
+async def _chat_turn(channel: ChatChannel, data: dict):
+    started = time.perf_counter()
+    # Sent with the final frame: where the turn's time went, per agent round
+    timings = {"rounds": []}
+    messages = data.get("messages", [])
+    model = data.get("model", "")
+    if not model:
+        try:
+            model = await model_manager.default_model()
+        except Exception:
+            pass
+        if not model:
+            await channel.event({"error": "No model selected and none available", "done": True})
+            return
+    keep_alive = model_manager.touch(model)
+
+    if not any(m.get("role") == "system" for m in messages):
+        messages.insert(0, {
+            "role": "system",
+            "content": (
+                "Respond ONLY in English. Never use any other language.\n"
+                "You are EVTXorcist's Splunk analyst. You MUST search the data using tools before answering. NEVER guess or hallucinate answers based on CTF knowledge.\n"
+                "CRITICAL INSTRUCTION: You DO NOT know the answer to the user's question until you run a search. ALWAYS start your response with a tool call.\n"
+                "TO SEARCH, YOU MUST OUTPUT EXACTLY THIS SYNTAX AND NOTHING ELSE BEFORE IT:\n"
+                "search_splunk(search_query=\"your splunk query here\")\n"
+                "Do not describe the query, just output the tool call.\n\n"
+                "PERSISTENCE: If a search returns no results, DO NOT give up. Try at least 3 different approaches:\n"
+                "  1. Broaden filters (drop field constraints, use trailing wildcards such as keyword*)\n"
+                "  2. Try different EventIDs or fields (e.g. 4688 for processes, 4624 for logons, 11 for file creation)\n"
+                "  3. Search with wildcards: *keyword* in one field, within a case and time range\n"
+                "  4. Check what data exists: | stats count by sourcetype, | stats count by Event.System.Channel\n"
+                "Only conclude 'not found' after exhausting multiple search strategies.\n\n"
+                "CASES: Each uploaded EVTX file set is a 'case' stored in the 'source' field. "
+                "To list cases use search_splunk with search_query='index=main | stats count by source'. "
+                "To query a case: search_query='index=main source=\"CaseName\" ...'\n"
+                "CASE OVERVIEW: For counts by EventID, host, channel, account or hour, or a case's time range, call "
+                "get_case_stats(case=\"CaseName\") instead of running stats searches — it is precomputed at ingest and costs no search.\n"
+                "TIMELINE: For \"what happened on host X between T1 and T2\", call get_timeline(case=\"CaseName\", host=\"HOST\", "
+                "start=\"2024-05-01T10:00:00Z\", end=\"2024-05-01T11:00:00Z\") — it returns events and detections in time order.\n"
+                "SEARCH COST: search_splunk returns the query it actually ran (with 'rewrites'), and job.scanCount / job.runDuration. "
+                "Searches that would scan too many events are rejected with suggestions; narrow them rather than retrying the same query. "
+                "Counts by host, source or sourcetype are cheap (they run as tstats).\n"
+                "IMPORTANT: The 'source' field is ONLY for the CaseName/upload. Do NOT use it for endpoint hostnames. "
+                "For endpoint hostnames (like 'Client02'), use the 'Computer' or 'Event.System.Computer' field AND ALWAYS wrap the hostname in wildcards (e.g., Computer=\"*Client02*\") to catch full domains like Client02.Main.local.\n\n"
+                "SEARCH PRIORITY: Always query chainsaw (sourcetype=chainsaw) FIRST — it contains pre-processed Sigma detections "
+                "with rule names, severity, and enriched fields. Only search raw EVTX (sourcetype=_json) if chainsaw doesn't have what you need.\n\n"
+                "DATA FORMAT & FIELDS:\n"
+                "- sourcetype=chainsaw (Sigma alerts): contains fields like name, level, tags, document.data.Event.*\n"
+                "- sourcetype=_json (raw EVTX): contains Windows event data. Example fields: 'Event.System.EventID', "
+                "'Event.System.Computer' (use this for hostnames, e.g., DC01.Main.local), 'Event.System.Channel', "
+                "'Event.EventData.Payload', 'Event.EventData.CommandLine' etc.\n"
+                "Example raw EVTX search: search_query='index=main sourcetype=_json Event.System.Computer=\"Client02\" Event.System.EventID=4103 Event.EventData.Payload=\"*Invoke-Expression*\"'\n\n"
+                "SPL: index=main sourcetype=chainsaw | index=main sourcetype=chainsaw level=critical | stats count by name\n\n"
+                "Rules: English only. Present results as tables/bullets. Never fabricate data."
+            )
+        })
+
+    system_msgs = [m for m in messages if m.get("role") == "system"]
+    other_msgs = [m for m in messages if m.get("role") != "system"]
+    messages = system_msgs + other_msgs[-10:]
+
+    step = time.perf_counter()
+    relevant = await _relevant_context(data.get("session_id"), messages)
+    timings["context_seconds"] = _seconds(step)
+    if relevant:
+        messages.insert(len(messages) - 1, {"role": "system", "content": relevant})
+
+    runner = None
+    try:
+        from ollama import AsyncClient, ResponseError
+
+        step = time.perf_counter()
+        mcp_tools = await get_mcp_tools()
+        timings["tools_list_seconds"] = _seconds(step)
+        ollama_tools = format_tools_for_ollama(mcp_tools)
+        tool_names = [t["function"]["name"] for t in mcp_tools]
+        for t in mcp_tools:
+            logger.debug(f"Loaded tool: {t['function']['name']}")
+
+        ollama_client = AsyncClient(host=OLLAMA_HOST)
+
+        MAX_ROUNDS = 5
+        supports_tools = True
+
+        for round_num in range(MAX_ROUNDS):
+            tool_calls = []
+            collected_content = ""
+            round_started = time.perf_counter()
+            first_token = None
+            # Tool calls complete before the end of the stream start right away
+            runner = SpeculativeToolRunner(tool_names, call_mcp_tool)
+
+            # For the initial round, strongly remind smaller models at the very end of context
+            if round_num == 0 and messages and messages[-1]["role"] == "user":
+                messages[-1]["content"] += "\n\n[SYSTEM DIRECTIVE: You do not know the answer. You MUST begin your response by outputting `search_splunk(search_query=\"...\")` to query the Splunk database.]"
+
+            chat_kwargs = {
+                "model": model,
+                "messages": messages,
+                "stream": True,
+                "options": {"temperature": 0, "num_predict": 1024, "num_ctx": 4096},
+                "keep_alive": keep_alive,
+            }
+            if supports_tools and ollama_tools:
+                chat_kwargs["tools"] = ollama_tools
+            prompt_chars = sum(len(m.get("content", "")) for m in messages)
+
+            try:
+                stream = await ollama_client.chat(**chat_kwargs)
+                async for chunk in stream:
+                    msg = chunk.get("message", {})
+                    if first_token is None and (msg.get("content") or msg.get("tool_calls")):
+                        first_token = _seconds(round_started)
+
+                    if msg.get("tool_calls"):
+                        for tc in msg["tool_calls"]:
+                            fn = tc.get("function", {})
+                            tool_calls.append({
+                                "function": {
+                                    "name": fn.get("name", ""),
+                                    "arguments": fn.get("arguments", {})
+                                }
+                            })
+                            runner.dispatch(tool_calls[-1])
+
+                    content = msg.get("content", "")
+                    if content:
+                        collected_content += content
+                        runner.feed(content)
+                        await channel.text(content)
+
+            except (ResponseError, Exception) as e:
+                err_str = str(e).lower()
+                if supports_tools and ("does not support tools" in err_str or "400" in err_str):
+                    logger.warning(f"Model '{model}' doesn't support tools. Retrying without.")
+                    supports_tools = False
+                    chat_kwargs.pop("tools", None)
+                    stream = await ollama_client.chat(**chat_kwargs)
+                    async for chunk in stream:
+                        content = chunk.get("message", {}).get("content", "")
+                        if content and first_token is None:
+                            first_token = _seconds(round_started)
+                        if content:
+                            collected_content += content
+                            runner.feed(content)
+                            await channel.text(content)
+                else:
+                    raise
+
+            model_seconds = _seconds(round_started)
+
+            # Fallbacks
+            step = time.perf_counter()
+            if not tool_calls and collected_content:
+                tool_calls = detect_tool_calls(collected_content)
+            round_timing = {
+                "prompt_chars": prompt_chars,
+                "first_token_seconds": first_token,
+                "model_seconds": model_seconds,
+                "parse_seconds": round(runner.scan_seconds + time.perf_counter() - step, 4),
+                "tool_calls": len(tool_calls),
+                "tool_seconds": 0.0,
+            }
+            timings["rounds"].append(round_timing)
+
+            if not tool_calls:
+                runner.discard()
+                break
+
+            step = time.perf_counter()
+            all_results = []
+            for tc in tool_calls:
+                fn = tc.get("function", {})
+                tool_name = fn.get("name", "")
+                tool_args = fn.get("arguments", {})
+                logger.info(f"[Round {round_num+1}] Executing tool `{tool_name}` with args {tool_args}")
+                args_display = tool_args.get("search_query", json.dumps(tool_args, default=str))
+                await channel.text(f"\n\n_`{tool_name}` → `{args_display}`_\n\n")
+
+                try:
+                    result_text = await runner.result(tc)
+                    logger.info(f"Tool `{tool_name}` returned {len(result_text)} chars")
+                except Exception as e:
+                    logger.error(f"Tool execution failed: {e}")
+                    result_text = f"Error executing tool: {e}"
+                all_results.append(f"[{tool_name}({tool_args})]\n{result_text}")
+            runner.discard()
+            round_timing["tool_seconds"] = _seconds(step)
+
+            combined = "\n\n---\n\n".join(all_results)
+            messages.append({"role": "assistant", "content": collected_content})
+            messages.append({
+                "role": "user",
+                "content": f"[TOOL RESULTS — {len(all_results)} queries executed]\n{combined}\n\n"
+                           f"[Analyze ALL results above. If data answers the user's question, present it clearly. "
+                           f"If not, try different search approaches. Round {round_num+1} of {MAX_ROUNDS}.]"
+            })
+            collected_content = ""
+
+        timings["total_seconds"] = _seconds(started)
+        await channel.event({"done": True, "timings": timings})
+
+    except Exception as e:
+        logger.error(f"Chat error: {e}", exc_info=True)
+        await channel.event({"error": str(e), "done": True})
+    finally:
+        # A cancelled turn must not leave speculative MCP calls (and their Splunk jobs) running
+        if runner is not None:
+            runner.discard()
+
+
+async def _run_turn(channel: ChatChannel, data: dict):
+    try:
+        await _chat_turn(channel, data)
+    except asyncio.CancelledError:
+        logger.info(f"Chat turn cancelled (conversation {channel.conversation_id or 'legacy'})")
+        try:
+            await channel.event({"done": True, "cancelled": True})
+        except Exception:
+            pass
+        raise
+
 @router.websocket("/ws/chat")
 async def websocket_chat(websocket: WebSocket):
+    """
+    Client frames: {"type": "chat", "conversation_id", "messages", "model"} starts a turn and
+    {"type": "cancel", "conversation_id"} stops it, aborting the Ollama stream and in-flight MCP / Splunk calls.
+    Turns of different conversations run side by side; a new turn replaces a running one of the same conversation.
+    The {"done": true} frame of a completed turn carries its timings: context and tool listing, then per round the
+    prompt size, time to first token, model, tool-call parsing and tool time.
+    """
     await websocket.accept()
+    send_lock = asyncio.Lock()
+    turns = {}
     try:
         while True:
             data = await websocket.receive_json()
-            messages = data.get("messages", [])
-            model = data.get("model", "")
-            if not model:
-                try:
-                    async with httpx.AsyncClient(timeout=5.0) as c:
-                        r = await c.get(f"{OLLAMA_BASE}/api/tags")
-                        model = r.json().get("models", [{}])[0].get("name", "")
-                except Exception:
-                    pass
-                if not model:
-                    await websocket.send_json({"error": "No model selected and none available", "done": True})
-                    continue
-            
-            if not any(m.get("role") == "system" for m in messages):
-                messages.insert(0, {
-                    "role": "system",
-                    "content": (
-                        "Respond ONLY in English. Never use any other language.\n"
-                        "You are EVTXorcist's Splunk analyst. You MUST search the data using tools before answering. NEVER guess or hallucinate answers based on CTF knowledge.\n"
-                        "CRITICAL INSTRUCTION: You DO NOT know the answer to the user's question until you run a search. ALWAYS start your response with a tool call.\n"
-                        "TO SEARCH, YOU MUST OUTPUT EXACTLY THIS SYNTAX AND NOTHING ELSE BEFORE IT:\n"
-                        "search_splunk(search_query=\"your splunk query here\")\n"
-                        "Do not describe the query, just output the tool call.\n\n"
-                        "PERSISTENCE: If a search returns no results, DO NOT give up. Try at least 3 different approaches:\n"
-                        "  1. Broaden filters (remove sourcetype/source constraints, use wildcards)\n"
-                        "  2. Try different EventIDs or fields (e.g. 4688 for processes, 4624 for logons, 11 for file creation)\n"
-                        "  3. Search with wildcards: *keyword* in any field\n"
-                        "  4. Check what data exists: | stats count by sourcetype, | stats count by Event.System.Channel\n"
-                        "Only conclude 'not found' after exhausting multiple search strategies.\n\n"
-                        "CASES: Each uploaded EVTX file set is a 'case' stored in the 'source' field. "
-                        "To list cases use search_splunk with search_query='index=main | stats count by source'. "
-                        "To query a case: search_query='index=main source=\"CaseName\" ...'\n"
-                        "IMPORTANT: The 'source' field is ONLY for the CaseName/upload. Do NOT use it for endpoint hostnames. "
-                        "For endpoint hostnames (like 'Client02'), use the 'Computer' or 'Event.System.Computer' field AND ALWAYS wrap the hostname in wildcards (e.g., Computer=\"*Client02*\") to catch full domains like Client02.Main.local.\n\n"
-                        "SEARCH PRIORITY: Always query chainsaw (sourcetype=chainsaw) FIRST — it contains pre-processed Sigma detections "
-                        "with rule names, severity, and enriched fields. Only search raw EVTX (sourcetype=_json) if chainsaw doesn't have what you need.\n\n"
-                        "DATA FORMAT & FIELDS:\n"
-                        "- sourcetype=chainsaw (Sigma alerts): contains fields like name, level, tags, document.data.Event.*\n"
-                        "- sourcetype=_json (raw EVTX): contains Windows event data. Example fields: 'Event.System.EventID', "
-                        "'Event.System.Computer' (use this for hostnames, e.g., DC01.Main.local), 'Event.System.Channel', "
-                        "'Event.EventData.Payload', 'Event.EventData.CommandLine' etc.\n"
-                        "Example raw EVTX search: search_query='index=main sourcetype=_json Event.System.Computer=\"Client02\" Event.System.EventID=4103 Event.EventData.Payload=\"*Invoke-Expression*\"'\n\n"
-                        "SPL: index=main sourcetype=chainsaw | index=main sourcetype=chainsaw level=critical | stats count by name\n\n"
-                        "Rules: English only. Present results as tables/bullets. Never fabricate data."
-                    )
-                })
-
-            system_msgs = [m for m in messages if m.get("role") == "system"]
-            other_msgs = [m for m in messages if m.get("role") != "system"]
-            messages = system_msgs + other_msgs[-10:]
-
-            try:
-                import re
-                from ollama import AsyncClient, ResponseError
-
-                mcp_tools = await get_mcp_tools()
-                ollama_tools = format_tools_for_ollama(mcp_tools)
-                for t in mcp_tools:
-                    logger.debug(f"Loaded tool: {t['function']['name']}")
-
-                ollama_client = AsyncClient(host=OLLAMA_HOST)
-
-                MAX_ROUNDS = 5
-                supports_tools = True
-
-                for round_num in range(MAX_ROUNDS):
-                    tool_calls = []
-                    collected_content = ""
-
-                    # For the initial round, strongly remind smaller models at the very end of context
-                    if round_num == 0 and messages and messages[-1]["role"] == "user":
-                        messages[-1]["content"] += "\n\n[SYSTEM DIRECTIVE: You do not know the answer. You MUST begin your response by outputting `search_splunk(search_query=\"...\")` to query the Splunk database.]"
-
-                    chat_kwargs = {
-                        "model": model,
-                        "messages": messages,
-                        "stream": True,
-                        "options": {"temperature": 0, "num_predict": 1024, "num_ctx": 4096},
-                    }
-                    if supports_tools and ollama_tools:
-                        chat_kwargs["tools"] = ollama_tools
-
-                    try:
-                        stream = await ollama_client.chat(**chat_kwargs)
-                        async for chunk in stream:
-                            msg = chunk.get("message", {})
-
-                            if msg.get("tool_calls"):
-                                for tc in msg["tool_calls"]:
-                                    fn = tc.get("function", {})
-                                    tool_calls.append({
-                                        "function": {
-                                            "name": fn.get("name", ""),
-                                            "arguments": fn.get("arguments", {})
-                                        }
-                                    })
-
-                            content = msg.get("content", "")
-                            if content:
-                                collected_content += content
-                                await websocket.send_text(content)
-
-                    except (ResponseError, Exception) as e:
-                        err_str = str(e).lower()
-                        if supports_tools and ("does not support tools" in err_str or "400" in err_str):
-                            logger.warning(f"Model '{model}' doesn't support tools. Retrying without.")
-                            supports_tools = False
-                            chat_kwargs.pop("tools", None)
-                            stream = await ollama_client.chat(**chat_kwargs)
-                            async for chunk in stream:
-                                content = chunk.get("message", {}).get("content", "")
-                                if content:
-                                    collected_content += content
-                                    await websocket.send_text(content)
-                        else:
-                            raise
-
-                    # Fallbacks
-                    if not tool_calls and collected_content:
-                        detected = False
-
-                        # Pattern 1: Any valid JSON block
-                        blocks = re.findall(r'```(?:json)?\n(.*?)\n```', collected_content, re.DOTALL)
-                        if not blocks:
-                            start = collected_content.find('{')
-                            end = collected_content.rfind('}')
-                            if start != -1 and end != -1 and end > start:
-                                blocks = [collected_content[start:end+1]]
-                        
-                        for block in blocks:
-                            try:
-                                data = json.loads(block)
-                                if isinstance(data, dict):
-                                    t_name = data.get("name") or data.get("tool")
-                                    t_args = data.get("arguments") or data.get("command")
-                                    if t_name and t_args:
-                                        if isinstance(t_args, str):
-                                            if "=" in t_args and "search_query=" in t_args:
-                                                match = re.search(r'search_query\s*=\s*(?:"((?:\\.|[^"\\])*)"|\'((?:\\.|[^\'\\])*)\')', t_args)
-                                                if match:
-                                                    val = match.group(1) if match.group(1) else match.group(2)
-                                                    t_args = {"search_query": val.replace('\\"', '"').replace("\\'", "'")}
-                                                else:
-                                                    t_args = {"search_query": t_args.replace('search_query=', '').strip('"\' ')}
-                                            else:
-                                                t_args = {"search_query": t_args}
-                                        if "query" in t_args and "search_query" not in t_args:
-                                            t_args["search_query"] = t_args.pop("query")
-                                        
-                                        # Only add if we haven't already parsed this exact block
-                                        tool_calls.append({"function": {"name": t_name, "arguments": t_args}})
-                                        logger.info(f"Detected JSON block tool call: {t_name}({t_args})")
-                                        detected = True
-                            except json.JSONDecodeError:
-                                pass
-
-                        # Pattern 2
-                        if not detected:
-                            func_pattern = re.findall(
-                                r'(\w+)\(\s*((?:\w+\s*=\s*(?:"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')(?:\s*,\s*)?)+)\s*\)',
-                                collected_content
-                            )
-                            for func_name, args_str in func_pattern:
-                                kv_pairs = re.findall(r'(\w+)\s*=\s*(?:"((?:\\.|[^"\\])*)"|\'((?:\\.|[^\'\\])*)\')', args_str)
-                                if kv_pairs:
-                                    parsed_args = {}
-                                    for k, v1, v2 in kv_pairs:
-                                        val = v1 if v1 else v2
-                                        val = val.replace('\\"', '"').replace("\\'", "'")
-                                        parsed_args[k] = val
-                                    if "query" in parsed_args and "search_query" not in parsed_args:
-                                        parsed_args["search_query"] = parsed_args.pop("query")
-                                    tool_calls.append({"function": {"name": func_name, "arguments": parsed_args}})
-                                    logger.info(f"Detected function-call tool: {func_name}({parsed_args})")
-                                    detected = True
-
-                        # Pattern 3
-                        if not detected:
-                            clean_content = re.sub(r'```\w*\n?', '', collected_content)
-                            spl_matches = re.findall(
-                                r'(?:^|\n)\s*((?:search\s+)?index=\S+[^\n]*)',
-                                clean_content
-                            )
-                            if spl_matches:
-                                for spl_query in spl_matches:
-                                    spl_query = spl_query.strip()
-                                    if not spl_query.startswith('search '):
-                                        spl_query = 'search ' + spl_query
-                                    tool_calls.append({"function": {"name": "search_splunk", "arguments": {"search_query": spl_query}}})
-                                    logger.info(f"Detected bare SPL query: {spl_query}")
-
-                    if not tool_calls:
-                        break
-
-                    all_results = []
-                    for tc in tool_calls:
-                        fn = tc.get("function", {})
-                        tool_name = fn.get("name", "")
-                        tool_args = fn.get("arguments", {})
-                        logger.info(f"[Round {round_num+1}] Executing tool `{tool_name}` with args {tool_args}")
-                        args_display = tool_args.get("search_query", json.dumps(tool_args, default=str))
-                        await websocket.send_text(f"\n\n_`{tool_name}` → `{args_display}`_\n\n")
-
-                        try:
-                            result_text = await call_mcp_tool(tool_name, tool_args)
-                            logger.info(f"Tool `{tool_name}` returned {len(result_text)} chars")
-                        except Exception as e:
-                            logger.error(f"Tool execution failed: {e}")
-                            result_text = f"Error executing tool: {e}"
-                        all_results.append(f"[{tool_name}({tool_args})]\n{result_text}")
-
-                    combined = "\n\n---\n\n".join(all_results)
-                    messages.append({"role": "assistant", "content": collected_content})
-                    messages.append({
-                        "role": "user",
-                        "content": f"[TOOL RESULTS — {len(all_results)} queries executed]\n{combined}\n\n"
-                                   f"[Analyze ALL results above. If data answers the user's question, present it clearly. "
-                                   f"If not, try different search approaches. Round {round_num+1} of {MAX_ROUNDS}.]"
-                    })
-                    collected_content = ""
-
-                await websocket.send_json({"done": True})
-
-            except Exception as e:
-                logger.error(f"Chat error: {e}", exc_info=True)
-                await websocket.send_json({"error": str(e), "done": True})
+            conversation_id = data.get("conversation_id")
+            key = conversation_id or ""
+            running = turns.pop(key, None)
+            stopped = False
+            if running is not None and not running.done():
+                running.cancel()
+                # Let the old turn send its final frame before the new one starts
+                await asyncio.wait({running}, timeout=5)
+                stopped = running.cancelled()
+            channel = ChatChannel(websocket, send_lock, str(conversation_id) if conversation_id is not None else None)
+            if data.get("type") == "cancel":
+                if not stopped:
+                    # The turn had already ended; the client still waits for the confirmation
+                    await channel.event({"done": True, "cancelled": True})
+                continue
+            turns[key] = asyncio.create_task(_run_turn(channel, data))
+            for done_key in [k for k, task in turns.items() if task.done()]:
+                del turns[done_key]
 
     except WebSocketDisconnect:
         logger.info("Chat WebSocket disconnected")
+    finally:
+        for task in turns.values():
+            task.cancel()
@@ -1,9 +1,12 @@
 import os
 import json
+import asyncio
 import aiofiles
 from fastapi import APIRouter
 from fastapi.responses import JSONResponse, FileResponse
 from config import OUTPUT_DIR
+from services.results_index import load_results_index, query_detections
+from services.case_stats import load_case_stats, list_case_stats
 
 router = APIRouter()
 
@@ -16,6 +19,67 @@ async def get_results_api(session_id: str):
             return JSONResponse(content=json.loads(content))
     return JSONResponse(status_code=404, content={"error": "Results not found"})
 
+@router.get("/api/results/{session_id}/summary")
+async def get_results_summary(session_id: str):
+    index = await asyncio.to_thread(load_results_index, session_id)
+    if index is None:
+        return JSONResponse(status_code=404, content={"error": "Results not found"})
+    return JSONResponse(content={**index["meta"], "summary": index["summary"], "rules": index["rules"]})
+
+@router.get("/api/results/{session_id}/rules")
+async def get_results_rules(session_id: str):
+    index = await asyncio.to_thread(load_results_index, session_id)
+    if index is None:
+        return JSONResponse(status_code=404, content={"error": "Results not found"})
+    return JSONResponse(content={"rules": index["rules"]})
+
+@router.get("/api/results/{session_id}/hosts")
+async def get_results_hosts(session_id: str):
+    index = await asyncio.to_thread(load_results_index, session_id)
+    if index is None:
+        return JSONResponse(status_code=404, content={"error": "Results not found"})
+    return JSONResponse(content={"hosts": index["hosts"]})
+
+@router.get("/api/results/{session_id}/stats")
+async def get_results_stats(session_id: str):
+    stats = await asyncio.to_thread(load_case_stats, session_id)
+    if stats is None:
+        return JSONResponse(status_code=404, content={"error": "Stats not found"})
+    return JSONResponse(content=stats)
+
+@router.get("/api/cases")
+async def get_cases():
+    return JSONResponse(content={"cases": await asyncio.to_thread(list_case_stats)})
+
+@router.get("/api/results/{session_id}/detections")
+async def get_results_detections(
+    session_id: str,
+    rule: str = None,
+    level: str = None,
+    computer: str = None,
+    channel: str = None,
+    event_id: str = None,
+    start: str = None,
+    end: str = None,
+    q: str = None,
+    sort: str = "timestamp",
+    order: str = "desc",
+    offset: int = 0,
+    limit: int = 50,
+):
+    index = await asyncio.to_thread(load_results_index, session_id)
+    if index is None:
+        return JSONResponse(status_code=404, content={"error": "Results not found"})
+    # Filtering the rows and reading the selected detections both run off the event loop
+    page = await asyncio.to_thread(
+        query_detections,
+        session_id, index,
+        rule=rule, level=level, computer=computer, channel=channel, event_id=event_id,
+        start=start, end=end, q=q, sort=sort, order=order,
+        offset=max(offset, 0), limit=min(max(limit, 1), 500),
+    )
+    return JSONResponse(content=page)
+
 @router.get("/download/{zip_name}")
 async def download_zip(zip_name: str):
     zip_path = os.path.join(OUTPUT_DIR, zip_name)
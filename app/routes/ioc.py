@@ -0,0 +1,72 @@
+import os
+import time
+import asyncio
+import logging
+from fastapi import APIRouter, UploadFile, File, Form
+from fastapi.responses import JSONResponse
+
+from services.ioc import IOCMatcher, IOCListError, parse_iocs, sweep_case, merge_into_results
+from services.sinks import parse_destinations
+from services.splunk import push_chainsaw_to_splunk
+from services.pipeline import DEFAULT_SPLUNK_URL, DEFAULT_SPLUNK_TOKEN
+
+logger = logging.getLogger("evtx_uploader")
+
+router = APIRouter()
+
+@router.post("/api/ioc/sweep")
+async def sweep_stored_case(
+    session_id: str = Form(...),
+    iocs: UploadFile = File(...),
+    splunk_url: str = Form(None),
+    splunk_token: str = Form(None),
+):
+    """
+    Sweep an already ingested case (SQLite store or session JSON) with an IOC list. Hits replace the case's IOC
+    detections, the case is correlated again, and hits not seen before go to Splunk if the case was sent there.
+    """
+    if os.path.basename(session_id) != session_id:
+        return JSONResponse(status_code=400, content={"error": "Invalid session id"})
+
+    text = (await iocs.read()).decode("utf-8", errors="replace")
+    try:
+        entries = parse_iocs(text)
+    except IOCListError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    if not entries:
+        return JSONResponse(status_code=400, content={"error": "IOC list is empty"})
+
+    started = time.perf_counter()
+    matcher = await asyncio.to_thread(IOCMatcher, entries)
+    swept = await asyncio.to_thread(sweep_case, session_id, matcher)
+    if swept is None:
+        return JSONResponse(status_code=404, content={"error": "No stored events for this session"})
+    detections, scanned = swept
+    summary = matcher.summary()
+    merged = await asyncio.to_thread(merge_into_results, session_id, detections, summary)
+    logger.info(f"IOC sweep of {session_id}: {summary['hits']} hit(s) in {scanned} record(s)")
+
+    incidents = None
+    pushed = 0
+    if merged is not None:
+        results, new = merged
+        incidents = len(results["incidents"])
+        try:
+            destinations = parse_destinations(results.get("destination", ""))
+        except ValueError:
+            destinations = []
+        if "splunk" in destinations and new:
+            if await push_chainsaw_to_splunk(new, splunk_url or DEFAULT_SPLUNK_URL, splunk_token or DEFAULT_SPLUNK_TOKEN,
+                                             results.get("index") or "main", source=results.get("case_name", "evtxorcist")):
+                pushed = len(new)
+
+    return JSONResponse(content={
+        "session_id": session_id,
+        "records_scanned": scanned,
+        "merged_into_results": merged is not None,
+        "incidents": incidents,
+        "pushed_to_splunk": pushed,
+        "iocs": summary,
+        "detections": detections,
+        "took_ms": round((time.perf_counter() - started) * 1000, 2),
+    })
@@ -0,0 +1,254 @@
+import os
+import time
+import uuid
+import shutil
+import asyncio
+import hashlib
+import logging
+import aiofiles
+from fastapi import APIRouter, Request, Form, UploadFile, File
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from config import RESUMABLE_CHUNK_SIZE, RESUMABLE_MAX_CHUNK_SIZE, RESUMABLE_TTL
+from services.archive import is_archive
+from services.pipeline import IngestSession
+from services.profiles import INGEST_PROFILES
+from services.filters import FilterSyntaxError
+from services.correlation import CorrelationRuleError
+from routes.upload import upload_progress
+
+logger = logging.getLogger("evtx_uploader")
+
+router = APIRouter()
+
+class FinalizeRequest(BaseModel):
+    size: int
+
+class ResumableUpload:
+    """Server-side state of one resumable upload: its ingest session, per-file locks and processing tasks."""
+
+    def __init__(self, upload_id: str, client_id: str, session: IngestSession):
+        self.upload_id = upload_id
+        self.client_id = client_id
+        self.session = session
+        self.created = time.time()
+        # Expiry counts from the last chunk or finalize, so a slow upload still sending isn't discarded
+        self.last_activity = self.created
+        self.locks = {}
+        self.tasks = {}
+
+    def touch(self):
+        self.last_activity = time.time()
+
+    def lock(self, filename: str) -> asyncio.Lock:
+        if filename not in self.locks:
+            self.locks[filename] = asyncio.Lock()
+        return self.locks[filename]
+
+    def part_path(self, filename: str) -> str:
+        # Chunks are staged as *.part so Chainsaw never picks up an incomplete file
+        return os.path.join(self.session.evtx_dir, filename + ".part")
+
+    def offset(self, filename: str) -> int:
+        try:
+            return os.path.getsize(self.part_path(filename))
+        except OSError:
+            return 0
+
+# Seconds between sweeps for abandoned uploads
+PURGE_INTERVAL = min(RESUMABLE_TTL, 600)
+
+# Active resumable uploads by upload ID
+resumable_uploads: dict[str, ResumableUpload] = {}
+
+def _purge_expired():
+    now = time.time()
+    for upload_id, upload in list(resumable_uploads.items()):
+        if now - upload.last_activity > RESUMABLE_TTL and not upload.tasks:
+            logger.info(f"Discarding abandoned resumable upload {upload_id}")
+            shutil.rmtree(upload.session.evtx_dir, ignore_errors=True)
+            shutil.rmtree(upload.session.session_folder, ignore_errors=True)
+            resumable_uploads.pop(upload_id, None)
+
+async def purge_expired_uploads():
+    """Reclaim abandoned uploads periodically, so an idle server doesn't keep their files until the next create."""
+    while True:
+        await asyncio.sleep(PURGE_INTERVAL)
+        try:
+            _purge_expired()
+        except Exception as e:
+            logger.error(f"Failed to purge expired resumable uploads: {e}")
+
+def _safe_filename(filename: str) -> str | None:
+    name = os.path.basename(filename.replace("\\", "/"))
+    if not name or name in (".", "..") or name.endswith(".part"):
+        return None
+    return name
+
+def _get_upload(upload_id: str):
+    upload = resumable_uploads.get(upload_id)
+    if upload is None:
+        return None, JSONResponse(status_code=404, content={"error": "Unknown or expired upload"})
+    return upload, None
+
+@router.post("/upload/resumable")
+async def create_resumable_upload(
+    client_id: str = Form("default-client"),
+    case_name: str = Form("Untitled Case"),
+    index: str = Form("evtx_index"),
+    destination: str = Form("elasticsearch"),
+    splunk_url: str = Form(None),
+    splunk_token: str = Form(None),
+    es_host: str = Form("elasticsearch"),
+    es_port: int = Form(9200),
+    es_index: str = Form(None),
+    total_files: int = Form(0),
+    incremental: bool = Form(False),
+    profile: str = Form(None),
+    filters: str = Form(None),
+    sequences: str = Form(None),
+    iocs: UploadFile = File(None),
+):
+    _purge_expired()
+    if profile and profile not in INGEST_PROFILES:
+        return JSONResponse(status_code=400, content={"error": f"Unknown ingest profile: {profile}"})
+
+    ioc_text = (await iocs.read()).decode("utf-8", errors="replace") if iocs else None
+    upload_progress[client_id] = {"status": "parsing", "completed": 0, "total": total_files}
+    try:
+        session = IngestSession(
+            case_name=case_name,
+            destination=destination,
+            index=index,
+            splunk_url=splunk_url,
+            splunk_token=splunk_token,
+            es_host=es_host,
+            es_port=es_port,
+            es_index=es_index,
+            progress=upload_progress[client_id],
+            incremental=incremental,
+            profile=profile,
+            filters=filters,
+            iocs=ioc_text,
+            sequences=sequences,
+        )
+    except FilterSyntaxError as e:
+        upload_progress.pop(client_id, None)
+        return JSONResponse(status_code=400, content={"error": f"Invalid filter rules: {e}"})
+    except CorrelationRuleError as e:
+        upload_progress.pop(client_id, None)
+        return JSONResponse(status_code=400, content={"error": f"Invalid correlation sequences: {e}"})
+    except ValueError as e:
+        upload_progress.pop(client_id, None)
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    upload_id = uuid.uuid4().hex
+    resumable_uploads[upload_id] = ResumableUpload(upload_id, client_id, session)
+    logger.info(f"Resumable upload {upload_id} created for session {session.session_id}")
+    return {"upload_id": upload_id, "session_id": session.session_id, "chunk_size": RESUMABLE_CHUNK_SIZE}
+
+@router.get("/upload/resumable/{upload_id}/files/{filename}")
+async def get_resumable_file(upload_id: str, filename: str):
+    upload, error = _get_upload(upload_id)
+    if error:
+        return error
+    name = _safe_filename(filename)
+    if name is None:
+        return JSONResponse(status_code=400, content={"error": "Invalid filename"})
+    return {"filename": name, "offset": upload.offset(name), "finalized": name in upload.tasks}
+
+@router.put("/upload/resumable/{upload_id}/files/{filename}")
+async def put_resumable_chunk(upload_id: str, filename: str, offset: int, request: Request):
+    upload, error = _get_upload(upload_id)
+    if error:
+        return error
+    name = _safe_filename(filename)
+    if name is None:
+        return JSONResponse(status_code=400, content={"error": "Invalid filename"})
+    if name in upload.tasks:
+        return JSONResponse(status_code=409, content={"error": "File already finalized"})
+
+    upload.touch()
+    too_large = JSONResponse(status_code=413, content={"error": f"Chunk larger than {RESUMABLE_MAX_CHUNK_SIZE} bytes"})
+    declared = request.headers.get("Content-Length", "")
+    if declared.isdigit() and int(declared) > RESUMABLE_MAX_CHUNK_SIZE:
+        return too_large
+    # Read as it arrives and stop at the limit, so an oversized chunk never sits in memory whole
+    chunk = bytearray()
+    async for block in request.stream():
+        chunk += block
+        if len(chunk) > RESUMABLE_MAX_CHUNK_SIZE:
+            return too_large
+
+    expected = request.headers.get("X-Chunk-SHA256")
+    if expected and hashlib.sha256(chunk).hexdigest() != expected.lower():
+        return JSONResponse(status_code=422, content={"error": "Chunk checksum mismatch", "offset": upload.offset(name)})
+
+    upload.touch()
+    async with upload.lock(name):
+        current = upload.offset(name)
+        if offset != current:
+            # The client resumes from the offset we actually hold
+            return JSONResponse(status_code=409, content={"error": "Offset mismatch", "offset": current})
+        async with aiofiles.open(upload.part_path(name), "ab") as f:
+            await f.write(chunk)
+        return {"filename": name, "offset": current + len(chunk)}
+
+@router.post("/upload/resumable/{upload_id}/files/{filename}/finalize")
+async def finalize_resumable_file(upload_id: str, filename: str, req: FinalizeRequest):
+    upload, error = _get_upload(upload_id)
+    if error:
+        return error
+    name = _safe_filename(filename)
+    if name is None:
+        return JSONResponse(status_code=400, content={"error": "Invalid filename"})
+
+    upload.touch()
+    async with upload.lock(name):
+        if name in upload.tasks:
+            return {"filename": name, "status": "processing"}
+        current = upload.offset(name)
+        if current != req.size:
+            return JSONResponse(status_code=409, content={"error": "Size mismatch", "offset": current})
+
+        session = upload.session
+        part_path = upload.part_path(name)
+        if not os.path.exists(part_path):
+            # Empty files never receive a chunk
+            open(part_path, "wb").close()
+
+        if is_archive(name):
+            async def process_archive():
+                try:
+                    with open(part_path, "rb") as f:
+                        return await session.process_archive(f, name)
+                finally:
+                    os.remove(part_path)
+            task = asyncio.create_task(process_archive())
+        elif name.lower().endswith(".evtx"):
+            path = session.evtx_path(name)
+            os.replace(part_path, path)
+            task = asyncio.create_task(session.process_evtx(os.path.basename(path), path))
+        else:
+            logger.info(f"Skipping non-EVTX file: {name}")
+            os.remove(part_path)
+            session.progress["completed"] += 1
+            task = asyncio.create_task(asyncio.sleep(0))
+
+        # Processing starts now, while the client keeps uploading the remaining files
+        upload.tasks[name] = task
+    return {"filename": name, "status": "processing"}
+
+@router.post("/upload/resumable/{upload_id}/complete")
+async def complete_resumable_upload(upload_id: str):
+    upload, error = _get_upload(upload_id)
+    if error:
+        return error
+
+    await asyncio.gather(*upload.tasks.values())
+    resumable_uploads.pop(upload_id, None)
+
+    response_data = await upload.session.finalize()
+    if response_data is None:
+        return JSONResponse(status_code=400, content={"error": "No .evtx files found in upload"})
+    return JSONResponse(content=response_data)
@@ -0,0 +1,56 @@
+import os
+import time
+import asyncio
+from fastapi import APIRouter, Query
+from fastapi.responses import JSONResponse
+
+from services.event_store import search, parse_time
+
+router = APIRouter()
+
+@router.get("/api/search")
+async def search_events(
+    session_id: str,
+    q: str = None,
+    event_id: int = None,
+    computer: str = None,
+    channel: str = None,
+    provider: str = None,
+    level: int = None,
+    field: list[str] = Query(None, description="Record field filter as path=value, e.g. EventData.TargetUserName=admin"),
+    start: str = None,
+    end: str = None,
+    agg: list[str] = Query(None, description="event_id, computer, channel, provider, level, hour or day"),
+    top: int = 10,
+    sort: str = "ts",
+    order: str = "asc",
+    offset: int = 0,
+    limit: int = 50,
+):
+    """Search the events of a session ingested with the "sqlite" destination."""
+    if os.path.basename(session_id) != session_id:
+        return JSONResponse(status_code=400, content={"error": "Invalid session id"})
+
+    filters = {k: v for k, v in {"event_id": event_id, "computer": computer, "channel": channel,
+                                 "provider": provider, "level": level}.items() if v is not None}
+    fields = {}
+    for item in field or []:
+        path, sep, value = item.partition("=")
+        if not sep:
+            return JSONResponse(status_code=400, content={"error": f"Field filter must be path=value: {item}"})
+        fields[path.strip()] = value
+
+    started = time.perf_counter()
+    try:
+        result = await asyncio.to_thread(
+            search, session_id,
+            q=q, filters=filters, fields=fields, start=parse_time(start), end=parse_time(end),
+            aggregate=agg, top=min(max(top, 1), 100), sort=sort, order=order,
+            offset=max(offset, 0), limit=min(max(limit, 1), 500),
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    if result is None:
+        return JSONResponse(status_code=404, content={"error": "No event store for this session"})
+    result["took_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return JSONResponse(content=result)
@@ -0,0 +1,41 @@
+import os
+from itertools import islice
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from services.event_store import parse_time
+from services.timeline import build_timeline, format_csv, format_ndjson
+
+router = APIRouter()
+
+@router.get("/api/timeline/{session_id}")
+async def get_timeline(
+    session_id: str,
+    format: str = "ndjson",
+    host: str = None,
+    start: str = None,
+    end: str = None,
+    events: bool = True,
+    detections: bool = True,
+    limit: int = None,
+):
+    """Super-timeline of a session: every file's records and the detections, merged by event time."""
+    if os.path.basename(session_id) != session_id:
+        return JSONResponse(status_code=400, content={"error": "Invalid session id"})
+    if format not in ("ndjson", "csv"):
+        return JSONResponse(status_code=400, content={"error": "format must be ndjson or csv"})
+    try:
+        start_ts, end_ts = parse_time(start), parse_time(end)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": f"Invalid time: {e}"})
+
+    rows = build_timeline(session_id, host=host, start=start_ts, end=end_ts, events=events, detections=detections)
+    if rows is None:
+        return JSONResponse(status_code=404, content={"error": "No timeline for this session"})
+    if limit is not None:
+        rows = islice(rows, max(limit, 0))
+
+    if format == "csv":
+        return StreamingResponse(format_csv(rows), media_type="text/csv",
+                                 headers={"Content-Disposition": f'attachment; filename="timeline_{session_id}.csv"'})
+    return StreamingResponse(format_ndjson(rows), media_type="application/x-ndjson")
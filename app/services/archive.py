@@ -0,0 +1,99 @@
+import os
+import zlib
+import tarfile
+import zipfile
+import logging
+
+from config import ARCHIVE_MAX_MEMBERS, ARCHIVE_MAX_TOTAL_BYTES, ARCHIVE_MAX_RATIO
+from utils import unique_name
+
+logger = logging.getLogger("evtx_uploader")
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar.gz", ".tgz")
+COPY_BLOCK_SIZE = 1024 * 1024
+# Small members are exempt from the ratio check: sparse EVTX chunks legitimately compress very well
+RATIO_CHECK_MIN_BYTES = 16 * 1024 * 1024
+
+class ArchiveLimitError(ValueError):
+    """Raised when an archive exceeds the configured zip-bomb limits."""
+
+# Everything a bad archive raises while it is read: limits, bad headers, and truncated or corrupt gzip/deflate streams
+ARCHIVE_ERRORS = (ArchiveLimitError, zipfile.BadZipFile, tarfile.TarError, EOFError, zlib.error, OSError)
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+def _iter_zip_members(fileobj):
+    with zipfile.ZipFile(fileobj) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(".evtx"):
+                continue
+            with zf.open(info) as stream:
+                yield info.filename, info.compress_size, stream
+
+def _iter_tar_members(fileobj):
+    # Stream mode ("r|gz") reads the archive strictly forward, so nothing has to be buffered or seeked
+    with tarfile.open(fileobj=fileobj, mode="r|gz") as tf:
+        for member in tf:
+            if not member.isfile() or not member.name.lower().endswith(".evtx"):
+                continue
+            stream = tf.extractfile(member)
+            if stream is None:
+                continue
+            with stream:
+                yield member.name, None, stream
+
+def iter_evtx_members(fileobj, filename: str):
+    """Yield (member_name, compressed_size, stream) for every .evtx member of a ZIP or tar.gz archive."""
+    if filename.lower().endswith(".zip"):
+        return _iter_zip_members(fileobj)
+    return _iter_tar_members(fileobj)
+
+def extract_evtx_members(fileobj, filename: str, dest_dir: str, used_names: set = None):
+    """
+    Stream the .evtx members of an archive into dest_dir, enforcing zip-bomb limits on the bytes actually
+    decompressed rather than on the sizes claimed by the archive headers. Other members are never written.
+    Yields (filename, path) as each member is complete, so it can be parsed while the next one inflates.
+    On an error the partially written member is removed; members already yielded belong to the caller.
+    """
+    used_names = used_names if used_names is not None else set()
+    count = 0
+    total_bytes = 0
+    compressed_start = fileobj.tell() if fileobj.seekable() else 0
+    out_path = None
+
+    try:
+        for member_name, compress_size, stream in iter_evtx_members(fileobj, filename):
+            if count >= ARCHIVE_MAX_MEMBERS:
+                raise ArchiveLimitError(f"{filename}: more than {ARCHIVE_MAX_MEMBERS} EVTX members")
+
+            out_name = unique_name(os.path.basename(member_name), used_names)
+            out_path = os.path.join(dest_dir, out_name)
+            member_bytes = 0
+
+            with open(out_path, "wb") as out:
+                while True:
+                    block = stream.read(COPY_BLOCK_SIZE)
+                    if not block:
+                        break
+                    member_bytes += len(block)
+                    total_bytes += len(block)
+                    if total_bytes > ARCHIVE_MAX_TOTAL_BYTES:
+                        raise ArchiveLimitError(f"{filename}: uncompressed size exceeds {ARCHIVE_MAX_TOTAL_BYTES} bytes")
+                    # ZIP members carry their own compressed size; tar.gz is measured against the whole stream read so far
+                    if compress_size is not None:
+                        inflated, compressed = member_bytes, compress_size
+                    else:
+                        inflated, compressed = total_bytes, fileobj.tell() - compressed_start
+                    if inflated > RATIO_CHECK_MIN_BYTES and inflated > compressed * ARCHIVE_MAX_RATIO:
+                        raise ArchiveLimitError(f"{filename}: compression ratio of {member_name} exceeds {ARCHIVE_MAX_RATIO}")
+                    out.write(block)
+
+            logger.info(f"Extracted {member_name} from {filename} ({member_bytes} bytes)")
+            count += 1
+            path, out_path = out_path, None
+            yield out_name, path
+    except ARCHIVE_ERRORS:
+        if out_path is not None and os.path.exists(out_path):
+            os.remove(out_path)
+        raise
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import Counter
+
+from config import CASE_STATS_DIR
+from services.evtx_parser import system_value, record_value
+
+logger = logging.getLogger("evtx_uploader")
+
+STATS_FILENAME = "case_stats.json"
+# EventData fields that name an account, in the order they are looked up
+USER_FIELDS = ("TargetUserName", "SubjectUserName", "User", "AccountName")
+EMPTY_USERS = {"", "-", "N/A"}
+TOP_N = 50
+
+class CaseStats:
+    """
+    Counters over every unique record of a session, filled by the parse workers while the records are
+    still in memory: EventIDs, hosts, channels, providers, users, first/last timestamps and hourly volume.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = 0
+        self.event_ids = Counter()
+        self.hosts = Counter()
+        self.channels = Counter()
+        self.providers = Counter()
+        self.users = Counter()
+        self.hours = Counter()
+        self.first_seen = None
+        self.last_seen = None
+
+    def update(self, records: list[dict]):
+        event_ids, hosts, channels, providers, users, hours = Counter(), Counter(), Counter(), Counter(), Counter(), Counter()
+        first = last = None
+        for record in records:
+            event_ids[str(system_value(record, "EventID"))] += 1
+            hosts[system_value(record, "Computer") or ""] += 1
+            channels[system_value(record, "Channel") or ""] += 1
+            providers[system_value(record, "Provider.Name") or ""] += 1
+            for field in USER_FIELDS:
+                user = record_value(record, f"Event.EventData.{field}")
+                if isinstance(user, str) and user not in EMPTY_USERS:
+                    users[user] += 1
+                    break
+            # SystemTime is ISO-8601 UTC, so string order is time order and the first 13 chars are the hour
+            ts = system_value(record, "TimeCreated.SystemTime")
+            if ts:
+                ts = str(ts)
+                hours[ts[:13]] += 1
+                if first is None or ts < first:
+                    first = ts
+                if last is None or ts > last:
+                    last = ts
+
+        with self.lock:
+            self.records += len(records)
+            self.event_ids.update(event_ids)
+            self.hosts.update(hosts)
+            self.channels.update(channels)
+            self.providers.update(providers)
+            self.users.update(users)
+            self.hours.update(hours)
+            if first and (self.first_seen is None or first < self.first_seen):
+                self.first_seen = first
+            if last and (self.last_seen is None or last > self.last_seen):
+                self.last_seen = last
+
+    def to_dict(self) -> dict:
+        def top(counter: Counter, key: str) -> list[dict]:
+            return [{key: k, "count": c} for k, c in counter.most_common(TOP_N)]
+
+        return {
+            "records": self.records,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "event_ids": top(self.event_ids, "event_id"),
+            "hosts": top(self.hosts, "host"),
+            "channels": top(self.channels, "channel"),
+            "providers": top(self.providers, "provider"),
+            "users": top(self.users, "user"),
+            "distinct": {
+                "event_ids": len(self.event_ids),
+                "hosts": len(self.hosts),
+                "channels": len(self.channels),
+                "users": len(self.users),
+            },
+            "hourly": [{"hour": f"{h}:00:00Z", "count": c} for h, c in sorted(self.hours.items())],
+        }
+
+def save_case_stats(session_id: str, session_folder: str, stats: dict):
+    """Write the stats next to results.json and to CASE_STATS_DIR, which outlives the session cleanup."""
+    payload = json.dumps(stats, indent=2)
+    for path in (os.path.join(session_folder, STATS_FILENAME), os.path.join(CASE_STATS_DIR, f"{session_id}.json")):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+def load_case_stats(session_id: str) -> dict | None:
+    if os.path.basename(session_id) != session_id:
+        return None
+    path = os.path.join(CASE_STATS_DIR, f"{session_id}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+def list_case_stats() -> list[dict]:
+    """One line per stored session, newest first."""
+    cases = []
+    for name in os.listdir(CASE_STATS_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(CASE_STATS_DIR, name), "r") as f:
+                stats = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        cases.append({k: stats.get(k) for k in ("session_id", "case_name", "finished", "records", "first_seen", "last_seen")})
+    cases.sort(key=lambda c: c.get("finished") or 0, reverse=True)
+    return cases
+
+def find_case_stats(case: str = None) -> dict | None:
+    """Stats for a session id or case name (newest session of that case), or the newest session overall."""
+    if case:
+        # A session id names its stats file directly; only case names need the listing
+        stats = load_case_stats(case.strip())
+        if stats is not None:
+            return stats
+    cases = list_case_stats()
+    if case:
+        wanted = case.strip().lower()
+        cases = [c for c in cases if wanted in ((c.get("session_id") or "").lower(), (c.get("case_name") or "").lower())]
+    return load_case_stats(cases[0]["session_id"]) if cases else None
+
+def format_case_context(stats: dict) -> str:
+    """Chat system context built from the stored stats, so the agent starts with facts instead of stats searches."""
+    def items(entries: list[dict], key: str, n: int = 10) -> str:
+        return ", ".join(f"{e[key]} ({e['count']})" for e in entries[:n]) or "none"
+
+    lines = [
+        f"Case '{stats.get('case_name')}' (Splunk source=\"{stats.get('case_name')}\", session {stats.get('session_id')}):",
+        f"- {stats.get('records', 0)} events from {stats.get('first_seen')} to {stats.get('last_seen')}",
+        f"- Hosts (Event.System.Computer): {items(stats.get('hosts', []), 'host')}",
+        f"- Channels: {items(stats.get('channels', []), 'channel')}",
+        f"- Top EventIDs: {items(stats.get('event_ids', []), 'event_id', 15)}",
+        f"- Top accounts: {items(stats.get('users', []), 'user')}",
+    ]
+    hourly = sorted(stats.get("hourly", []), key=lambda h: h["count"], reverse=True)[:5]
+    if hourly:
+        lines.append(f"- Busiest hours (UTC): {items(hourly, 'hour', 5)}")
+    detections = stats.get("detections") or {}
+    if detections.get("total"):
+        rules = ", ".join(f"{r.get('name')} ({r.get('count')})" for r in detections.get("top_rules", [])[:10])
+        lines.append(f"- Chainsaw: {detections['total']} detections, by severity {detections.get('by_severity', {})}; top rules: {rules}")
+    return "\n".join(lines)
+
+def build_case_stats(session_id: str, case_name: str, stats: CaseStats, detections_summary: dict) -> dict:
+    data = {"session_id": session_id, "case_name": case_name, "finished": time.time()}
+    data.update(stats.to_dict())
+    data["detections"] = detections_summary
+    return data
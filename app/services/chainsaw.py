@@ -2,14 +2,18 @@ import json
 import subprocess
 import logging
 
+from config import SIGMA_RULES_DIR
+
 logger = logging.getLogger("evtx_uploader")
 
-def run_chainsaw(evtx_dir: str) -> dict:
-    """Run Chainsaw hunt against EVTX files and return parsed JSON results."""
+def run_chainsaw(evtx_paths: str | list[str]) -> dict:
+    """Run Chainsaw hunt against an EVTX directory or list of EVTX files and return parsed JSON results."""
+    if isinstance(evtx_paths, str):
+        evtx_paths = [evtx_paths]
     try:
         cmd = [
-            "chainsaw", "hunt", evtx_dir,
-            "-s", "/opt/sigma/rules/",
+            "chainsaw", "hunt", *evtx_paths,
+            "-s", SIGMA_RULES_DIR,
             "--mapping", "/opt/chainsaw/mappings/sigma-event-logs-all.yml",
             "-r", "/opt/chainsaw/rules/",
             "--json",
@@ -25,31 +29,32 @@ def run_chainsaw(evtx_dir: str) -> dict:
             return {"detections": [], "summary": {"total": 0}}
         
         detections = json.loads(output)
-        
-        # Build summary
-        severity_counts = {}
-        rule_counts = {}
-        for det in detections:
-            group = det.get("group", "Unknown")
-            level = det.get("level", "unknown")
-            name = det.get("name", "Unknown Rule")
-            severity_counts[level] = severity_counts.get(level, 0) + 1
-            rule_counts[name] = rule_counts.get(name, 0) + 1
-        
-        # Top detections sorted by count
-        top_rules = sorted(rule_counts.items(), key=lambda x: x[1], reverse=True)[:20]
-        
-        return {
-            "detections": detections,
-            "summary": {
-                "total": len(detections),
-                "by_severity": severity_counts,
-                "top_rules": [{"name": n, "count": c} for n, c in top_rules]
-            }
-        }
+        return summarize_detections(detections)
     except subprocess.TimeoutExpired:
         logger.error("Chainsaw timed out")
         return {"detections": [], "summary": {"total": 0, "error": "Chainsaw timed out"}}
     except Exception as e:
         logger.error(f"Chainsaw error: {e}")
         return {"detections": [], "summary": {"total": 0, "error": str(e)}}
+
+def summarize_detections(detections: list[dict]) -> dict:
+    """Wrap detections with the severity counts and top rules shown on the results page."""
+    severity_counts = {}
+    rule_counts = {}
+    for det in detections:
+        level = det.get("level", "unknown")
+        name = det.get("name", "Unknown Rule")
+        severity_counts[level] = severity_counts.get(level, 0) + 1
+        rule_counts[name] = rule_counts.get(name, 0) + 1
+
+    # Top detections sorted by count
+    top_rules = sorted(rule_counts.items(), key=lambda x: x[1], reverse=True)[:20]
+
+    return {
+        "detections": detections,
+        "summary": {
+            "total": len(detections),
+            "by_severity": severity_counts,
+            "top_rules": [{"name": n, "count": c} for n, c in top_rules]
+        }
+    }
@@ -0,0 +1,69 @@
+import os
+import json
+import logging
+
+from config import STATE_DIR
+from services.evtx_parser import record_key, record_id
+
+logger = logging.getLogger("evtx_uploader")
+
+CHECKPOINTS_PATH = os.path.join(STATE_DIR, "record_checkpoints.json")
+
+class RecordCheckpoints:
+    """
+    Highest EventRecordID delivered per (Computer, Channel), kept separately for every destination
+    namespace (e.g. "splunk:main") and persisted as JSON so re-collected logs only ingest their delta.
+    """
+
+    def __init__(self, path: str = CHECKPOINTS_PATH):
+        self.path = path
+        self.data = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self.data = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Record checkpoints unreadable, starting fresh: {e}")
+
+    @staticmethod
+    def _encode(key: tuple[str, str]) -> str:
+        return f"{key[0]}|{key[1]}"
+
+    @staticmethod
+    def _decode(key: str) -> tuple[str, str]:
+        computer, _, channel = key.partition("|")
+        return computer, channel
+
+    def snapshot(self, namespace: str) -> dict:
+        return {self._decode(k): v for k, v in self.data.get(namespace, {}).items()}
+
+    def advance(self, namespace: str, records: list[dict], baseline: dict = None):
+        """
+        Raise the checkpoints to the highest EventRecordID seen per (Computer, Channel) in records.
+        baseline is the snapshot the records were filtered against: a delivered ID at or below it means the
+        log was cleared, so that key's checkpoint is replaced instead of raised.
+        """
+        baseline = baseline or {}
+        highest = {}
+        for record in records:
+            key = record_key(record)
+            rid = record_id(record)
+            if rid > highest.get(key, 0):
+                highest[key] = rid
+        if not highest:
+            return
+
+        scope = self.data.setdefault(namespace, {})
+        for key, rid in highest.items():
+            encoded = self._encode(key)
+            if rid <= baseline.get(key, 0) or rid > scope.get(encoded, 0):
+                scope[encoded] = rid
+        self.save()
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+record_checkpoints = RecordCheckpoints()
@@ -0,0 +1,207 @@
+import os
+import re
+import json
+import logging
+from bisect import bisect_left, bisect_right
+
+from config import CORRELATION_RULES_FILE
+from services.evtx_parser import parse_timestamp, record_time, record_host
+from services.results_index import SEVERITY_RANK
+
+logger = logging.getLogger("evtx_uploader")
+
+class CorrelationRuleError(ValueError):
+    """A correlation sequence could not be compiled."""
+
+_WINDOW_RE = re.compile(r"^(\d+(?:\.\d+)?)\s*([smhd]?)$")
+_WINDOW_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def _parse_window(value) -> float:
+    """Seconds, or a string such as "90s", "10m", "2h"."""
+    match = _WINDOW_RE.match(str(value).strip().lower())
+    if not match or float(match.group(1)) <= 0:
+        raise CorrelationRuleError(f"Invalid window: {value!r}")
+    return float(match.group(1)) * _WINDOW_UNITS[match.group(2)]
+
+class SequenceStep:
+    """
+    Which detections can fill one step of a sequence. Every given criterion must hold: "rule" is a regex searched
+    in the rule name, "tag" one or more ATT&CK-style tags (a tag also matches its sub-techniques), "group"
+    the detection group, "level" a minimum severity.
+    """
+
+    def __init__(self, spec: dict, position: int):
+        if not isinstance(spec, dict):
+            raise CorrelationRuleError(f"Step {position} must be an object")
+        self.name = spec.get("name") or f"step {position}"
+        try:
+            self.rule = re.compile(spec["rule"], re.IGNORECASE) if spec.get("rule") else None
+        except re.error as e:
+            raise CorrelationRuleError(f"Step '{self.name}': invalid rule regex: {e}")
+        tags = spec.get("tag") or spec.get("tags") or []
+        self.tags = [t.lower() for t in ([tags] if isinstance(tags, str) else tags)]
+        self.group = (spec.get("group") or "").lower() or None
+        level = spec.get("level")
+        if level is not None and level not in SEVERITY_RANK:
+            raise CorrelationRuleError(f"Step '{self.name}': unknown level {level!r}")
+        self.min_rank = SEVERITY_RANK[level] if level else None
+        if self.rule is None and not self.tags and self.group is None and self.min_rank is None:
+            raise CorrelationRuleError(f"Step '{self.name}' needs at least one of rule, tag, group or level")
+
+    def matches(self, name: str, group: str, level: str, tags: tuple) -> bool:
+        if self.rule is not None and not self.rule.search(name):
+            return False
+        if self.group is not None and group.lower() != self.group:
+            return False
+        if self.min_rank is not None and SEVERITY_RANK.get(level, -1) < self.min_rank:
+            return False
+        if self.tags:
+            lowered = [t.lower() for t in tags]
+            if not any(t == want or t.startswith(want + ".") for want in self.tags for t in lowered):
+                return False
+        return True
+
+class Sequence:
+    """Detections matching each step, in order, on one host (or anywhere in the case) within `window` seconds."""
+
+    def __init__(self, spec: dict, scope: str = "case"):
+        if not isinstance(spec, dict) or not spec.get("name"):
+            raise CorrelationRuleError("Sequences need a name")
+        self.name = spec["name"]
+        self.scope = scope
+        # Kept so a later IOC re-sweep can correlate the case again with the same sequences
+        self.spec = spec
+        self.description = spec.get("description", "")
+        steps = spec.get("steps") or []
+        if len(steps) < 2:
+            raise CorrelationRuleError(f"Sequence '{self.name}' needs at least two steps")
+        self.steps = [SequenceStep(step, i + 1) for i, step in enumerate(steps)]
+        self.window = _parse_window(spec.get("window", 600))
+        self.by = spec.get("by", "host")
+        if self.by not in ("host", "case"):
+            raise CorrelationRuleError(f"Sequence '{self.name}': 'by' must be host or case")
+        self.level = spec.get("level", "high")
+        if self.level not in SEVERITY_RANK:
+            raise CorrelationRuleError(f"Sequence '{self.name}': unknown level {self.level!r}")
+
+def load_sequences(specs, scope: str) -> list[Sequence]:
+    """Compile a list of sequence dicts (or a JSON string of one); raises CorrelationRuleError."""
+    if isinstance(specs, str):
+        try:
+            specs = json.loads(specs) if specs.strip() else []
+        except json.JSONDecodeError as e:
+            raise CorrelationRuleError(f"Correlation sequences are not valid JSON: {e}")
+    if not isinstance(specs, list):
+        raise CorrelationRuleError("Correlation sequences must be a list of {name, window, steps} objects")
+    return [Sequence(spec, scope) for spec in specs]
+
+def _load_global_sequences() -> list[Sequence]:
+    if not CORRELATION_RULES_FILE or not os.path.exists(CORRELATION_RULES_FILE):
+        return []
+    try:
+        with open(CORRELATION_RULES_FILE, "r") as f:
+            sequences = load_sequences(json.load(f), "global")
+    except (OSError, json.JSONDecodeError, CorrelationRuleError) as e:
+        logger.error(f"Global correlation sequences ignored: {e}")
+        return []
+    logger.info(f"Loaded {len(sequences)} global correlation sequence(s) from {CORRELATION_RULES_FILE}")
+    return sequences
+
+GLOBAL_SEQUENCES = _load_global_sequences()
+
+def correlate(detections: list[dict], sequences: list[Sequence]) -> list[dict]:
+    """
+    Incidents for every sequence: detections are bucketed per (sequence, step, host) into time-sorted arrays, then
+    each occurrence of the first step is joined to the earliest later hit of every following step by bisection.
+    Each step is filled by a different detection. Incidents of one sequence on one host never overlap.
+    """
+    if not sequences or not detections:
+        return []
+
+    # Step membership depends only on the rule, so it is evaluated once per distinct rule, not per detection
+    memberships = {}
+    # buckets[(seq, step)][host] -> [(time, detection index)]
+    buckets = {}
+    for index, det in enumerate(detections):
+        tags = tuple(det.get("tags") or ())
+        key = (det.get("name", ""), det.get("group", "") or "", det.get("level", "info"), tags)
+        member = memberships.get(key)
+        if member is None:
+            member = memberships[key] = [
+                (s, k) for s, seq in enumerate(sequences) for k, step in enumerate(seq.steps) if step.matches(*key)
+            ]
+        if not member:
+            continue
+        data = (det.get("document") or {}).get("data") or {}
+        ts = parse_timestamp(det.get("timestamp")) or record_time(data)
+        if ts is None:
+            continue
+        system = (data.get("Event") or {}).get("System")
+        host = (system.get("Computer") if isinstance(system, dict) else record_host(data)) or ""
+        for s, k in member:
+            partition = host if sequences[s].by == "host" else ""
+            buckets.setdefault((s, k), {}).setdefault(partition, []).append((ts, index))
+
+    incidents = []
+    for s, seq in enumerate(sequences):
+        partitions = set.intersection(*(set(buckets.get((s, k), {})) for k in range(len(seq.steps))))
+        for partition in sorted(partitions):
+            steps = [sorted(buckets[(s, k)][partition]) for k in range(len(seq.steps))]
+            times = [[t for t, _ in step] for step in steps]
+            last_end = None
+            for t0, first in steps[0]:
+                if last_end is not None and t0 <= last_end:
+                    continue
+                chain = [first]
+                t = t0
+                for k in range(1, len(steps)):
+                    j = bisect_left(times[k], t)
+                    # A detection that filled an earlier step (one at the same time) can't fill this one too
+                    while j < len(times[k]) and steps[k][j][1] in chain:
+                        j += 1
+                    if j == len(times[k]) or times[k][j] > t0 + seq.window:
+                        chain = None
+                        break
+                    t = times[k][j]
+                    chain.append(steps[k][j][1])
+                if chain is None:
+                    continue
+                last_end = t
+                incidents.append(_incident(seq, partition, chain, times, t0, t, detections))
+
+    incidents.sort(key=lambda i: (i["start"] or "", i["sequence"]))
+    for n, incident in enumerate(incidents, 1):
+        incident["id"] = f"INC-{n:04d}"
+    return incidents
+
+def _incident(seq: Sequence, host: str, chain: list[int], times: list[list[float]], start: float, end: float,
+              detections: list[dict]) -> dict:
+    hosts = set()
+    tags = set()
+    steps = []
+    for k, index in enumerate(chain):
+        det = detections[index]
+        hosts.add(record_host((det.get("document") or {}).get("data") or {}) or "")
+        tags.update(det.get("tags") or [])
+        steps.append({
+            "step": seq.steps[k].name,
+            "rule": det.get("name", "Unknown Rule"),
+            "level": det.get("level", "info"),
+            "timestamp": det.get("timestamp", ""),
+            # Every hit of this step inside the incident's time span, not just the one that completed the chain
+            "count": bisect_right(times[k], end) - bisect_left(times[k], start),
+        })
+    return {
+        "id": None,
+        "sequence": seq.name,
+        "description": seq.description,
+        "scope": seq.scope,
+        "level": seq.level,
+        "host": host or None,
+        "hosts": sorted(h for h in hosts if h),
+        "start": steps[0]["timestamp"],
+        "end": steps[-1]["timestamp"],
+        "duration_seconds": round(end - start, 3),
+        "steps": steps,
+        "tags": sorted(tags),
+    }
@@ -0,0 +1,111 @@
+import math
+import hashlib
+import threading
+
+from config import DEDUP_MODE, DEDUP_BLOOM_CAPACITY, DEDUP_BLOOM_ERROR_RATE
+from services.evtx_parser import system_value
+
+def record_identity(record: dict) -> bytes:
+    """(Computer, Channel, EventRecordID, TimeCreated) of a parsed record, packed for hashing."""
+    return "\x1f".join(
+        str(system_value(record, field) or "")
+        for field in ("Computer", "Channel", "EventRecordID", "TimeCreated.SystemTime")
+    ).encode("utf-8")
+
+def has_identity(record: dict) -> bool:
+    """Records without an EventRecordID can't be told apart, so they are never treated as duplicates."""
+    return system_value(record, "EventRecordID") not in (None, "")
+
+class _BloomFilter:
+    """Fixed-size Bloom filter over a bytearray; k bit positions derived from one 128-bit digest."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.count = 0
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest: bytes):
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        for i in range(self.hashes):
+            yield divmod((h1 + i * h2) % self.size, 8)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return all(self.bits[byte] & (1 << bit) for byte, bit in self._positions(digest))
+
+    def add(self, digest: bytes) -> bool:
+        """Add digest; returns True if it was (probably) already present."""
+        present = True
+        for byte, bit in self._positions(digest):
+            if not self.bits[byte] & (1 << bit):
+                present = False
+                self.bits[byte] |= 1 << bit
+        if not present:
+            self.count += 1
+        return present
+
+class _ScalableBloomFilter:
+    """
+    Bloom filters added as records arrive: each new one has twice the capacity and half the error rate of the
+    last, so memory follows the case size and the overall false-positive rate stays under error_rate.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.filters = [_BloomFilter(capacity, error_rate / 2)]
+
+    def add(self, digest: bytes) -> bool:
+        """Add digest; returns True if it was (probably) already present."""
+        if any(digest in f for f in self.filters):
+            return True
+        current = self.filters[-1]
+        if current.count >= current.capacity:
+            current = _BloomFilter(current.capacity * 2, current.error_rate / 2)
+            self.filters.append(current)
+        current.add(digest)
+        return False
+
+class RecordDeduplicator:
+    """
+    Per-case duplicate suppression for records seen in more than one file (live + VSS copies, overlapping
+    exports). The exact mode stores a 64-bit digest per record; the bloom mode uses far less memory per record
+    at the cost of a small, configurable false-positive rate. Records without an EventRecordID always pass.
+    """
+
+    def __init__(self, mode: str = DEDUP_MODE):
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.suppressed = 0
+        if mode == "bloom":
+            self.bloom = _ScalableBloomFilter(DEDUP_BLOOM_CAPACITY, DEDUP_BLOOM_ERROR_RATE)
+        else:
+            self.seen = set()
+
+    def filter(self, records: list[dict]) -> list[dict]:
+        """Return records not already seen in this case, remembering them."""
+        if self.mode == "off":
+            return records
+        digest_size = 16 if self.mode == "bloom" else 8
+        digests = [hashlib.blake2b(record_identity(r), digest_size=digest_size).digest() if has_identity(r) else None
+                   for r in records]
+
+        unique = []
+        with self.lock:
+            if self.mode == "bloom":
+                for record, digest in zip(records, digests):
+                    if digest is None or not self.bloom.add(digest):
+                        unique.append(record)
+            else:
+                seen = self.seen
+                for record, digest in zip(records, digests):
+                    if digest is None:
+                        unique.append(record)
+                        continue
+                    key = int.from_bytes(digest, "little")
+                    if key not in seen:
+                        seen.add(key)
+                        unique.append(record)
+            self.suppressed += len(records) - len(unique)
+        return unique
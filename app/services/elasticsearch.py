@@ -4,7 +4,8 @@ import logging
 
 logger = logging.getLogger("evtx_uploader")
 
-async def push_to_elasticsearch(records: list[dict], host: str, port: int, index: str):
+async def push_to_elasticsearch(records: list[dict], host: str, port: int, index: str) -> bool:
+    """Push raw EVTX records to Elasticsearch with a single _bulk request. True if every document was accepted."""
     es_url = f"http://{host}:{port}/_bulk"
     bulk_data = ""
     for record in records:
@@ -22,5 +23,14 @@ async def push_to_elasticsearch(records: list[dict], host: str, port: int, index
                     timeout=30.0
                 )
                 resp.raise_for_status()
+                result = resp.json()
             except Exception as e:
                 logger.error(f"Failed to push to Elasticsearch: {e}")
+                return False
+        # _bulk answers 200 even when single documents are rejected; those are only flagged per item
+        if result.get("errors"):
+            rejected = [item for item in result.get("items", []) if (next(iter(item.values()), {}) or {}).get("error")]
+            sample = next(iter(rejected[0].values())).get("error") if rejected else None
+            logger.error(f"Elasticsearch rejected {len(rejected)} of {len(records)} document(s) in index {index}: {sample}")
+            return False
+    return True
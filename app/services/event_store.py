@@ -0,0 +1,235 @@
+import os
+import re
+import json
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+
+from config import STORE_DIR
+from services.evtx_parser import system_value, record_id, record_time
+
+logger = logging.getLogger("evtx_uploader")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL,
+    event_id INTEGER,
+    computer TEXT COLLATE NOCASE,
+    channel TEXT COLLATE NOCASE,
+    provider TEXT COLLATE NOCASE,
+    record_id INTEGER,
+    level INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_event_id ON events (event_id, ts);
+CREATE INDEX IF NOT EXISTS events_computer ON events (computer, ts);
+CREATE INDEX IF NOT EXISTS events_channel ON events (channel, ts);
+CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5 (body, content='');
+"""
+
+# Indexed columns usable as filters and aggregation keys; "hour" / "day" bucket the event time
+COLUMNS = ("event_id", "computer", "channel", "provider", "level")
+TIME_BUCKETS = {"hour": 3600, "day": 86400}
+
+def store_path(session_id: str) -> str:
+    return os.path.join(STORE_DIR, f"{session_id}.db")
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _leaf_text(value, out: list):
+    """Every scalar value of a record, for the full-text index."""
+    if isinstance(value, dict):
+        for child in value.values():
+            _leaf_text(child, out)
+    elif isinstance(value, list):
+        for child in value:
+            _leaf_text(child, out)
+    elif value is not None and value != "":
+        out.append(str(value))
+
+class EventStore:
+    """
+    Embedded per-session SQLite store: one row per record with indexed EventID / Computer / Channel / time
+    columns, the full record as JSON, and an FTS5 index over all of its values for keyword search.
+    """
+
+    def __init__(self, session_id: str):
+        self.path = store_path(session_id)
+        self.conn = _connect(self.path)
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def add(self, records: list[dict]) -> int:
+        rows = []
+        bodies = []
+        for record in records:
+            rows.append((
+                record_time(record),
+                _int_or_none(system_value(record, "EventID")),
+                system_value(record, "Computer"),
+                system_value(record, "Channel"),
+                system_value(record, "Provider.Name"),
+                record_id(record) or None,
+                _int_or_none(system_value(record, "Level")),
+                json.dumps(record),
+            ))
+            text = []
+            _leaf_text(record, text)
+            bodies.append(" ".join(text))
+
+        with self.lock, self.conn:
+            cursor = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM events")
+            first_id = cursor.fetchone()[0] + 1
+            self.conn.executemany(
+                "INSERT INTO events (id, ts, event_id, computer, channel, provider, record_id, level, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(first_id + i, *row) for i, row in enumerate(rows)],
+            )
+            self.conn.executemany(
+                "INSERT INTO events_fts (rowid, body) VALUES (?, ?)",
+                [(first_id + i, body) for i, body in enumerate(bodies)],
+            )
+        return len(rows)
+
+    def close(self):
+        with self.lock:
+            self.conn.execute("PRAGMA optimize")
+            self.conn.close()
+
+def parse_time(value) -> float | None:
+    """Epoch seconds or an ISO-8601 timestamp (UTC when no offset is given)."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+_FIELD_PATH_RE = re.compile(r"^[A-Za-z0-9_.#@-]+$")
+
+def _json_path(field: str) -> tuple[str, ...]:
+    """
+    JSON paths a dotted field name ("Event." is implied) can be stored at, most specific first, as record_value
+    reads them: an element's "#text", an attribute under "#attributes" (e.g. Event.System.Provider.Name), the plain
+    nested value and the profile-flattened key. Explicit "#attributes" / "#text" parts are accepted too.
+    """
+    parts = [part for part in field.split(".") if part not in ("#attributes", "#text")]
+    if not parts:
+        raise ValueError(f"Invalid field name: {field}")
+    if parts[0] != "Event":
+        parts.insert(0, "Event")
+    nested = "$." + ".".join(f'"{part}"' for part in parts)
+    attribute = "$." + ".".join(f'"{part}"' for part in parts[:-1]) + f'."#attributes"."{parts[-1]}"'
+    return f'{nested}."#text"', attribute, nested, '$."' + ".".join(parts) + '"'
+
+def _fts_query(q: str) -> str:
+    """Treat user input as plain terms (quoted, implicitly AND-ed) so FTS5 syntax characters can't break the query."""
+    terms = [t.replace('"', '""') for t in q.split()]
+    return " ".join(f'"{t}"' for t in terms)
+
+def search(
+    session_id: str,
+    q: str = None,
+    filters: dict = None,
+    fields: dict = None,
+    start: float = None,
+    end: float = None,
+    aggregate: list[str] = None,
+    top: int = 10,
+    sort: str = "ts",
+    order: str = "asc",
+    offset: int = 0,
+    limit: int = 50,
+) -> dict | None:
+    """
+    Query a session store. filters match indexed columns exactly; fields match dotted record paths
+    (e.g. {"EventData.TargetUserName": "admin"}); q is a keyword search over all values. None if no store exists.
+    """
+    path = store_path(session_id)
+    if not os.path.exists(path):
+        return None
+
+    where = []
+    params = []
+    for column, value in (filters or {}).items():
+        if column not in COLUMNS:
+            raise ValueError(f"Unknown filter column: {column}")
+        where.append(f"{column} = ?")
+        params.append(_int_or_none(value) if column in ("event_id", "level") else value)
+    for field, value in (fields or {}).items():
+        if not _FIELD_PATH_RE.match(field):
+            raise ValueError(f"Invalid field name: {field}")
+        paths = _json_path(field)
+        extracts = ", ".join("json_extract(data, ?)" for _ in paths)
+        where.append(f"CAST(COALESCE({extracts}) AS TEXT) = ? COLLATE NOCASE")
+        params += [*paths, str(value)]
+    if start is not None:
+        where.append("ts >= ?")
+        params.append(start)
+    if end is not None:
+        where.append("ts <= ?")
+        params.append(end)
+    if q and q.strip():
+        where.append("id IN (SELECT rowid FROM events_fts WHERE events_fts MATCH ?)")
+        params.append(_fts_query(q))
+    clause = f"WHERE {' AND '.join(where)}" if where else ""
+
+    if sort not in ("ts", "record_id") + COLUMNS:
+        raise ValueError(f"Unknown sort column: {sort}")
+    direction = "DESC" if order == "desc" else "ASC"
+
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        total = conn.execute(f"SELECT COUNT(*) FROM events {clause}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT data FROM events {clause} ORDER BY {sort} {direction}, id {direction} LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        ).fetchall()
+
+        aggregations = {}
+        for key in aggregate or []:
+            if key in TIME_BUCKETS:
+                bucket = TIME_BUCKETS[key]
+                expr = f"CAST(ts / {bucket} AS INTEGER) * {bucket}"
+                agg_rows = conn.execute(
+                    f"SELECT {expr} AS k, COUNT(*) FROM events {clause} {'AND' if clause else 'WHERE'} ts IS NOT NULL "
+                    f"GROUP BY k ORDER BY k", params,
+                ).fetchall()
+                aggregations[key] = [
+                    {"key": datetime.fromtimestamp(k, timezone.utc).isoformat(), "count": c} for k, c in agg_rows
+                ]
+            elif key in COLUMNS:
+                agg_rows = conn.execute(
+                    f"SELECT {key} AS k, COUNT(*) AS c FROM events {clause} GROUP BY k ORDER BY c DESC LIMIT ?",
+                    params + [top],
+                ).fetchall()
+                aggregations[key] = [{"key": k, "count": c} for k, c in agg_rows]
+            else:
+                raise ValueError(f"Unknown aggregation: {key}")
+    finally:
+        conn.close()
+
+    return {
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "events": [json.loads(row[0]) for row in rows],
+        "aggregations": aggregations,
+    }
@@ -0,0 +1,73 @@
+import io
+import struct
+import zlib
+
+# EVTX layout: a 4096-byte file header block followed by 64 KiB chunks, each starting with "ElfChnk\0"
+FILE_HEADER_BLOCK_SIZE = 4096
+CHUNK_SIZE = 65536
+FILE_SIGNATURE = b"ElfFile\x00"
+CHUNK_SIGNATURE = b"ElfChnk\x00"
+
+def read_file_header(f) -> dict | None:
+    f.seek(0)
+    header = f.read(FILE_HEADER_BLOCK_SIZE)
+    if len(header) < 128 or header[:8] != FILE_SIGNATURE:
+        return None
+    first_chunk, last_chunk, next_record_id = struct.unpack_from("<QQQ", header, 8)
+    chunk_count, = struct.unpack_from("<H", header, 42)
+    return {
+        "raw": header,
+        "first_chunk": first_chunk,
+        "last_chunk": last_chunk,
+        "next_record_id": next_record_id,
+        "chunk_count": chunk_count,
+    }
+
+def iter_chunk_headers(f):
+    """Yield (chunk_index, first_record_id, last_record_id) for every chunk, straight from the chunk headers."""
+    index = 0
+    while True:
+        f.seek(FILE_HEADER_BLOCK_SIZE + index * CHUNK_SIZE)
+        head = f.read(40)
+        if len(head) < 40:
+            return
+        if head[:8] == CHUNK_SIGNATURE:
+            first_id, last_id = struct.unpack_from("<QQ", head, 24)
+            yield index, first_id, last_id
+        index += 1
+
+def trim_to_records_after(path: str, min_record_id: int):
+    """
+    Return a file-like EVTX containing only the chunks that hold records with an EventRecordID above
+    min_record_id, or None when no chunk can be skipped (the caller then parses the original file).
+    Chunks are copied verbatim, so their checksums stay valid; only the file header is rewritten.
+    """
+    with open(path, "rb") as f:
+        header = read_file_header(f)
+        if header is None:
+            return None
+        chunks = list(iter_chunk_headers(f))
+        keep = [i for i, first_id, last_id in chunks if last_id > min_record_id]
+        if len(keep) == len(chunks):
+            return None
+
+        out = io.BytesIO()
+        raw = bytearray(header["raw"])
+        last_chunk = max(len(keep) - 1, 0)
+        struct.pack_into("<QQ", raw, 8, 0, last_chunk)
+        struct.pack_into("<H", raw, 42, len(keep))
+        struct.pack_into("<I", raw, 124, zlib.crc32(bytes(raw[:120])) & 0xFFFFFFFF)
+        out.write(raw)
+        for i in keep:
+            f.seek(FILE_HEADER_BLOCK_SIZE + i * CHUNK_SIZE)
+            out.write(f.read(CHUNK_SIZE))
+        out.seek(0)
+        return out
+
+def last_record_id(path: str) -> int | None:
+    """Highest EventRecordID in the file according to its chunk headers (the file header lags on dirty logs)."""
+    with open(path, "rb") as f:
+        if read_file_header(f) is None:
+            return None
+        last_ids = [last_id for _, _, last_id in iter_chunk_headers(f)]
+    return max(last_ids) if last_ids else None
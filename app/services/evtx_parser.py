@@ -1,13 +1,112 @@
 import json
+import logging
+from datetime import datetime, timezone
 from evtx import PyEvtxParser
 
-def parse_evtx_to_json(path: str) -> list[dict]:
-    """Parse a single EVTX file into a list of JSON dictionaries."""
-    parser = PyEvtxParser(path)
+from services.evtx_chunks import trim_to_records_after, last_record_id
+
+logger = logging.getLogger("evtx_uploader")
+
+# Channels whose records come from many hosts, so chunk-level record ranges say nothing about a single host
+MULTI_SOURCE_CHANNELS = {"ForwardedEvents"}
+
+def record_value(record: dict, path: str):
+    """
+    Value at a dotted path (e.g. "Event.EventData.TargetUserName") of a parsed record, for both the nested
+    layout and profile-flattened records (where the "#attributes" / "#text" levels are folded into dotted keys).
+    """
+    flat = record.get(path)
+    if flat is not None:
+        return flat
+    value = record
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        attributes = value.get("#attributes")
+        value = value.get(key, attributes.get(key) if isinstance(attributes, dict) else None)
+    if isinstance(value, dict) and "#text" in value:
+        value = value["#text"]
+    return value
+
+def system_value(record: dict, field: str):
+    """Event.System.<field> of a parsed record (see record_value)."""
+    return record_value(record, f"Event.System.{field}")
+
+def record_key(record: dict) -> tuple[str, str]:
+    """(Computer, Channel) of a parsed record, the scope in which EventRecordIDs are sequential."""
+    return system_value(record, "Computer") or "", system_value(record, "Channel") or ""
+
+def record_id(record: dict) -> int:
+    try:
+        return int(system_value(record, "EventRecordID") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def record_time(record: dict) -> float | None:
+    """Event.System.TimeCreated as epoch seconds (HEC "time"), or None if absent or unparseable."""
+    return parse_timestamp(system_value(record, "TimeCreated.SystemTime"))
+
+def parse_timestamp(value) -> float | None:
+    """ISO-8601 timestamp (UTC when no offset is given) as epoch seconds, or None if absent or unparseable."""
+    if not value:
+        return None
+    value = str(value).replace("Z", "+00:00")
+    # Windows timestamps can carry 7 fractional digits; datetime accepts at most 6
+    head, dot, rest = value.partition(".")
+    if dot:
+        digits = len(rest) - len(rest.lstrip("0123456789"))
+        value = f"{head}.{rest[:min(digits, 6)]}{rest[digits:]}"
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return round(parsed.timestamp(), 6)
+
+def record_host(record: dict) -> str | None:
+    """Event.System.Computer, used as the HEC "host"."""
+    return system_value(record, "Computer") or None
+
+def _first_record(path: str) -> dict | None:
+    for record in PyEvtxParser(path).records_json():
+        try:
+            return json.loads(record['data'])
+        except json.JSONDecodeError:
+            continue
+    return None
+
+def parse_evtx_to_json(path: str, checkpoints: dict = None) -> list[dict]:
+    """
+    Parse a single EVTX file into a list of JSON dictionaries.
+
+    If checkpoints maps (Computer, Channel) to the highest EventRecordID already ingested, only newer records
+    are returned, and whole chunks at or below the checkpoint are skipped before BinXML decoding.
+    """
+    source = path
+    if checkpoints:
+        first = _first_record(path)
+        if first is not None:
+            key = record_key(first)
+            checkpoint = checkpoints.get(key, 0)
+            highest = last_record_id(path)
+            if highest is not None and highest < checkpoint:
+                # Record IDs went backwards: the log was cleared or rotated, so everything in it is new
+                logger.info(f"{path}: EventRecordID reset for {key} ({highest} < {checkpoint}), ingesting all records")
+                checkpoints = {k: v for k, v in checkpoints.items() if k != key}
+            elif checkpoint and key[1] not in MULTI_SOURCE_CHANNELS:
+                trimmed = trim_to_records_after(path, checkpoint)
+                if trimmed is not None:
+                    source = trimmed
+
+    parser = PyEvtxParser(source)
     records = []
     for record in parser.records_json():
         try:
-            records.append(json.loads(record['data']))
+            data = json.loads(record['data'])
         except json.JSONDecodeError:
-            pass
+            continue
+        if checkpoints and record_id(data) <= checkpoints.get(record_key(data), 0):
+            continue
+        records.append(data)
     return records
@@ -0,0 +1,273 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+
+from config import FILTER_RULES_FILE
+from services.evtx_parser import record_value
+from services.dedup import record_identity
+
+logger = logging.getLogger("evtx_uploader")
+
+class FilterSyntaxError(ValueError):
+    """An ingest filter rule could not be compiled."""
+
+# Short names for the fields most rules need. Other bare names are EventData fields; dotted names are record
+# paths with an implied "Event." prefix (e.g. "UserData.LogFileCleared.SubjectUserName")
+FIELD_ALIASES = {
+    "channel": "Event.System.Channel",
+    "provider": "Event.System.Provider.Name",
+    "event_id": "Event.System.EventID",
+    "computer": "Event.System.Computer",
+    "level": "Event.System.Level",
+    "task": "Event.System.Task",
+}
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<number>-?\d+(?:\.\d+)?)(?![\w.])
+      | (?P<op>==|!=|<=|>=|<|>|\(|\)|,)
+      | (?P<word>[A-Za-z_#][\w.#/-]*)
+    )""", re.VERBOSE)
+
+KEYWORDS = {"and", "or", "not", "in", "contains", "startswith", "endswith", "matches", "exists"}
+
+def _tokenize(expression: str) -> list[tuple[str, object]]:
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = _TOKEN_RE.match(expression, pos)
+        if not match:
+            raise FilterSyntaxError(f"Unexpected input at {pos}: {expression[pos:pos + 20]!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == "string":
+            # Only quotes and backslashes are escapable, so regexes like "\d+" need no doubling
+            tokens.append(("value", re.sub(r"\\([\\\"'])", r"\1", text[1:-1])))
+        elif kind == "number":
+            tokens.append(("value", float(text) if "." in text else int(text)))
+        elif kind == "word" and text.lower() in KEYWORDS:
+            tokens.append(("kw", text.lower()))
+        else:
+            tokens.append((kind, text))
+    return tokens
+
+def _normalize(value):
+    """Comparable form of a record value: numbers as numbers, strings case-folded."""
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            return value.casefold()
+    return value
+
+def _compare(op: str, left, right) -> bool:
+    try:
+        if op == "==":
+            return left == right
+        if op == "!=":
+            return left != right
+        if op == "<":
+            return left < right
+        if op == "<=":
+            return left <= right
+        if op == ">":
+            return left > right
+        return left >= right
+    except TypeError:
+        return False
+
+class _Parser:
+    """Recursive-descent compiler from the filter grammar to nested closures over a record."""
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, kind: str = None, text=None):
+        token = self.peek()
+        if token[0] is None or (kind and token[0] != kind) or (text is not None and token[1] != text):
+            expected = text or kind or "token"
+            raise FilterSyntaxError(f"Expected {expected} in {self.expression!r}, got {token[1]!r}")
+        self.pos += 1
+        return token
+
+    def compile(self):
+        predicate = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise FilterSyntaxError(f"Unexpected {self.peek()[1]!r} in {self.expression!r}")
+        return predicate
+
+    def parse_or(self):
+        terms = [self.parse_and()]
+        while self.peek() == ("kw", "or"):
+            self.pos += 1
+            terms.append(self.parse_and())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda record: any(term(record) for term in terms)
+
+    def parse_and(self):
+        terms = [self.parse_not()]
+        while self.peek() == ("kw", "and"):
+            self.pos += 1
+            terms.append(self.parse_not())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda record: all(term(record) for term in terms)
+
+    def parse_not(self):
+        if self.peek() == ("kw", "not"):
+            self.pos += 1
+            inner = self.parse_not()
+            return lambda record: not inner(record)
+        if self.peek() == ("op", "("):
+            self.pos += 1
+            inner = self.parse_or()
+            self.take("op", ")")
+            return inner
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        _, name = self.take("word")
+        path = FIELD_ALIASES.get(name.lower(), name)
+        if "." not in path:
+            path = f"Event.EventData.{path}"
+        elif not path.startswith("Event."):
+            path = f"Event.{path}"
+
+        def get(record):
+            return record_value(record, path)
+
+        kind, op = self.peek()
+        self.pos += 1
+        if kind == "kw" and op == "exists":
+            return lambda record: get(record) not in (None, "")
+        if kind == "op" and op in ("==", "!=", "<", "<=", ">", ">="):
+            expected = _normalize(self.take("value")[1])
+            return lambda record: _compare(op, _normalize(get(record)), expected)
+        if kind == "kw" and op == "in":
+            self.take("op", "(")
+            values = {_normalize(self.take("value")[1])}
+            while self.peek() == ("op", ","):
+                self.pos += 1
+                values.add(_normalize(self.take("value")[1]))
+            self.take("op", ")")
+            return lambda record: _normalize(get(record)) in values
+        if kind == "kw" and op in ("contains", "startswith", "endswith"):
+            needle = str(self.take("value")[1]).casefold()
+            method = {"contains": "__contains__", "startswith": "startswith", "endswith": "endswith"}[op]
+            return lambda record: getattr(str(get(record) or "").casefold(), method)(needle)
+        if kind == "kw" and op == "matches":
+            try:
+                pattern = re.compile(str(self.take("value")[1]), re.IGNORECASE)
+            except re.error as e:
+                raise FilterSyntaxError(f"Bad regex in {self.expression!r}: {e}")
+            return lambda record: pattern.search(str(get(record) or "")) is not None
+        raise FilterSyntaxError(f"Expected an operator after {name!r} in {self.expression!r}, got {op!r}")
+
+def compile_expression(expression: str):
+    """Compile a filter expression, e.g. 'channel == "Security" and event_id in (4658, 4690)', to a predicate."""
+    return _Parser(expression).compile()
+
+class FilterRule:
+    """One named rule: records matching `when` are dropped, or kept at `rate` (0..1) when action is "sample"."""
+
+    def __init__(self, spec: dict, scope: str = "global"):
+        if not isinstance(spec, dict) or not spec.get("when"):
+            raise FilterSyntaxError(f"Filter rule needs a 'when' expression: {spec!r}")
+        self.when = spec["when"]
+        self.name = spec.get("name") or self.when
+        self.scope = scope
+        self.action = spec.get("action", "drop")
+        if self.action not in ("drop", "sample"):
+            raise FilterSyntaxError(f"Unknown filter action {self.action!r} in rule {self.name!r}")
+        try:
+            self.rate = float(spec.get("rate", 0.0))
+        except (TypeError, ValueError):
+            raise FilterSyntaxError(f"Sample rate must be a number in rule {self.name!r}")
+        if not 0.0 <= self.rate <= 1.0:
+            raise FilterSyntaxError(f"Sample rate must be between 0 and 1 in rule {self.name!r}")
+        # Sampling keeps a record when its identity hash falls below the rate, so re-ingests keep the same records
+        self.threshold = int(self.rate * 2 ** 64)
+        self.predicate = compile_expression(self.when)
+
+    def keeps(self, record: dict) -> bool:
+        if self.action == "drop":
+            return False
+        digest = hashlib.blake2b(record_identity(record), digest_size=8).digest()
+        return int.from_bytes(digest, "little") < self.threshold
+
+def load_rules(specs, scope: str) -> list[FilterRule]:
+    """Compile a list of rule dicts (or a JSON string of one); raises FilterSyntaxError."""
+    if isinstance(specs, str):
+        try:
+            specs = json.loads(specs) if specs.strip() else []
+        except json.JSONDecodeError as e:
+            raise FilterSyntaxError(f"Filter rules are not valid JSON: {e}")
+    if not isinstance(specs, list):
+        raise FilterSyntaxError("Filter rules must be a list of {name, when, action, rate} objects")
+    return [FilterRule(spec, scope) for spec in specs]
+
+def _load_global_rules() -> list[FilterRule]:
+    if not FILTER_RULES_FILE or not os.path.exists(FILTER_RULES_FILE):
+        return []
+    try:
+        with open(FILTER_RULES_FILE, "r") as f:
+            rules = load_rules(json.load(f), "global")
+    except (OSError, json.JSONDecodeError, FilterSyntaxError) as e:
+        logger.error(f"Global filter rules ignored: {e}")
+        return []
+    logger.info(f"Loaded {len(rules)} global ingest filter rule(s) from {FILTER_RULES_FILE}")
+    return rules
+
+GLOBAL_RULES = _load_global_rules()
+
+class RecordFilter:
+    """
+    Case rules followed by the global rules; the first rule a record matches decides its fate. Keeps per-rule
+    hit counters for the session. Only the pushed stream is filtered: Chainsaw hunts the original EVTX files.
+    """
+
+    def __init__(self, case_rules: list[FilterRule] = None, global_rules: list[FilterRule] = None):
+        self.rules = list(case_rules or []) + list(GLOBAL_RULES if global_rules is None else global_rules)
+        self.lock = threading.Lock()
+        # One entry per rule in evaluation order; names need not be unique (they default to the expression)
+        self.counters = [
+            {"name": rule.name, "scope": rule.scope, "action": rule.action, "matched": 0, "dropped": 0}
+            for rule in self.rules
+        ]
+
+    def filter(self, records: list[dict]) -> list[dict]:
+        if not self.rules:
+            return records
+        rules = self.rules
+        matched = [0] * len(rules)
+        dropped = [0] * len(rules)
+        kept = []
+        for record in records:
+            for i, rule in enumerate(rules):
+                if rule.predicate(record):
+                    matched[i] += 1
+                    if not rule.keeps(record):
+                        dropped[i] += 1
+                        break
+                    kept.append(record)
+                    break
+            else:
+                kept.append(record)
+
+        with self.lock:
+            for i, counter in enumerate(self.counters):
+                counter["matched"] += matched[i]
+                counter["dropped"] += dropped[i]
+        return kept
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import threading
 from mcp import ClientSession
 from mcp.client.sse import sse_client
 from config import MCP_SSE_URL, MCP_TOKEN
@@ -22,11 +23,10 @@ def _get_mcp_tools_sync() -> list[dict]:
                     response = await session.list_tools()
                     tools = []
                     for tool in response.tools:
-                        props = {}
-                        req = []
-                        if hasattr(tool.inputSchema, "properties") and tool.inputSchema.properties:
-                            props = {k: {"type": v.get("type", "string"), "description": v.get("description", "")} for k, v in tool.inputSchema.properties.items()}
-                            req = getattr(tool.inputSchema, "required", [])
+                        # A plain dict, named input_schema since mcp 2
+                        schema = (tool.inputSchema if hasattr(tool, "inputSchema") else tool.input_schema) or {}
+                        props = {k: {"type": v.get("type", "string"), "description": v.get("description", "")} for k, v in (schema.get("properties") or {}).items()}
+                        req = schema.get("required", [])
                         tools.append({
                             "type": "function",
                             "function": {
@@ -45,7 +45,22 @@ def _get_mcp_tools_sync() -> list[dict]:
         loop.close()
     return tools_result
 
-def _call_mcp_tool_sync(tool_name: str, tool_args: dict) -> str:
+class _ToolCallHandle:
+    """Lets the awaiting coroutine cancel a tool call running in its worker thread's event loop."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loop = None
+        self.task = None
+        self.cancelled = False
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(self.task.cancel)
+
+def _call_mcp_tool_sync(tool_name: str, tool_args: dict, handle: _ToolCallHandle) -> str:
     """Run MCP tool execution in a fresh event loop (isolated from WebSocket cancel scope)."""
     result_text = "No results"
     async def _inner():
@@ -60,8 +75,17 @@ def _call_mcp_tool_sync(tool_name: str, tool_args: dict) -> str:
             logger.warning(f"MCP cleanup error (result already captured): {e}")
     loop = asyncio.new_event_loop()
     try:
-        loop.run_until_complete(_inner())
+        with handle.lock:
+            if handle.cancelled:
+                return "Cancelled"
+            handle.loop, handle.task = loop, loop.create_task(_inner())
+        # Cancelling the task closes the MCP session, which cancels the tool (and its Splunk job) on the server
+        loop.run_until_complete(handle.task)
+    except asyncio.CancelledError:
+        result_text = "Cancelled"
     finally:
+        with handle.lock:
+            handle.loop = None
         loop.close()
     return result_text
 
@@ -77,8 +101,14 @@ async def get_mcp_tools() -> list[dict]:
     return tools
 
 async def call_mcp_tool(tool_name: str, tool_args: dict) -> str:
-    """Run MCP tool execution in a separate thread to isolate from WebSocket cancel scope."""
-    return await asyncio.to_thread(_call_mcp_tool_sync, tool_name, tool_args)
+    """Run MCP tool execution in a separate thread to isolate from WebSocket cancel scope; cancelling it stops the call."""
+    handle = _ToolCallHandle()
+    try:
+        return await asyncio.to_thread(_call_mcp_tool_sync, tool_name, tool_args, handle)
+    except asyncio.CancelledError:
+        handle.cancel()
+        logger.info(f"Cancelled MCP tool `{tool_name}`")
+        raise
 
 def format_tools_for_ollama(mcp_tools: list[dict]) -> list:
     """Convert MCP tool dicts to ollama Tool format."""
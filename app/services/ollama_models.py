@@ -0,0 +1,173 @@
+import time
+import asyncio
+import logging
+from collections import deque
+
+import httpx
+
+from config import OLLAMA_BASE, OLLAMA_DEFAULT_MODEL, OLLAMA_MODELS_TTL, OLLAMA_KEEP_ALIVE_MIN, OLLAMA_KEEP_ALIVE_MAX
+
+logger = logging.getLogger("evtx_uploader")
+
+# Uses older than this no longer stretch a model's keep_alive
+USAGE_WINDOW = 3600
+RESIDENT_TTL = 5.0
+# Ollama acknowledges an unload before the runner has freed its memory
+UNLOAD_WAIT = 30.0
+
+class ModelManager:
+    """
+    Ollama model lifecycle: cached /api/tags listing and /api/ps residency, timed loads and unloads, and a keep_alive
+    that follows how each model is used. A model chatted with every few minutes stays loaded across the pauses, a
+    model tried once is released after OLLAMA_KEEP_ALIVE_MIN.
+    """
+
+    def __init__(self):
+        self.models = None
+        self.models_time = 0.0
+        self.resident_models = None
+        self.resident_time = 0.0
+        # model -> timestamps of its recent chat requests
+        self.uses = {}
+        self.last_used = None
+        # model -> {"load" / "unload": {"count", "total_seconds", "last_seconds"}}
+        self.timings = {}
+
+    async def list_models(self, refresh: bool = False) -> list[dict]:
+        """Installed models, from /api/tags at most every OLLAMA_MODELS_TTL seconds; the last listing if Ollama is down."""
+        if refresh or self.models is None or time.time() - self.models_time > OLLAMA_MODELS_TTL:
+            try:
+                async with httpx.AsyncClient(timeout=5.0) as client:
+                    resp = await client.get(f"{OLLAMA_BASE}/api/tags")
+                    resp.raise_for_status()
+            except Exception as e:
+                if self.models is None:
+                    raise
+                logger.warning(f"Ollama model listing failed, serving the cached one: {e}")
+                return self.models
+            self.models = [{"name": m["name"], "size": m.get("size", 0)} for m in resp.json().get("models", [])]
+            self.models_time = time.time()
+        return self.models
+
+    async def resident(self, refresh: bool = False) -> dict[str, dict]:
+        """Models loaded in Ollama's memory (/api/ps), by name."""
+        if refresh or self.resident_models is None or time.time() - self.resident_time > RESIDENT_TTL:
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                resp = await client.get(f"{OLLAMA_BASE}/api/ps")
+                resp.raise_for_status()
+            self.resident_models = {
+                m["name"]: {"size_vram": m.get("size_vram", 0), "expires_at": m.get("expires_at")}
+                for m in resp.json().get("models", [])
+            }
+            self.resident_time = time.time()
+        return self.resident_models
+
+    def keep_alive(self, model: str) -> int:
+        """Seconds: twice the longest pause between the model's uses in the last hour, within the configured bounds."""
+        now = time.time()
+        uses = [t for t in self.uses.get(model, ()) if now - t < USAGE_WINDOW]
+        gaps = [b - a for a, b in zip(uses, uses[1:])]
+        wanted = 2 * max(gaps) if gaps else 0
+        return int(min(OLLAMA_KEEP_ALIVE_MAX, max(OLLAMA_KEEP_ALIVE_MIN, wanted)))
+
+    def touch(self, model: str) -> str:
+        """Record a chat request for the model; returns the keep_alive to send with it."""
+        self.uses.setdefault(model, deque(maxlen=32)).append(time.time())
+        self.last_used = model
+        return f"{self.keep_alive(model)}s"
+
+    async def default_model(self) -> str:
+        """OLLAMA_DEFAULT_MODEL, else the model used last, else the first installed one."""
+        if OLLAMA_DEFAULT_MODEL:
+            return OLLAMA_DEFAULT_MODEL
+        if self.last_used:
+            return self.last_used
+        models = await self.list_models()
+        return models[0]["name"] if models else ""
+
+    def _record(self, model: str, kind: str, seconds: float):
+        timing = self.timings.setdefault(model, {}).setdefault(kind, {"count": 0, "total_seconds": 0.0, "last_seconds": None})
+        timing["count"] += 1
+        timing["total_seconds"] += seconds
+        timing["last_seconds"] = round(seconds, 3)
+
+    async def load(self, model: str) -> dict:
+        """Load the model (a no-op if it is resident) and time it."""
+        try:
+            was_resident = model in await self.resident()
+        except Exception:
+            was_resident = False
+        keep_alive = self.keep_alive(model)
+        started = time.perf_counter()
+        async with httpx.AsyncClient(timeout=300.0) as client:
+            resp = await client.post(
+                f"{OLLAMA_BASE}/api/generate",
+                json={"model": model, "stream": False, "keep_alive": f"{keep_alive}s"}
+            )
+            resp.raise_for_status()
+        elapsed = time.perf_counter() - started
+        # Ollama's own figure excludes the HTTP round trip
+        load_seconds = (resp.json().get("load_duration") or 0) / 1e9
+        self.resident_models = None
+        if not was_resident:
+            self._record(model, "load", elapsed)
+            logger.info(f"Loaded model {model} in {elapsed:.2f}s (Ollama load_duration {load_seconds:.2f}s), keep_alive {keep_alive}s")
+        return {
+            "model": model,
+            "already_loaded": was_resident,
+            "seconds": round(elapsed, 3),
+            "load_duration": round(load_seconds, 3),
+            "keep_alive": keep_alive,
+        }
+
+    async def unload(self, model: str) -> dict:
+        """Release the model and time it until /api/ps no longer lists it."""
+        started = time.perf_counter()
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            resp = await client.post(f"{OLLAMA_BASE}/api/generate", json={"model": model, "keep_alive": 0})
+            resp.raise_for_status()
+        released = False
+        while time.perf_counter() - started < UNLOAD_WAIT:
+            if model not in await self.resident(refresh=True):
+                released = True
+                break
+            await asyncio.sleep(0.2)
+        elapsed = time.perf_counter() - started
+        if released:
+            self._record(model, "unload", elapsed)
+            logger.info(f"Unloaded model {model} in {elapsed:.2f}s")
+        else:
+            logger.warning(f"Model {model} still resident {UNLOAD_WAIT:.0f}s after unload")
+        return {"model": model, "released": released, "seconds": round(elapsed, 3)}
+
+    async def warm(self):
+        """Preload OLLAMA_DEFAULT_MODEL at startup so the first chat doesn't wait for the load."""
+        if not OLLAMA_DEFAULT_MODEL:
+            return
+        try:
+            await self.load(OLLAMA_DEFAULT_MODEL)
+        except Exception as e:
+            logger.warning(f"Could not preload default model {OLLAMA_DEFAULT_MODEL}: {e}")
+
+    async def status(self) -> dict:
+        try:
+            resident, error = await self.resident(), None
+        except Exception as e:
+            resident, error = {}, str(e)
+        timings = {
+            model: {
+                kind: {**t, "total_seconds": round(t["total_seconds"], 3), "avg_seconds": round(t["total_seconds"] / t["count"], 3)}
+                for kind, t in kinds.items()
+            }
+            for model, kinds in self.timings.items()
+        }
+        return {
+            "default_model": OLLAMA_DEFAULT_MODEL or None,
+            "last_used": self.last_used,
+            "resident": resident,
+            "keep_alive": {model: self.keep_alive(model) for model in self.uses},
+            "timings": timings,
+            "error": error,
+        }
+
+model_manager = ModelManager()
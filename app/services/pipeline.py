@@ -0,0 +1,477 @@
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from zipfile import ZipFile
+
+import aiofiles
+
+from config import UPLOAD_DIR, OUTPUT_DIR, INGEST_PROFILE, DETECTION_ENGINE
+from utils import delete_later, unique_name, StageTimer
+from services.archive import extract_evtx_members, ARCHIVE_ERRORS
+from services.evtx_parser import parse_evtx_to_json, record_key, record_id
+from services.checkpoints import record_checkpoints
+from services.dedup import RecordDeduplicator, record_identity
+from services.profiles import IngestProfile
+from services.filters import RecordFilter, load_rules
+from services.ioc import IOCMatcher, parse_iocs
+from services.correlation import GLOBAL_SEQUENCES, correlate, load_sequences
+from services.chainsaw import run_chainsaw, summarize_detections
+from services.sigma import get_engine
+from services.splunk import push_chainsaw_to_splunk
+from services.sinks import FanOut, SplunkSink, ElasticsearchSink, FileSink, SQLiteSink, parse_destinations
+from services.results_index import build_results_index
+from services.case_stats import CaseStats, build_case_stats, save_case_stats
+from services.timeline import write_file_timeline, write_detection_timeline
+from services.vector_index import build_vector_index
+
+logger = logging.getLogger("evtx_uploader")
+
+DEFAULT_SPLUNK_URL = "http://splunk:8088/services/collector/event"
+DEFAULT_SPLUNK_TOKEN = "11111111-1111-1111-1111-111111111111"
+
+def new_session_id(case_name: str) -> str:
+    case_slug = re.sub(r'[^a-zA-Z0-9_-]', '_', case_name.strip())[:50]
+    return f"{case_slug}_{uuid.uuid4().hex[:8]}"
+
+class IngestSession:
+    """
+    One case going through parse -> push -> Chainsaw -> results. Shared by the upload routes, the
+    batch CLI and the drop-folder watcher so every entry point produces the same session layout.
+    """
+
+    def __init__(
+        self,
+        case_name: str = "Untitled Case",
+        destination: str = "elasticsearch",
+        index: str = "evtx_index",
+        splunk_url: str = None,
+        splunk_token: str = None,
+        es_host: str = "elasticsearch",
+        es_port: int = 9200,
+        es_index: str = None,
+        session_id: str = None,
+        progress: dict = None,
+        concurrency: int = 8,
+        incremental: bool = False,
+        profile: str = None,
+        filters: list | str = None,
+        iocs: str = None,
+        sequences: list | str = None,
+        detection_engine: str = None,
+    ):
+        self.case_name = case_name
+        # One or more of splunk / elasticsearch / file / sqlite, comma-separated; raises ValueError for unknown names
+        self.destinations = parse_destinations(destination)
+        self.destination = ",".join(self.destinations) or "none"
+        self.index = index
+        self.splunk_url = splunk_url or DEFAULT_SPLUNK_URL
+        self.splunk_token = splunk_token or DEFAULT_SPLUNK_TOKEN
+        self.es_host = es_host
+        self.es_port = es_port
+        self.es_index = es_index or index
+
+        # Incremental mode only ingests records above the per-(Computer, Channel) EventRecordID checkpoints
+        self.incremental = incremental
+        namespaces = {
+            "splunk": f"splunk:{index}",
+            "elasticsearch": f"elasticsearch:{es_host}:{self.es_index}",
+            "file": "file",
+            "sqlite": "sqlite",
+        }
+        self.checkpoint_namespace = "+".join(sorted(namespaces[d] for d in self.destinations)) or f"none:{index}"
+        self.baseline = record_checkpoints.snapshot(self.checkpoint_namespace) if incremental else None
+
+        # Records seen in more than one file of this case are only forwarded once
+        self.dedup = RecordDeduplicator()
+        self.stats = {"records_parsed": 0, "duplicates_suppressed": 0, "records_filtered": 0}
+        self.case_stats = CaseStats()
+
+        # Case filter rules (then the global ones) drop or sample noisy records before they are pushed;
+        # raises FilterSyntaxError for rules that don't compile
+        self.filter = RecordFilter(load_rules(filters or [], "case"))
+
+        # IOC list swept over every unique record while it is parsed; raises IOCListError for a bad list
+        self.ioc_matcher = IOCMatcher(parse_iocs(iocs)) if iocs and iocs.strip() else None
+        self.ioc_detections = []
+
+        # "chainsaw" hunts the EVTX files after ingest; "inline" matches compiled Sigma rules in the parse stage
+        self.detection_engine = detection_engine or DETECTION_ENGINE
+        if self.detection_engine not in ("chainsaw", "inline"):
+            raise ValueError(f"Unknown detection engine: {self.detection_engine}")
+        self.sigma_detections = []
+        self.inline_paths = set()
+
+        # Case correlation sequences (then the global ones) chaining detections into incidents;
+        # raises CorrelationRuleError for sequences that don't compile
+        self.sequences = load_sequences(sequences or [], "case") + GLOBAL_SEQUENCES
+
+        # Flattening / projection applied in the parse stage; raises KeyError for an unknown profile name
+        self.profile = IngestProfile(profile or INGEST_PROFILE)
+        self.stats["profile"] = self.profile.name
+        self.stats_lock = threading.Lock()
+        # Per-stage busy and wall time, reported under "stages" in the ingest stats
+        self.timer = StageTimer()
+        if not self.profile.is_raw:
+            self.stats.update({"bytes_raw": 0, "bytes_ingested": 0, "bytes_saved": 0})
+
+        self.session_id = session_id or new_session_id(case_name)
+        self.session_folder = os.path.join(OUTPUT_DIR, self.session_id)
+        # Per-session EVTX directory so Chainsaw only hunts this case's files
+        self.evtx_dir = os.path.join(UPLOAD_DIR, self.session_id)
+        os.makedirs(self.session_folder, exist_ok=True)
+        os.makedirs(self.evtx_dir, exist_ok=True)
+
+        self.progress = progress if progress is not None else {}
+        self.progress.setdefault("status", "uploading")
+        self.progress.setdefault("completed", 0)
+        self.progress.setdefault("total", 0)
+
+        # Process up to `concurrency` EVTX files at once to avoid Out Of Memory (OOM)
+        # and to substantially speed up parsing and Splunk HTTP deliveries.
+        self.sem = asyncio.Semaphore(concurrency)
+        self.processed = []
+        # Names already written to evtx_dir, so archive members never overwrite each other
+        self.used_names = set()
+
+        # Every destination gets the same parsed stream through its own bounded queue
+        sinks = []
+        for name in self.destinations:
+            if name == "splunk":
+                sinks.append(SplunkSink(self.splunk_url, self.splunk_token, index or "main", self.case_name))
+            elif name == "elasticsearch":
+                sinks.append(ElasticsearchSink(es_host, es_port, self.es_index))
+            elif name == "sqlite":
+                sinks.append(SQLiteSink(self.session_id))
+            else:
+                sinks.append(FileSink(os.path.join(self.session_folder, "events.ndjson")))
+        self.fanout = FanOut(sinks)
+
+    def evtx_path(self, filename: str) -> str:
+        """Path in evtx_dir for an uploaded file, renamed if an earlier file or archive member already has its name."""
+        return os.path.join(self.evtx_dir, unique_name(filename, self.used_names))
+
+    def reserve_name(self, filename: str) -> str:
+        """Claim a unique name for a file processed in place (its per-file JSON is named after it)."""
+        return unique_name(filename, self.used_names)
+
+    async def restore(self, result: dict):
+        """Take over a file processed by an earlier run of this session, as the batch CLI does on --resume."""
+        self.used_names.add(result["filename"].lower())
+        self.processed.append(result)
+        if self.dedup.mode == "off" or not os.path.exists(result["path"]):
+            return
+        # Its records seed de-duplication, so overlapping files processed after the resume are still suppressed
+        async with self.sem:
+            records = await asyncio.get_event_loop().run_in_executor(None, parse_evtx_to_json, result["path"], self.baseline)
+            await asyncio.get_event_loop().run_in_executor(None, self.dedup.filter, records)
+
+    def _parse(self, path: str) -> tuple[list[dict], int, int]:
+        """
+        Parse, de-duplicate, detect, sweep for IOCs, filter and project one file (runs in a worker thread).
+        Returns (records to push, parsed count, unique count before filtering).
+        """
+        with self.timer.stage("parse"):
+            records = parse_evtx_to_json(path, self.baseline)
+        parsed = len(records)
+        with self.timer.stage("dedup"):
+            records = self.dedup.filter(records)
+        unique = len(records)
+        # Counted before filtering, so the case summary describes everything that was collected
+        with self.timer.stage("case_stats"):
+            self.case_stats.update(records)
+        if self.detection_engine == "inline":
+            # The compiled rule set is loaded (or compiled and cached) by the first worker that needs it
+            with self.timer.stage("detect"):
+                detections = get_engine().detections(records, path)
+            with self.stats_lock:
+                self.sigma_detections += detections
+                self.inline_paths.add(path)
+        if self.ioc_matcher is not None:
+            # Swept before filtering and projection, like Chainsaw, and with the full nested record as evidence
+            with self.timer.stage("ioc"):
+                detections = self.ioc_matcher.detections(records, path)
+            if detections:
+                with self.stats_lock:
+                    self.ioc_detections += detections
+        with self.timer.stage("filter"):
+            records = self.filter.filter(records)
+        if not self.profile.is_raw:
+            bytes_raw = bytes_ingested = 0
+            projected = []
+            with self.timer.stage("project"):
+                for record in records:
+                    bytes_raw += len(json.dumps(record))
+                    record = self.profile.apply(record)
+                    bytes_ingested += len(json.dumps(record))
+                    projected.append(record)
+            records = projected
+            with self.stats_lock:
+                self.stats["bytes_raw"] += bytes_raw
+                self.stats["bytes_ingested"] += bytes_ingested
+                self.stats["bytes_saved"] += bytes_raw - bytes_ingested
+        return records, parsed, unique
+
+    async def process_evtx(self, filename: str, path: str) -> dict | None:
+        """Parse one EVTX file, keep its JSON for the session archive and queue it for every destination."""
+        async with self.sem:
+            logger.info(f"Indexing: {filename} (index: {self.index})")
+
+            try:
+                # Pass function directly instead of lambda for cleaner ThreadPool performance
+                json_records, parsed, unique = await asyncio.get_event_loop().run_in_executor(
+                    None,
+                    self._parse,
+                    path
+                )
+                duplicates = parsed - unique
+                filtered = unique - len(json_records)
+                self.stats["records_parsed"] += parsed
+                self.stats["duplicates_suppressed"] += duplicates
+                self.stats["records_filtered"] += filtered
+                if self.incremental:
+                    logger.info(f"{filename}: {parsed} new record(s) since last checkpoint")
+                if duplicates:
+                    logger.info(f"{filename}: suppressed {duplicates} duplicate record(s) already seen in this case")
+                if filtered:
+                    logger.info(f"{filename}: filter rules dropped {filtered} record(s)")
+
+                json_filename = filename + ".json"
+                json_path = os.path.join(self.session_folder, json_filename)
+                with self.timer.stage("write_json"):
+                    async with aiofiles.open(json_path, "w") as jf:
+                        await jf.write(json.dumps(json_records, indent=2))
+                # Sorted per file now, while the records are in memory, so timelines are a streaming merge later
+                with self.timer.stage("timeline"):
+                    await asyncio.get_event_loop().run_in_executor(
+                        None, write_file_timeline, self.session_id, filename, json_records
+                    )
+
+                logger.info(f"Parsed {filename}, pushing to {self.destination}...")
+
+                # Queued while holding the semaphore, so a full sink queue slows down parsing;
+                # the wait for delivery happens outside it and lets the next file start parsing
+                with self.timer.stage("queue"):
+                    deliveries = await self.fanout.put(json_records)
+
+            except Exception as e:
+                logger.exception(f"Error processing {filename}: {e}")
+                self.progress["completed"] += 1
+                return None
+
+        with self.timer.stage("deliver"):
+            delivered = bool(self.destinations) and all(await asyncio.gather(*deliveries))
+
+        # Only move the checkpoints once every destination accepted everything
+        if self.incremental and delivered:
+            record_checkpoints.advance(self.checkpoint_namespace, json_records, self.baseline)
+
+        self.progress["completed"] += 1
+        logger.info(f"Pushed: {filename}")
+        # "records" counts unique new records whether or not they were filtered: Chainsaw still hunts them
+        result = {"filename": filename, "path": path, "json_path": json_path,
+                  "records": unique, "duplicates": duplicates, "filtered": filtered}
+        self.processed.append(result)
+        return result
+
+    async def process_archive(self, fileobj, filename: str) -> list[dict]:
+        """Stream the EVTX members of a ZIP/tar.gz archive into the session, processing each one as soon as it is written."""
+        members = extract_evtx_members(fileobj, filename, self.evtx_dir, self.used_names)
+        tasks = []
+        try:
+            while True:
+                # Each member inflates in a worker thread while the ones before it are parsed and pushed
+                async with self.sem:
+                    member = await asyncio.get_event_loop().run_in_executor(None, next, members, None)
+                if member is None:
+                    break
+                if tasks:
+                    # The archive counted as one file; every further member adds one
+                    self.progress["total"] += 1
+                tasks.append(asyncio.create_task(self.process_evtx(*member)))
+        except ARCHIVE_ERRORS as e:
+            logger.error(f"Rejected archive {filename}: {e}")
+            if tasks:
+                logger.info(f"Keeping the {len(tasks)} member(s) of {filename} extracted before the error")
+
+        logger.info(f"Archive {filename} contains {len(tasks)} EVTX file(s)")
+        if not tasks:
+            self.progress["completed"] += 1
+            return []
+        results = await asyncio.gather(*tasks)
+        return [r for r in results if r]
+
+    async def flush(self):
+        """Wait until every destination has sent what was queued, then stop the sink workers."""
+        with self.timer.stage("flush"):
+            await self.fanout.drain()
+        self.stats["sinks"] = self.fanout.stats()
+
+    async def finalize(self, cleanup_delay: int | None = 300) -> dict | None:
+        """Zip the parsed JSON, run Chainsaw, push detections and write results.json. None if nothing was parsed."""
+        await self.flush()
+        if not self.processed:
+            return None
+
+        saved_files = [p["filename"] for p in self.processed]
+        evtx_paths = [p["path"] for p in self.processed]
+        json_files = [p["json_path"] for p in self.processed]
+
+        zip_name = f"{self.session_id}.zip"
+        zip_path = os.path.join(OUTPUT_DIR, zip_name)
+
+        with self.timer.stage("zip"), ZipFile(zip_path, "w") as zipf:
+            for json_file in json_files:
+                arcname = f"{self.session_id}/{os.path.basename(json_file)}"
+                zipf.write(json_file, arcname=arcname)
+
+        logger.info(f"ZIP created: {zip_path}")
+
+        self.progress["status"] = "chainsaw"
+        # Files whose every record was a duplicate (or already delivered) cannot add detections
+        hunt_paths = [p["path"] for p in self.processed if p.get("records", 1) > 0]
+        if self.detection_engine == "inline":
+            # Matched while parsing; only files restored from an earlier run of a resumed session still need a hunt
+            chainsaw_results = summarize_detections(self.sigma_detections)
+            hunt_paths = [p for p in hunt_paths if p not in self.inline_paths]
+            if hunt_paths:
+                logger.info(f"Running Chainsaw on {len(hunt_paths)} file(s) parsed by an earlier run...")
+                with self.timer.stage("hunt"):
+                    hunted = await asyncio.get_event_loop().run_in_executor(None, run_chainsaw, hunt_paths)
+                chainsaw_results = summarize_detections(self.sigma_detections + hunted.get("detections", []))
+        elif hunt_paths:
+            logger.info(f"Running Chainsaw analysis on {len(hunt_paths)} of {len(evtx_paths)} file(s)...")
+            # Hunt the session directory when every file lives there, otherwise the explicit file list
+            whole_dir = len(hunt_paths) == len(evtx_paths) and all(os.path.dirname(p) == self.evtx_dir for p in hunt_paths)
+            with self.timer.stage("hunt"):
+                chainsaw_results = await asyncio.get_event_loop().run_in_executor(
+                    None, run_chainsaw, self.evtx_dir if whole_dir else hunt_paths
+                )
+        else:
+            logger.info("No new records in this session, skipping Chainsaw")
+            chainsaw_results = summarize_detections([])
+        logger.info(f"{'Inline Sigma engine' if self.detection_engine == 'inline' else 'Chainsaw'} found {chainsaw_results['summary']['total']} detections")
+
+        if self.ioc_matcher is not None:
+            ioc_summary = self.ioc_matcher.summary()
+            self.stats["iocs"] = ioc_summary
+            logger.info(f"IOC sweep: {ioc_summary['hits']} hit(s) on {ioc_summary['matched_iocs']} of {ioc_summary['patterns']} IOC(s)")
+            if self.ioc_detections:
+                error = chainsaw_results["summary"].get("error")
+                chainsaw_results = summarize_detections(chainsaw_results.get("detections", []) + self.ioc_detections)
+                if error:
+                    chainsaw_results["summary"]["error"] = error
+
+        # The same record hunted from two copies of a log yields the same detection twice
+        seen = set()
+        detections = []
+        for det in chainsaw_results.get("detections", []):
+            key = (det.get("name", ""), record_identity(det.get("document", {}).get("data", {})))
+            if key not in seen:
+                seen.add(key)
+                detections.append(det)
+        if len(detections) != len(chainsaw_results.get("detections", [])):
+            logger.info(f"Suppressed {len(chainsaw_results['detections']) - len(detections)} duplicate detection(s)")
+            chainsaw_results = summarize_detections(detections)
+
+        if self.incremental and self.baseline:
+            # Chainsaw hunts whole files; drop detections on records that an earlier session already delivered
+            detections = []
+            for det in chainsaw_results.get("detections", []):
+                record = det.get("document", {}).get("data", {})
+                if record_id(record) > self.baseline.get(record_key(record), 0):
+                    detections.append(det)
+            logger.info(f"Incremental: kept {len(detections)} of {chainsaw_results['summary']['total']} detections")
+            chainsaw_results = summarize_detections(detections)
+
+        incidents = []
+        if self.sequences and chainsaw_results.get("detections"):
+            started = time.perf_counter()
+            with self.timer.stage("correlate"):
+                incidents = await asyncio.get_event_loop().run_in_executor(
+                    None, correlate, chainsaw_results["detections"], self.sequences
+                )
+            logger.info(f"Correlation: {len(incidents)} incident(s) from {len(chainsaw_results['detections'])} detections "
+                        f"and {len(self.sequences)} sequence(s) in {time.perf_counter() - started:.2f}s")
+        chainsaw_results["summary"]["incidents"] = len(incidents)
+
+        chainsaw_json_path = os.path.join(self.session_folder, "chainsaw_results.json")
+        async with aiofiles.open(chainsaw_json_path, "w") as cf:
+            await cf.write(json.dumps(chainsaw_results, indent=2))
+
+        with ZipFile(zip_path, "a") as zipf:
+            zipf.write(chainsaw_json_path, arcname=f"{self.session_id}/chainsaw_results.json")
+
+        if "splunk" in self.destinations and chainsaw_results.get("detections"):
+            with self.timer.stage("push_detections"):
+                await push_chainsaw_to_splunk(chainsaw_results["detections"], self.splunk_url, self.splunk_token, self.index or "main", source=self.case_name)
+
+        if cleanup_delay is not None:
+            cleanup_paths = [zip_path, self.session_folder, self.evtx_dir]
+            asyncio.create_task(delete_later(cleanup_paths, cleanup_delay))
+
+        case_stats = build_case_stats(self.session_id, self.case_name, self.case_stats, chainsaw_results.get("summary", {}))
+        await asyncio.get_event_loop().run_in_executor(None, save_case_stats, self.session_id, self.session_folder, case_stats)
+
+        response_data = {
+            "session_id": self.session_id,
+            "case_name": self.case_name,
+            "uploaded": saved_files,
+            "index": self.index,
+            "destination": self.destination,
+            "zip_url": f"/download/{zip_name}",
+            "chainsaw_url": f"/download/{self.session_id}/chainsaw_results.json",
+            "stats_url": f"/api/results/{self.session_id}/stats",
+            "timeline_url": f"/api/timeline/{self.session_id}",
+            "detections": chainsaw_results.get("detections", []),
+            "summary": chainsaw_results.get("summary", {}),
+            "incidents": incidents,
+            "ingest": self.stats,
+        }
+        if "file" in self.destinations:
+            response_data["events_url"] = f"/download/{self.session_id}/events.ndjson"
+        if "sqlite" in self.destinations:
+            response_data["search_url"] = f"/api/search?session_id={self.session_id}"
+        case_sequences = [seq.spec for seq in self.sequences if seq.scope == "case"]
+        if case_sequences:
+            response_data["sequences"] = case_sequences
+
+        if self.filter.rules:
+            self.stats["filters"] = self.filter.counters
+
+        if not self.profile.is_raw and self.stats["bytes_raw"]:
+            logger.info(f"Ingest profile '{self.profile.name}': {self.stats['bytes_ingested']} of {self.stats['bytes_raw']} bytes "
+                        f"({self.stats['bytes_saved'] * 100 // self.stats['bytes_raw']}% saved)")
+
+        # results.json gets the stages up to here; the response also covers the indexes built after it
+        self.stats["stages"] = self.timer.to_dict()
+        results_json_path = os.path.join(self.session_folder, "results.json")
+        async with aiofiles.open(results_json_path, "w") as rf:
+            await rf.write(json.dumps(response_data, indent=2))
+
+        with self.timer.stage("index"):
+            await asyncio.get_event_loop().run_in_executor(
+                None, write_detection_timeline, self.session_id, chainsaw_results.get("detections", [])
+            )
+
+            # Rule and host documents for relevance-ranked chat context
+            try:
+                await asyncio.get_event_loop().run_in_executor(
+                    None, build_vector_index, self.session_id, chainsaw_results.get("detections", []), case_stats
+                )
+            except Exception as e:
+                logger.error(f"Failed to build the context index for session {self.session_id}: {e}")
+
+            # Precompute rule groups, severity counts and host rollups for the paginated results API
+            await asyncio.get_event_loop().run_in_executor(
+                None, build_results_index, self.session_id, response_data
+            )
+        self.stats["stages"] = self.timer.to_dict()
+
+        # Mark fully complete
+        self.progress["status"] = "complete"
+        return response_data
@@ -0,0 +1,109 @@
+import os
+import json
+import logging
+
+from config import INGEST_PROFILES_FILE
+from services.evtx_parser import system_value
+
+logger = logging.getLogger("evtx_uploader")
+
+# System fields every projected record keeps: checkpoints, dedup, HEC time/host and Chainsaw rollups rely on them
+CORE_FIELDS = (
+    "Event.System.Computer",
+    "Event.System.Channel",
+    "Event.System.EventRecordID",
+    "Event.System.EventID",
+    "Event.System.TimeCreated.SystemTime",
+    "Event.System.Provider.Name",
+)
+
+# flatten: nested Event.* trees become dotted keys ("#attributes" / "#text" levels are folded into their parent)
+# drop_empty: null, "" and empty containers are removed
+# fields: optional allowlist of dotted keys per EventID ("*" applies to every other EventID); "prefix.*" keeps a subtree
+INGEST_PROFILES = {
+    "raw": {},
+    "flat": {"flatten": True, "drop_empty": True},
+    "compact": {
+        "flatten": True,
+        "drop_empty": True,
+        "fields": {
+            "*": [
+                "Event.System.Level",
+                "Event.System.Task",
+                "Event.System.Security.UserID",
+                "Event.EventData.*",
+                "Event.UserData.*",
+            ],
+        },
+    },
+}
+
+if INGEST_PROFILES_FILE and os.path.exists(INGEST_PROFILES_FILE):
+    try:
+        with open(INGEST_PROFILES_FILE, "r") as f:
+            INGEST_PROFILES.update(json.load(f))
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Ingest profiles file unreadable, using built-in profiles only: {e}")
+
+def _is_empty(value) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+def _flatten(value, prefix: str, out: dict, drop_empty: bool):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            if key in ("#attributes", "#text"):
+                _flatten(child, prefix, out, drop_empty)
+            else:
+                _flatten(child, f"{prefix}.{key}" if prefix else key, out, drop_empty)
+    elif isinstance(value, list):
+        items = [v for v in value if not (drop_empty and _is_empty(v))]
+        if items or not drop_empty:
+            out[prefix] = items
+    elif not (drop_empty and _is_empty(value)):
+        out[prefix] = value
+
+def _drop_empty(value):
+    if isinstance(value, dict):
+        cleaned = {k: _drop_empty(v) for k, v in value.items()}
+        return {k: v for k, v in cleaned.items() if not _is_empty(v)}
+    if isinstance(value, list):
+        return [v for v in (_drop_empty(v) for v in value) if not _is_empty(v)]
+    return value
+
+class IngestProfile:
+    """A named projection applied to every parsed record before it is stored or pushed."""
+
+    def __init__(self, name: str):
+        if name not in INGEST_PROFILES:
+            raise KeyError(f"Unknown ingest profile: {name}")
+        spec = INGEST_PROFILES[name]
+        self.name = name
+        self.flatten = spec.get("flatten", False)
+        self.drop_empty = spec.get("drop_empty", False)
+        # Allowlists work on dotted keys, so they imply flattening
+        self.fields = {}
+        for event_id, fields in spec.get("fields", {}).items():
+            exact = set(CORE_FIELDS) | {f for f in fields if not f.endswith(".*")}
+            prefixes = tuple(f[:-1] for f in fields if f.endswith(".*"))
+            self.fields[str(event_id)] = (exact, prefixes)
+        if self.fields:
+            self.flatten = True
+
+    @property
+    def is_raw(self) -> bool:
+        return not (self.flatten or self.drop_empty)
+
+    def apply(self, record: dict) -> dict:
+        if self.flatten:
+            flat = {}
+            _flatten(record, "", flat, self.drop_empty)
+            record = flat
+        elif self.drop_empty:
+            record = _drop_empty(record)
+
+        if self.fields:
+            allow = self.fields.get(str(system_value(record, "EventID"))) or self.fields.get("*")
+            if allow:
+                exact, prefixes = allow
+                record = {k: v for k, v in record.items() if k in exact or k.startswith(prefixes)}
+        return record
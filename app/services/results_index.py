@@ -0,0 +1,213 @@
+import os
+import json
+import logging
+
+from config import RESULTS_DIR
+
+logger = logging.getLogger("evtx_uploader")
+
+INDEX_FILENAME = "results_index.json"
+DETECTIONS_FILENAME = "detections.ndjson"
+
+SEVERITY_RANK = {"critical": 4, "high": 3, "medium": 2, "low": 1, "info": 0}
+
+# Column positions of the compact per-detection rows kept in the index
+ROW_OFFSET, ROW_LENGTH, ROW_NAME, ROW_LEVEL, ROW_TIMESTAMP, ROW_COMPUTER, ROW_CHANNEL, ROW_EVENT_ID = range(8)
+
+SORT_COLUMNS = {
+    "timestamp": ROW_TIMESTAMP,
+    "name": ROW_NAME,
+    "computer": ROW_COMPUTER,
+    "channel": ROW_CHANNEL,
+    "event_id": ROW_EVENT_ID,
+}
+
+# Loaded indexes keyed by session_id -> (mtime, index)
+_index_cache = {}
+_INDEX_CACHE_SIZE = 16
+
+def results_dir(session_id: str) -> str:
+    return os.path.join(RESULTS_DIR, session_id)
+
+def _detection_fields(det: dict) -> tuple:
+    """Pull the fields used for grouping and filtering out of a Chainsaw detection."""
+    system = (((det.get("document") or {}).get("data") or {}).get("Event") or {}).get("System") or {}
+    event_id = system.get("EventID", "")
+    if isinstance(event_id, dict):
+        event_id = event_id.get("#text", "")
+    return (
+        det.get("name", "Unknown Rule"),
+        det.get("level", "info"),
+        det.get("timestamp", "") or "",
+        system.get("Computer", "") or "",
+        system.get("Channel", "") or det.get("group", "") or "",
+        str(event_id),
+    )
+
+def build_results_index(session_id: str, results: dict) -> dict:
+    """Write detections as NDJSON plus a precomputed rule/severity/host index for the session."""
+    detections = results.get("detections", [])
+    folder = results_dir(session_id)
+    os.makedirs(folder, exist_ok=True)
+    detections_path = os.path.join(folder, DETECTIONS_FILENAME)
+    tmp_detections_path = detections_path + ".tmp"
+
+    rows = []
+    rules = {}
+    hosts = {}
+    by_severity = {}
+
+    with open(tmp_detections_path, "wb") as df:
+        offset = 0
+        for det in detections:
+            line = (json.dumps(det) + "\n").encode("utf-8")
+            df.write(line)
+            name, level, ts, computer, channel, event_id = _detection_fields(det)
+            rows.append([offset, len(line), name, level, ts, computer, channel, event_id])
+            offset += len(line)
+
+            by_severity[level] = by_severity.get(level, 0) + 1
+
+            rule = rules.get(name)
+            if rule is None:
+                rule = rules[name] = {"name": name, "level": level, "group": det.get("group", ""),
+                                      "count": 0, "first_seen": ts, "last_seen": ts, "hosts": set()}
+            rule["count"] += 1
+            if ts and (not rule["first_seen"] or ts < rule["first_seen"]):
+                rule["first_seen"] = ts
+            if ts > rule["last_seen"]:
+                rule["last_seen"] = ts
+            if computer:
+                rule["hosts"].add(computer)
+
+            host = hosts.get(computer)
+            if host is None:
+                host = hosts[computer] = {"computer": computer, "count": 0, "by_severity": {},
+                                          "first_seen": ts, "last_seen": ts, "rules": set()}
+            host["count"] += 1
+            host["by_severity"][level] = host["by_severity"].get(level, 0) + 1
+            if ts and (not host["first_seen"] or ts < host["first_seen"]):
+                host["first_seen"] = ts
+            if ts > host["last_seen"]:
+                host["last_seen"] = ts
+            host["rules"].add(name)
+
+    rule_list = sorted(rules.values(), key=lambda r: r["count"], reverse=True)
+    for rule in rule_list:
+        rule["hosts"] = sorted(rule["hosts"])
+    host_list = sorted(hosts.values(), key=lambda h: h["count"], reverse=True)
+    for host in host_list:
+        host["rule_count"] = len(host.pop("rules"))
+
+    meta = {k: v for k, v in results.items() if k != "detections"}
+    index = {
+        "meta": meta,
+        "summary": {"total": len(detections), "by_severity": by_severity},
+        "rules": rule_list,
+        "hosts": host_list,
+        "rows": rows,
+    }
+
+    # Both files are replaced whole, so a reader never sees a half-written index
+    os.replace(tmp_detections_path, detections_path)
+    index_path = os.path.join(folder, INDEX_FILENAME)
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+    logger.info(f"Results index built: {len(rows)} detections, {len(rule_list)} rules, {len(host_list)} hosts")
+    return index
+
+def load_results_index(session_id: str) -> dict | None:
+    """Load a session's results index, reusing the in-memory copy while the file is unchanged."""
+    if os.path.basename(session_id) != session_id:
+        return None
+    index_path = os.path.join(results_dir(session_id), INDEX_FILENAME)
+    try:
+        mtime = os.path.getmtime(index_path)
+    except OSError:
+        _index_cache.pop(session_id, None)
+        return None
+
+    cached = _index_cache.get(session_id)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(index_path, "r") as f:
+        index = json.load(f)
+    if len(_index_cache) >= _INDEX_CACHE_SIZE:
+        _index_cache.pop(next(iter(_index_cache)))
+    _index_cache[session_id] = (mtime, index)
+    return index
+
+def load_results(session_id: str) -> dict | None:
+    """A session's results as in results.json, rebuilt from its persistent index and detections."""
+    index = load_results_index(session_id)
+    if index is None:
+        return None
+    with open(os.path.join(results_dir(session_id), DETECTIONS_FILENAME), "r") as df:
+        detections = [json.loads(line) for line in df]
+    return {**index["meta"], "detections": detections}
+
+def query_detections(
+    session_id: str,
+    index: dict,
+    rule: str = None,
+    level: str = None,
+    computer: str = None,
+    channel: str = None,
+    event_id: str = None,
+    start: str = None,
+    end: str = None,
+    q: str = None,
+    sort: str = "timestamp",
+    order: str = "desc",
+    offset: int = 0,
+    limit: int = 50,
+) -> dict:
+    """Filter, sort and slice the indexed detections, reading only the selected ones from disk."""
+    rows = index.get("rows", [])
+    levels = set(level.split(",")) if level else None
+    needle = q.lower() if q else None
+
+    selected = []
+    for row in rows:
+        if rule is not None and row[ROW_NAME] != rule:
+            continue
+        if levels is not None and row[ROW_LEVEL] not in levels:
+            continue
+        if computer and computer.lower() not in row[ROW_COMPUTER].lower():
+            continue
+        if channel and row[ROW_CHANNEL] != channel:
+            continue
+        if event_id and row[ROW_EVENT_ID] != event_id:
+            continue
+        if start and row[ROW_TIMESTAMP] < start:
+            continue
+        if end and row[ROW_TIMESTAMP] > end:
+            continue
+        if needle and needle not in row[ROW_NAME].lower() and needle not in row[ROW_COMPUTER].lower():
+            continue
+        selected.append(row)
+
+    if sort == "level":
+        key = lambda r: SEVERITY_RANK.get(r[ROW_LEVEL], -1)
+    else:
+        column = SORT_COLUMNS.get(sort, ROW_TIMESTAMP)
+        key = lambda r: r[column]
+    selected.sort(key=key, reverse=(order != "asc"))
+
+    page = selected[offset:offset + limit]
+    detections = []
+    if page:
+        with open(os.path.join(results_dir(session_id), DETECTIONS_FILENAME), "rb") as df:
+            for row in page:
+                df.seek(row[ROW_OFFSET])
+                detections.append(json.loads(df.read(row[ROW_LENGTH])))
+
+    return {
+        "total": len(selected),
+        "offset": offset,
+        "limit": limit,
+        "detections": detections,
+    }
@@ -0,0 +1,662 @@
+import os
+import re
+import base64
+import pickle
+import hashlib
+import logging
+import ipaddress
+import threading
+
+import yaml
+
+from config import SIGMA_RULES_DIR, SIGMA_CACHE_FILE
+from services.evtx_parser import system_value
+
+logger = logging.getLogger("evtx_uploader")
+
+# Bumped whenever the compiled form changes, so stale caches are rebuilt
+ENGINE_VERSION = 2
+
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+SYSMON = "microsoft-windows-sysmon/operational"
+
+# Sigma logsource -> (channel, EventIDs or None for the whole channel), lowercased channel names
+SERVICES = {
+    "security": ("security", None),
+    "system": ("system", None),
+    "application": ("application", None),
+    "sysmon": (SYSMON, None),
+    "powershell": ("microsoft-windows-powershell/operational", None),
+    "powershell-classic": ("windows powershell", None),
+    "taskscheduler": ("microsoft-windows-taskscheduler/operational", None),
+    "wmi": ("microsoft-windows-wmi-activity/operational", None),
+    "windefend": ("microsoft-windows-windows defender/operational", None),
+    "bits-client": ("microsoft-windows-bits-client/operational", None),
+    "codeintegrity-operational": ("microsoft-windows-codeintegrity/operational", None),
+    "firewall-as": ("microsoft-windows-windows firewall with advanced security/firewall", None),
+    "dns-server": ("dns server", None),
+    "terminalservices-localsessionmanager": ("microsoft-windows-terminalservices-localsessionmanager/operational", None),
+    "ntlm": ("microsoft-windows-ntlm/operational", None),
+    "applocker": ("microsoft-windows-applocker/exe and dll", None),
+    "driver-framework": ("microsoft-windows-driverframeworks-usermode/operational", None),
+    "printservice-operational": ("microsoft-windows-printservice/operational", None),
+    "smbclient-security": ("microsoft-windows-smbclient/security", None),
+    "openssh": ("openssh/operational", None),
+    "ldap_debug": ("microsoft-windows-ldap-client/debug", None),
+}
+CATEGORIES = {
+    "process_creation": [(SYSMON, {1}), ("security", {4688})],
+    "network_connection": [(SYSMON, {3})],
+    "process_termination": [(SYSMON, {5})],
+    "driver_load": [(SYSMON, {6})],
+    "image_load": [(SYSMON, {7})],
+    "create_remote_thread": [(SYSMON, {8})],
+    "raw_access_thread": [(SYSMON, {9})],
+    "process_access": [(SYSMON, {10})],
+    "file_event": [(SYSMON, {11})],
+    "registry_add": [(SYSMON, {12})],
+    "registry_delete": [(SYSMON, {12})],
+    "registry_set": [(SYSMON, {13})],
+    "registry_rename": [(SYSMON, {14})],
+    "registry_event": [(SYSMON, {12, 13, 14})],
+    "create_stream_hash": [(SYSMON, {15})],
+    "pipe_created": [(SYSMON, {17, 18})],
+    "wmi_event": [(SYSMON, {19, 20, 21})],
+    "dns_query": [(SYSMON, {22})],
+    "file_delete": [(SYSMON, {23, 26})],
+    "clipboard_capture": [(SYSMON, {24})],
+    "process_tampering": [(SYSMON, {25})],
+    "file_block_executable": [(SYSMON, {27})],
+    "ps_module": [("microsoft-windows-powershell/operational", {4103})],
+    "ps_script": [("microsoft-windows-powershell/operational", {4104})],
+    "ps_classic_start": [("windows powershell", {400})],
+    "ps_classic_provider_start": [("windows powershell", {600})],
+}
+# Security 4688 names the Sysmon process_creation fields differently
+FIELD_ALIASES = {"NewProcessName": "Image", "ParentProcessName": "ParentImage"}
+SYSTEM_FIELDS = ("EventID", "Channel", "Computer", "Level", "Task", "Opcode", "Keywords")
+
+class UnsupportedRule(Exception):
+    """The rule uses a Sigma feature the inline engine does not implement; Chainsaw may still run it."""
+
+def record_fields(record: dict) -> dict:
+    """Sigma field name -> value: EventData / UserData fields plus the System fields rules refer to."""
+    event = record.get("Event") or {}
+    fields = {}
+    event_data = event.get("EventData")
+    if isinstance(event_data, dict):
+        fields.update(event_data)
+    user_data = event.get("UserData")
+    if isinstance(user_data, dict):
+        for inner in user_data.values():
+            if isinstance(inner, dict):
+                fields.update(inner)
+    for name, alias in FIELD_ALIASES.items():
+        if name in fields and alias not in fields:
+            fields[alias] = fields[name]
+    system = event.get("System") or {}
+    for name in SYSTEM_FIELDS:
+        value = system.get(name)
+        if isinstance(value, dict):
+            value = value.get("#text")
+        if value is not None:
+            fields[name] = value
+    provider = system.get("Provider")
+    if isinstance(provider, dict):
+        fields["Provider_Name"] = (provider.get("#attributes") or {}).get("Name")
+    return fields
+
+def _strings(value, out: list):
+    if isinstance(value, dict):
+        for child in value.values():
+            _strings(child, out)
+    elif isinstance(value, list):
+        for child in value:
+            _strings(child, out)
+    elif value is not None:
+        out.append(str(value))
+
+class _Context:
+    """One record being evaluated; lowercased values and the keyword text are computed at most once."""
+
+    __slots__ = ("record", "fields", "lowered", "text")
+
+    def __init__(self, record: dict):
+        self.record = record
+        self.fields = record_fields(record)
+        self.lowered = {}
+        self.text = None
+
+    def value(self, field: str, lower: bool):
+        if not lower:
+            value = self.fields.get(field)
+            return None if value is None else (value if isinstance(value, str) else str(value))
+        value = self.lowered.get(field)
+        if value is None and field not in self.lowered:
+            raw = self.fields.get(field)
+            value = self.lowered[field] = None if raw is None else str(raw).lower()
+        return value
+
+    def keyword_text(self) -> str:
+        if self.text is None:
+            values = []
+            _strings(self.record.get("Event"), values)
+            self.text = "\n".join(values).lower()
+        return self.text
+
+# --- values and modifiers --------------------------------------------------------------------------------------
+
+def _wildcard_regex(value: str) -> str | None:
+    """Regex for a Sigma value with unescaped * / ? wildcards, or None if it has none."""
+    out = []
+    wild = False
+    i = 0
+    while i < len(value):
+        ch = value[i]
+        if ch == "\\" and i + 1 < len(value) and value[i + 1] in "*?\\":
+            out.append(re.escape(value[i + 1]))
+            i += 2
+            continue
+        if ch == "*":
+            out.append(".*")
+            wild = True
+        elif ch == "?":
+            out.append(".")
+            wild = True
+        else:
+            out.append(re.escape(ch))
+        i += 1
+    return "".join(out) if wild else None
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\([*?\\])", r"\1", value)
+
+def _base64_offsets(value: bytes) -> list[str]:
+    """The three base64 renderings of value at any offset inside a longer encoded string."""
+    out = []
+    for i in range(3):
+        encoded = base64.b64encode(b" " * i + value).decode()
+        start = (0, 2, 3)[i]
+        end = (None, -3, -2)[(len(value) + i) % 3]
+        out.append(encoded[start:end])
+    return out
+
+def _windash(value: str) -> list[str]:
+    """Command-line flag variants: -flag, /flag and the unicode dashes."""
+    return sorted({value.replace("-", dash) for dash in ("-", "/", "–", "—", "―")}) if "-" in value else [value]
+
+_ENCODINGS = {"wide": "utf-16le", "utf16le": "utf-16le", "utf16be": "utf-16be", "utf16": "utf-16"}
+_OPS = {"contains", "startswith", "endswith"}
+_COMPARE = {"gt": lambda a, b: a > b, "gte": lambda a, b: a >= b, "lt": lambda a, b: a < b, "lte": lambda a, b: a <= b}
+
+class FieldMatch:
+    """One "field|modifiers: values" item of a selection."""
+
+    __slots__ = ("field", "kind", "values", "all", "lower", "regex", "null")
+
+    def __init__(self, key: str, values):
+        field, *modifiers = key.split("|")
+        self.field = field
+        self.all = "all" in modifiers
+        self.lower = "cased" not in modifiers
+        self.null = False
+        self.regex = None
+        values = values if isinstance(values, list) else [values]
+        known = _OPS | set(_COMPARE) | set(_ENCODINGS) | {"all", "cased", "re", "i", "m", "s", "base64", "base64offset",
+                                                          "windash", "cidr", "exists"}
+        unknown = [m for m in modifiers if m not in known]
+        if unknown:
+            raise UnsupportedRule(f"modifier {unknown[0]}")
+
+        if "exists" in modifiers:
+            self.kind, self.values = "exists", bool(values[0])
+            return
+        if "cidr" in modifiers:
+            self.kind, self.values = "cidr", [ipaddress.ip_network(str(v), strict=False) for v in values]
+            return
+        compare = [m for m in modifiers if m in _COMPARE]
+        if compare:
+            self.kind, self.values = compare[0], float(values[0])
+            return
+        if "re" in modifiers:
+            flags = (re.IGNORECASE if "i" in modifiers else 0) | (re.MULTILINE if "m" in modifiers else 0) | (re.DOTALL if "s" in modifiers else 0)
+            self.kind, self.lower = "re", False
+            self.values = [re.compile(str(v), flags) for v in values]
+            return
+
+        if any(v is None for v in values):
+            self.null = True
+            values = [v for v in values if v is not None]
+
+        # Transformations: windash, then encoding + base64 / base64offset
+        strings = [str(v).lower() if isinstance(v, bool) else str(v) for v in values]
+        if "windash" in modifiers:
+            strings = [variant for s in strings for variant in _windash(s)]
+        encoding = next((_ENCODINGS[m] for m in modifiers if m in _ENCODINGS), None)
+        if "base64" in modifiers or "base64offset" in modifiers:
+            encoded = []
+            for s in strings:
+                raw = _unescape(s).encode(encoding or "utf-8")
+                encoded += _base64_offsets(raw) if "base64offset" in modifiers else [base64.b64encode(raw).decode()]
+            # Base64 output is case-sensitive
+            strings, self.lower = [s.replace("\\", "\\\\").replace("*", "\\*").replace("?", "\\?") for s in encoded], False
+        elif encoding:
+            raise UnsupportedRule(f"encoding {encoding} without base64")
+
+        op = next((m for m in modifiers if m in _OPS), "equals")
+        if self.lower:
+            strings = [s.lower() for s in strings]
+        patterns = [_wildcard_regex(s) for s in strings]
+        if any(p is not None for p in patterns):
+            # Wildcards: one anchored regex per value, with the operator folded in
+            prefix = "" if op in ("equals", "startswith") else ".*"
+            suffix = "" if op in ("equals", "endswith") else ".*"
+            self.kind = "re"
+            self.values = [re.compile(f"^{prefix}{p if p is not None else re.escape(_unescape(s))}{suffix}$", re.DOTALL)
+                           for s, p in zip(strings, patterns)]
+            return
+        strings = [_unescape(s) for s in strings]
+        self.kind = op
+        self.values = frozenset(strings) if op == "equals" and not self.all else tuple(strings)
+
+    def event_ids(self) -> set[int] | None:
+        """EventIDs this item pins down, if it is a plain EventID equality."""
+        if self.field != "EventID" or self.kind != "equals" or self.all or self.null:
+            return None
+        try:
+            return {int(v) for v in self.values}
+        except ValueError:
+            return None
+
+    def match(self, ctx: _Context) -> bool:
+        kind = self.kind
+        if not self.field:
+            value = ctx.keyword_text()
+        else:
+            value = ctx.value(self.field, self.lower)
+        if kind == "exists":
+            return (value is not None) == self.values
+        if value is None or value == "":
+            return self.null or (value == "" and kind == "equals" and "" in self.values)
+        if kind == "equals":
+            return value in self.values if not self.all else all(value == v for v in self.values)
+        if kind == "contains":
+            check = (v in value for v in self.values)
+        elif kind == "startswith":
+            check = (value.startswith(v) for v in self.values)
+        elif kind == "endswith":
+            check = (value.endswith(v) for v in self.values)
+        elif kind == "re":
+            check = (v.search(value) for v in self.values)
+        elif kind == "cidr":
+            try:
+                address = ipaddress.ip_address(value)
+            except ValueError:
+                return False
+            check = (address in net for net in self.values)
+        else:
+            try:
+                return _COMPARE[kind](float(value), self.values)
+            except ValueError:
+                return False
+        return all(check) if self.all else any(check)
+
+# --- selections and conditions ---------------------------------------------------------------------------------
+
+class Selection:
+    """A named detection item: OR over alternatives, each an AND of field matches."""
+
+    __slots__ = ("alternatives",)
+
+    def __init__(self, definition):
+        if isinstance(definition, dict):
+            self.alternatives = [self._items(definition)]
+        elif isinstance(definition, list) and all(isinstance(d, dict) for d in definition):
+            self.alternatives = [self._items(d) for d in definition]
+        elif isinstance(definition, list):
+            # Plain keywords: any of them anywhere in the record
+            self.alternatives = [[FieldMatch("|contains", [str(v) for v in definition])]]
+        else:
+            self.alternatives = [[FieldMatch("|contains", [str(definition)])]]
+
+    @staticmethod
+    def _items(definition: dict) -> list[FieldMatch]:
+        return [FieldMatch(key, value) for key, value in definition.items()]
+
+    def event_ids(self) -> set[int] | None:
+        ids = set()
+        for items in self.alternatives:
+            pinned = next((e for e in (item.event_ids() for item in items) if e is not None), None)
+            if pinned is None:
+                return None
+            ids |= pinned
+        return ids
+
+    def match(self, ctx: _Context) -> bool:
+        for items in self.alternatives:
+            for item in items:
+                if not item.match(ctx):
+                    break
+            else:
+                return True
+        return False
+
+class _Ref:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+class Condition:
+    """Boolean tree over selections: ("and", [..]), ("or", [..]), ("not", node) or a selection name."""
+
+    _TOKEN_RE = re.compile(r"\s*(\(|\)|[\w*.-]+)")
+
+    def __init__(self, expression: str, selections: dict):
+        if "|" in expression:
+            raise UnsupportedRule("aggregation in condition")
+        self.selections = selections
+        self.tokens = []
+        pos = 0
+        expression = expression.strip()
+        while pos < len(expression):
+            match = self._TOKEN_RE.match(expression, pos)
+            if not match:
+                raise UnsupportedRule(f"condition syntax near {expression[pos:pos + 20]!r}")
+            self.tokens.append(match.group(1))
+            pos = match.end()
+        self.pos = 0
+        self.tree = self._or()
+        if self.pos != len(self.tokens):
+            raise UnsupportedRule(f"trailing condition tokens {self.tokens[self.pos:]}")
+        del self.tokens, self.pos
+
+    def _peek(self):
+        return self.tokens[self.pos].lower() if self.pos < len(self.tokens) else None
+
+    def _next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def _or(self):
+        nodes = [self._and()]
+        while self._peek() == "or":
+            self._next()
+            nodes.append(self._and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def _and(self):
+        nodes = [self._not()]
+        while self._peek() == "and":
+            self._next()
+            nodes.append(self._not())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def _not(self):
+        if self._peek() == "not":
+            self._next()
+            return ("not", self._not())
+        return self._atom()
+
+    def _atom(self):
+        token = self._peek()
+        if token is None:
+            raise UnsupportedRule("condition ends early")
+        if token == "(":
+            self._next()
+            node = self._or()
+            if self._peek() != ")":
+                raise UnsupportedRule("unbalanced parentheses")
+            self._next()
+            return node
+        if token in ("1", "all", "any") and self.pos + 1 < len(self.tokens) and self.tokens[self.pos + 1].lower() == "of":
+            quantifier = self._next().lower()
+            self._next()
+            pattern = self._next()
+            if pattern.lower() == "them":
+                names = [n for n in self.selections if not n.startswith("_")]
+            else:
+                regex = re.compile("^" + re.escape(pattern).replace(r"\*", ".*") + "$")
+                names = [n for n in self.selections if regex.match(n)]
+            if not names:
+                raise UnsupportedRule(f"no selection matches {pattern}")
+            return ("and" if quantifier == "all" else "or", [_Ref(n) for n in names])
+        name = self._next()
+        if name not in self.selections:
+            raise UnsupportedRule(f"unknown selection {name}")
+        return _Ref(name)
+
+    def match(self, ctx: _Context, node=None) -> bool:
+        node = self.tree if node is None else node
+        if isinstance(node, _Ref):
+            return self.selections[node.name].match(ctx)
+        op, children = node
+        if op == "not":
+            return not self.match(ctx, children)
+        if op == "and":
+            return all(self.match(ctx, child) for child in children)
+        return any(self.match(ctx, child) for child in children)
+
+    def event_ids(self, node=None) -> set[int] | None:
+        """EventIDs a record must have to satisfy the condition, or None if it does not pin them."""
+        node = self.tree if node is None else node
+        if isinstance(node, _Ref):
+            return self.selections[node.name].event_ids()
+        op, children = node
+        if op == "not":
+            return None
+        sets = [self.event_ids(child) for child in children]
+        if op == "and":
+            pinned = [s for s in sets if s is not None]
+            if not pinned:
+                return None
+            result = pinned[0]
+            for s in pinned[1:]:
+                result = result & s
+            return result
+        if any(s is None for s in sets):
+            return None
+        return set().union(*sets)
+
+class SigmaRule:
+    """One compiled Sigma rule and the (channel, EventIDs) it applies to."""
+
+    def __init__(self, doc: dict, path: str):
+        self.id = doc.get("id", "")
+        self.title = doc.get("title") or os.path.basename(path)
+        self.description = doc.get("description", "")
+        self.level = doc.get("level", "informational")
+        self.status = doc.get("status", "")
+        self.tags = doc.get("tags") or []
+        self.author = doc.get("author", "")
+        self.path = path
+        logsource = doc.get("logsource") or {}
+        detection = dict(doc.get("detection") or {})
+        condition = detection.pop("condition", None)
+        detection.pop("timeframe", None)
+        if condition is None or not detection:
+            raise UnsupportedRule("no detection")
+        if logsource.get("product", "windows") != "windows":
+            raise UnsupportedRule(f"product {logsource.get('product')}")
+        selections = {name: Selection(definition) for name, definition in detection.items()}
+        conditions = condition if isinstance(condition, list) else [condition]
+        self.conditions = [Condition(str(c), selections) for c in conditions]
+
+        if logsource.get("category"):
+            targets = CATEGORIES.get(logsource["category"])
+            if targets is None:
+                raise UnsupportedRule(f"category {logsource['category']}")
+        elif logsource.get("service"):
+            if logsource["service"] not in SERVICES:
+                raise UnsupportedRule(f"service {logsource['service']}")
+            targets = [SERVICES[logsource["service"]]]
+        else:
+            targets = [(None, None)]
+
+        # Narrow each target by the EventIDs the condition requires, so records of other EventIDs never see the rule
+        pinned = set()
+        for c in self.conditions:
+            ids = c.event_ids()
+            if ids is None:
+                pinned = None
+                break
+            pinned |= ids
+        self.keys = []
+        for channel, event_ids in targets:
+            if event_ids is None:
+                ids = pinned
+            elif pinned is None:
+                ids = event_ids
+            else:
+                ids = event_ids & pinned
+            if ids is None:
+                self.keys.append((channel, None))
+            else:
+                self.keys += [(channel, event_id) for event_id in sorted(ids)]
+
+    def match(self, ctx: _Context) -> bool:
+        return any(c.match(ctx) for c in self.conditions)
+
+    def detection(self, record: dict, path: str) -> dict:
+        """Shaped like a Chainsaw hunt hit, so the results pipeline treats both alike."""
+        return {
+            "group": "Sigma",
+            "kind": "individual",
+            "name": self.title,
+            "id": self.id,
+            "description": self.description,
+            "level": self.level,
+            "status": self.status,
+            "tags": self.tags,
+            "authors": [a.strip() for a in str(self.author).split(",") if a.strip()],
+            "source": "sigma",
+            "timestamp": system_value(record, "TimeCreated.SystemTime") or "",
+            "document": {"kind": "evtx", "path": path, "data": record},
+        }
+
+# --- rule set --------------------------------------------------------------------------------------------------
+
+def _rule_files(rules_dir: str) -> list[str]:
+    paths = []
+    for root, dirs, files in os.walk(rules_dir):
+        dirs.sort()
+        paths += [os.path.join(root, name) for name in sorted(files) if name.endswith((".yml", ".yaml"))]
+    return paths
+
+def _fingerprint(paths: list[str]) -> str:
+    digest = hashlib.sha1(f"v{ENGINE_VERSION}".encode())
+    for path in paths:
+        st = os.stat(path)
+        digest.update(f"{path}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+class SigmaEngine:
+    """
+    Sigma rules compiled once into matcher objects and indexed by (channel, EventID), so each record is only
+    checked against the rules that can apply to it. The compiled set is pickled to SIGMA_CACHE_FILE and reused
+    until a rule file changes.
+    """
+
+    def __init__(self, rules: list[SigmaRule], skipped: dict):
+        self.rules = rules
+        self.skipped = skipped
+        self.index = {}
+        for rule in rules:
+            for key in rule.keys:
+                self.index.setdefault(key, []).append(rule)
+        self._candidates = {}
+
+    @classmethod
+    def compile(cls, rules_dir: str) -> "SigmaEngine":
+        rules = []
+        skipped = {}
+        for path in _rule_files(rules_dir):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    docs = [d for d in yaml.load_all(f, Loader=_Loader) if d]
+                if len(docs) != 1 or "correlation" in docs[0]:
+                    raise UnsupportedRule("multi-document or correlation rule")
+                if docs[0].get("status") in ("deprecated", "unsupported"):
+                    raise UnsupportedRule(f"status {docs[0]['status']}")
+                rules.append(SigmaRule(docs[0], path))
+            except UnsupportedRule as e:
+                reason = str(e).split(" ")[0]
+                skipped[reason] = skipped.get(reason, 0) + 1
+            except (yaml.YAMLError, re.error, ValueError, TypeError, AttributeError, OSError) as e:
+                logger.debug(f"Sigma rule {path} not compiled: {e}")
+                skipped["invalid"] = skipped.get("invalid", 0) + 1
+        return cls(rules, skipped)
+
+    @classmethod
+    def load(cls, rules_dir: str = SIGMA_RULES_DIR, cache_file: str = SIGMA_CACHE_FILE) -> "SigmaEngine":
+        """The cached compiled rule set if it still matches the rule files, else a fresh compile (then cached)."""
+        paths = _rule_files(rules_dir) if os.path.isdir(rules_dir) else []
+        fingerprint = _fingerprint(paths)
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file, "rb") as f:
+                    cached = pickle.load(f)
+                if cached.get("fingerprint") == fingerprint:
+                    logger.info(f"Loaded {len(cached['engine'].rules)} compiled Sigma rule(s) from {cache_file}")
+                    return cached["engine"]
+            except Exception as e:
+                logger.warning(f"Sigma rule cache unreadable, recompiling: {e}")
+
+        engine = cls.compile(rules_dir)
+        logger.info(f"Compiled {len(engine.rules)} Sigma rule(s) from {rules_dir}; skipped {engine.skipped}")
+        if cache_file:
+            tmp_path = cache_file + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"fingerprint": fingerprint, "engine": engine}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_file)
+        return engine
+
+    def __getstate__(self):
+        return {"rules": self.rules, "skipped": self.skipped}
+
+    def __setstate__(self, state):
+        self.__init__(state["rules"], state["skipped"])
+
+    def candidates(self, channel: str, event_id) -> list[SigmaRule]:
+        key = (channel, event_id)
+        rules = self._candidates.get(key)
+        if rules is None:
+            rules = []
+            for k in ((channel, event_id), (channel, None), (None, event_id), (None, None)):
+                rules += self.index.get(k, [])
+            self._candidates[key] = rules
+        return rules
+
+    def detections(self, records: list[dict], path: str = None) -> list[dict]:
+        hits = []
+        for record in records:
+            system = (record.get("Event") or {}).get("System") or {}
+            channel = str(system.get("Channel") or "").lower()
+            event_id = system.get("EventID")
+            if isinstance(event_id, dict):
+                event_id = event_id.get("#text")
+            try:
+                event_id = int(event_id)
+            except (TypeError, ValueError):
+                event_id = None
+            rules = self.candidates(channel, event_id)
+            if not rules:
+                continue
+            ctx = _Context(record)
+            for rule in rules:
+                if rule.match(ctx):
+                    hits.append(rule.detection(record, path))
+        return hits
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> SigmaEngine:
+    """The process-wide rule set, loaded on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = SigmaEngine.load()
+        return _engine
@@ -0,0 +1,190 @@
+import json
+import time
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+
+import aiofiles
+
+from config import SINK_BATCH_SIZE, SINK_QUEUE_BATCHES, SINK_WORKERS
+from services.elasticsearch import push_to_elasticsearch
+from services.splunk import push_to_splunk, new_hec_client
+from services.event_store import EventStore
+
+logger = logging.getLogger("evtx_uploader")
+
+DESTINATIONS = ("splunk", "elasticsearch", "file", "sqlite")
+
+def parse_destinations(destination: str) -> list[str]:
+    """'splunk,file' -> ['splunk', 'file']; 'none' or '' -> []. Raises ValueError for unknown names."""
+    names = []
+    for name in (destination or "").replace("+", ",").split(","):
+        name = name.strip().lower()
+        if not name or name == "none" or name in names:
+            continue
+        if name not in DESTINATIONS:
+            raise ValueError(f"Unknown destination: {name}")
+        names.append(name)
+    return names
+
+class Sink(ABC):
+    """
+    One destination fed through its own bounded queue of record batches. `workers` consumer tasks drain the
+    queue, so a slow destination only fills (and then throttles on) its own queue while the others keep sending.
+    """
+
+    name = "sink"
+
+    def __init__(self, workers: int = SINK_WORKERS):
+        self.queue = asyncio.Queue(maxsize=SINK_QUEUE_BATCHES)
+        self.workers = workers
+        self.tasks = []
+        self.stats = {"records": 0, "batches": 0, "failed_batches": 0, "busy_seconds": 0.0,
+                      "wait_seconds": 0.0, "max_queue": 0}
+
+    @abstractmethod
+    async def send(self, records: list[dict]) -> bool:
+        """Deliver one batch; True if the destination accepted all of it."""
+
+    async def close(self):
+        pass
+
+    def start(self):
+        if not self.tasks:
+            self.tasks = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+
+    async def _consume(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            records, done = item
+            started = time.perf_counter()
+            try:
+                ok = await self.send(records)
+            except Exception as e:
+                logger.error(f"{self.name} sink failed: {e}")
+                ok = False
+            self.stats["busy_seconds"] += time.perf_counter() - started
+            self.stats["batches"] += 1
+            if ok:
+                self.stats["records"] += len(records)
+            else:
+                self.stats["failed_batches"] += 1
+            if not done.done():
+                done.set_result(ok)
+            self.queue.task_done()
+
+    async def put(self, records: list[dict]) -> asyncio.Future:
+        """Queue a batch; waits while this sink's queue is full. The returned future resolves to delivery success."""
+        self.start()
+        done = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        await self.queue.put((records, done))
+        self.stats["wait_seconds"] += time.perf_counter() - started
+        self.stats["max_queue"] = max(self.stats["max_queue"], self.queue.qsize())
+        return done
+
+    async def drain(self):
+        """Flush the queue and stop the consumer."""
+        if self.tasks:
+            for _ in self.tasks:
+                await self.queue.put(None)
+            await asyncio.gather(*self.tasks)
+            self.tasks = []
+        await self.close()
+
+class SplunkSink(Sink):
+    name = "splunk"
+
+    def __init__(self, url: str, token: str, index: str, source: str):
+        super().__init__()
+        self.url, self.token, self.index, self.source = url, token, index, source
+        self.client = None
+
+    async def send(self, records: list[dict]) -> bool:
+        if self.client is None:
+            # One pooled client for the sink's lifetime, shared by its workers
+            self.client = new_hec_client()
+        return await push_to_splunk(records, self.url, self.token, self.index, source=self.source, client=self.client)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+class ElasticsearchSink(Sink):
+    name = "elasticsearch"
+
+    def __init__(self, host: str, port: int, index: str):
+        super().__init__()
+        self.host, self.port, self.index = host, port, index
+
+    async def send(self, records: list[dict]) -> bool:
+        return await push_to_elasticsearch(records, self.host, self.port, self.index)
+
+class FileSink(Sink):
+    """Appends records as NDJSON to a local file, e.g. the session's events.ndjson."""
+
+    name = "file"
+
+    def __init__(self, path: str):
+        # A single writer keeps batches whole and in order
+        super().__init__(workers=1)
+        self.path = path
+        self.file = None
+
+    async def send(self, records: list[dict]) -> bool:
+        if self.file is None:
+            self.file = await aiofiles.open(self.path, "a")
+        await self.file.write("".join(json.dumps(record) + "\n" for record in records))
+        return True
+
+    async def close(self):
+        if self.file is not None:
+            await self.file.close()
+            self.file = None
+
+class SQLiteSink(Sink):
+    """Writes records into the session's embedded SQLite/FTS5 store, queryable through /api/search."""
+
+    name = "sqlite"
+
+    def __init__(self, session_id: str):
+        # SQLite has a single writer anyway
+        super().__init__(workers=1)
+        self.session_id = session_id
+        self.store = None
+
+    async def send(self, records: list[dict]) -> bool:
+        if self.store is None:
+            self.store = await asyncio.to_thread(EventStore, self.session_id)
+        await asyncio.to_thread(self.store.add, records)
+        return True
+
+    async def close(self):
+        if self.store is not None:
+            await asyncio.to_thread(self.store.close)
+            self.store = None
+
+class FanOut:
+    """Feeds one parsed record stream to every sink, in SINK_BATCH_SIZE batches."""
+
+    def __init__(self, sinks: list[Sink]):
+        self.sinks = sinks
+
+    async def put(self, records: list[dict]) -> list[asyncio.Future]:
+        """Queue records on every sink; returns the delivery futures. Only waits while some sink's queue is full."""
+        futures = []
+        for start in range(0, len(records), SINK_BATCH_SIZE):
+            batch = records[start:start + SINK_BATCH_SIZE]
+            futures += await asyncio.gather(*(sink.put(batch) for sink in self.sinks))
+        return futures
+
+    async def drain(self):
+        await asyncio.gather(*(sink.drain() for sink in self.sinks))
+
+    def stats(self) -> dict:
+        return {sink.name: {k: round(v, 3) if isinstance(v, float) else v for k, v in sink.stats.items()}
+                for sink in self.sinks}
@@ -4,12 +4,17 @@ import logging
 
 import asyncio
 
+from services.evtx_parser import record_time, record_host
+
 logger = logging.getLogger("evtx_uploader")
 
-async def _send_batch(client: httpx.AsyncClient, batch_str: str, url: str, token: str):
-    """Helper function to send a single stringified JSON payload batch to Splunk HEC."""
+def new_hec_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(verify=False, limits=httpx.Limits(max_connections=20))
+
+async def _send_batch(client: httpx.AsyncClient, batch_str: str, url: str, token: str) -> bool:
+    """Helper function to send a single stringified JSON payload batch to Splunk HEC. Returns False on failure."""
     if not batch_str:
-        return
+        return True
     try:
         resp = await client.post(
             url,
@@ -18,11 +23,17 @@ async def _send_batch(client: httpx.AsyncClient, batch_str: str, url: str, token
             timeout=45.0
         )
         resp.raise_for_status()
+        return True
     except Exception as e:
         logger.error(f"Failed to push batch to Splunk HEC: {e}")
+        return False
 
-async def push_to_splunk(records: list[dict], url: str, token: str, index: str, source: str = "evtxorcist"):
-    """Push raw EVTX records to Splunk HEC in asynchronous batches of 5000 to maximize throughput."""
+async def push_to_splunk(records: list[dict], url: str, token: str, index: str, source: str = "evtxorcist",
+                         client: httpx.AsyncClient = None) -> bool:
+    """
+    Push raw EVTX records to Splunk HEC in asynchronous batches of 5000 to maximize throughput. True if every batch
+    was accepted. Sends through `client` when given, otherwise through a client of its own.
+    """
     BATCH_SIZE = 5000
     
     # Break records apart into batches
@@ -37,6 +48,13 @@ async def push_to_splunk(records: list[dict], url: str, token: str, index: str,
             "source": source,
             "event": record
         }
+        # Index at the event's own time and host so Splunk can prune buckets on time-bounded searches
+        event_time = record_time(record)
+        if event_time is not None:
+            payload["time"] = event_time
+        host = record_host(record)
+        if host:
+            payload["host"] = host
         current_batch += json.dumps(payload) + "\n"
         count += 1
         
@@ -49,12 +67,14 @@ async def push_to_splunk(records: list[dict], url: str, token: str, index: str,
         batches.append(current_batch)
 
     # Fire off all batches simultaneously using HTTPX connection pooling
-    async with httpx.AsyncClient(verify=False, limits=httpx.Limits(max_connections=20)) as client:
+    if client is not None:
+        return all(await asyncio.gather(*(_send_batch(client, batch, url, token) for batch in batches)))
+    async with new_hec_client() as client:
         tasks = [_send_batch(client, batch, url, token) for batch in batches]
-        await asyncio.gather(*tasks)
+        return all(await asyncio.gather(*tasks))
 
-async def push_chainsaw_to_splunk(detections: list[dict], url: str, token: str, index: str, source: str = "evtxorcist"):
-    """Push Chainsaw detection results to Splunk with sourcetype 'chainsaw'."""
+async def push_chainsaw_to_splunk(detections: list[dict], url: str, token: str, index: str, source: str = "evtxorcist") -> bool:
+    """Push Chainsaw detection results to Splunk with sourcetype 'chainsaw'. True if they were accepted."""
     batch_data = ""
     for det in detections:
         payload = {
@@ -63,6 +83,13 @@ async def push_chainsaw_to_splunk(detections: list[dict], url: str, token: str,
             "source": source,
             "event": det
         }
+        document = det.get("document", {}).get("data", {})
+        event_time = record_time(document)
+        if event_time is not None:
+            payload["time"] = event_time
+        host = record_host(document)
+        if host:
+            payload["host"] = host
         batch_data += json.dumps(payload) + "\n"
     
     if batch_data:
@@ -77,3 +104,5 @@ async def push_chainsaw_to_splunk(detections: list[dict], url: str, token: str,
                 resp.raise_for_status()
             except Exception as e:
                 logger.error(f"Failed to push Chainsaw to Splunk HEC: {e}")
+                return False
+    return True
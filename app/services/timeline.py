@@ -0,0 +1,140 @@
+import io
+import os
+import csv
+import json
+import heapq
+import logging
+
+from config import TIMELINE_DIR
+from services.evtx_parser import system_value, record_id, record_time, record_host
+
+logger = logging.getLogger("evtx_uploader")
+
+TIMELINE_SUFFIX = ".timeline.ndjson"
+DETECTIONS_TIMELINE = "detections" + TIMELINE_SUFFIX
+CSV_COLUMNS = ("timestamp", "type", "host", "channel", "event_id", "record_id", "source", "level", "rule", "details")
+# The "details" column keeps the first EventData fields, each cut to a readable length
+MAX_DETAIL_FIELDS = 12
+MAX_DETAIL_CHARS = 200
+
+def timeline_dir(session_id: str) -> str:
+    return os.path.join(TIMELINE_DIR, session_id)
+
+def _data_pairs(record: dict) -> list[tuple[str, object]]:
+    """EventData / UserData fields of a nested or profile-flattened record."""
+    event = record.get("Event")
+    if isinstance(event, dict):
+        data = event.get("EventData")
+        if not isinstance(data, dict):
+            user_data = event.get("UserData")
+            data = next((v for v in user_data.values() if isinstance(v, dict)), None) if isinstance(user_data, dict) else None
+        return list(data.items()) if isinstance(data, dict) else []
+    pairs = []
+    for key, value in record.items():
+        for prefix in ("Event.EventData.", "Event.UserData."):
+            if key.startswith(prefix):
+                pairs.append((key[len(prefix):].rsplit(".", 1)[-1], value))
+    return pairs
+
+def _details(record: dict) -> str:
+    parts = []
+    for key, value in _data_pairs(record):
+        if value is None or value == "" or value == "-" or isinstance(value, (dict, list)):
+            continue
+        value = str(value).replace("\r", " ").replace("\n", " ")
+        parts.append(f"{key}={value[:MAX_DETAIL_CHARS]}")
+        if len(parts) == MAX_DETAIL_FIELDS:
+            break
+    return "; ".join(parts)
+
+def _row(record: dict, t: float, kind: str, source: str) -> dict:
+    return {
+        "t": t,
+        "timestamp": str(system_value(record, "TimeCreated.SystemTime") or ""),
+        "type": kind,
+        "host": record_host(record) or "",
+        "channel": system_value(record, "Channel") or "",
+        "event_id": system_value(record, "EventID"),
+        "record_id": record_id(record) or None,
+        "source": source,
+    }
+
+def _write(path: str, rows: list[dict]):
+    rows.sort(key=lambda r: r["t"])
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.writelines(json.dumps(row) + "\n" for row in rows)
+    os.replace(tmp_path, path)
+
+def write_file_timeline(session_id: str, filename: str, records: list[dict]):
+    """Time-sorted compact rows of one parsed file; records without a timestamp can't be placed and are left out."""
+    rows = []
+    for record in records:
+        t = record_time(record)
+        if t is not None:
+            row = _row(record, t, "event", filename)
+            row["details"] = _details(record)
+            rows.append(row)
+    os.makedirs(timeline_dir(session_id), exist_ok=True)
+    _write(os.path.join(timeline_dir(session_id), filename + TIMELINE_SUFFIX), rows)
+
+def write_detection_timeline(session_id: str, detections: list[dict]):
+    rows = []
+    for det in detections:
+        record = (det.get("document") or {}).get("data") or {}
+        t = record_time(record)
+        if t is not None:
+            row = _row(record, t, "detection", det.get("group", ""))
+            row["level"] = det.get("level", "")
+            row["rule"] = det.get("name", "")
+            rows.append(row)
+    os.makedirs(timeline_dir(session_id), exist_ok=True)
+    _write(os.path.join(timeline_dir(session_id), DETECTIONS_TIMELINE), rows)
+
+def _stream(path: str, host: str = None, start: float = None, end: float = None):
+    """
+    Rows of one time-sorted timeline file, read line by line; stops at the first row past `end`.
+    A short host name also matches its FQDN (CLIENT02 -> client02.corp.local).
+    """
+    with open(path, "r") as f:
+        for line in f:
+            row = json.loads(line)
+            if start is not None and row["t"] < start:
+                continue
+            if end is not None and row["t"] > end:
+                return
+            if host and row["host"].lower() != host and not row["host"].lower().startswith(host + "."):
+                continue
+            yield row
+
+def build_timeline(session_id: str, host: str = None, start: float = None, end: float = None,
+                   events: bool = True, detections: bool = True):
+    """
+    K-way merge of every per-file timeline (and the detections) of a session by event time. Holds one row per
+    file in memory, whatever the size of the case. None if the session has no timeline.
+    """
+    folder = timeline_dir(session_id)
+    if not os.path.isdir(folder):
+        return None
+    names = sorted(n for n in os.listdir(folder) if n.endswith(TIMELINE_SUFFIX))
+    paths = [os.path.join(folder, n) for n in names if (n == DETECTIONS_TIMELINE and detections) or (n != DETECTIONS_TIMELINE and events)]
+    host = host.lower() if host else None
+    return heapq.merge(*(_stream(p, host, start, end) for p in paths), key=lambda r: r["t"])
+
+def format_ndjson(rows):
+    for row in rows:
+        row.pop("t", None)
+        yield json.dumps(row) + "\n"
+
+def format_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    for n, row in enumerate(rows, 1):
+        writer.writerow(row)
+        # Flush in blocks so the response streams without one write per row
+        if n % 1000 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
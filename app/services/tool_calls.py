@@ -0,0 +1,156 @@
+import re
+import json
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger("evtx_uploader")
+
+_FENCED_RE = re.compile(r'```(?:json)?\n(.*?)\n```', re.DOTALL)
+_FUNC_RE = re.compile(r'(\w+)\(\s*((?:\w+\s*=\s*(?:"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')(?:\s*,\s*)?)+)\s*\)')
+_KV_RE = re.compile(r'(\w+)\s*=\s*(?:"((?:\\.|[^"\\])*)"|\'((?:\\.|[^\'\\])*)\')')
+_SPL_RE = re.compile(r'(?:^|\n)\s*((?:search\s+)?index=\S+[^\n]*)')
+
+def _unescape(value: str) -> str:
+    return value.replace('\\"', '"').replace("\\'", "'")
+
+def _call(name: str, arguments: dict) -> dict:
+    if "query" in arguments and "search_query" not in arguments:
+        arguments["search_query"] = arguments.pop("query")
+    return {"function": {"name": name, "arguments": arguments}}
+
+def json_call(block: str) -> dict | None:
+    """A {"name"/"tool", "arguments"/"command"} object written as text, with string arguments read as a search query."""
+    try:
+        data = json.loads(block)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    name = data.get("name") or data.get("tool")
+    args = data.get("arguments") or data.get("command")
+    if not name or not args:
+        return None
+    if isinstance(args, str):
+        if "search_query=" in args:
+            match = re.search(r'search_query\s*=\s*(?:"((?:\\.|[^"\\])*)"|\'((?:\\.|[^\'\\])*)\')', args)
+            if match:
+                args = {"search_query": _unescape(match.group(1) if match.group(1) else match.group(2))}
+            else:
+                args = {"search_query": args.replace('search_query=', '').strip('"\' ')}
+        else:
+            args = {"search_query": args}
+    if not isinstance(args, dict):
+        return None
+    return _call(name, args)
+
+def function_call(name: str, args_text: str) -> dict | None:
+    """A name(key="value", ...) call written as text."""
+    kv_pairs = _KV_RE.findall(args_text)
+    if not kv_pairs:
+        return None
+    return _call(name, {k: _unescape(v1 if v1 else v2) for k, v1, v2 in kv_pairs})
+
+def detect_tool_calls(content: str) -> list[dict]:
+    """
+    Tool calls written into the text of a model that didn't use native tool calling, in order of preference:
+    JSON blocks (fenced, else the outermost {...}), then name(key="value") calls, then bare SPL lines.
+    """
+    blocks = _FENCED_RE.findall(content)
+    if not blocks:
+        start = content.find('{')
+        end = content.rfind('}')
+        if start != -1 and end != -1 and end > start:
+            blocks = [content[start:end+1]]
+    calls = [call for call in map(json_call, blocks) if call]
+    for call in calls:
+        logger.info(f"Detected JSON block tool call: {call['function']['name']}({call['function']['arguments']})")
+    if calls:
+        return calls
+
+    for name, args_text in _FUNC_RE.findall(content):
+        call = function_call(name, args_text)
+        if call:
+            calls.append(call)
+            logger.info(f"Detected function-call tool: {name}({call['function']['arguments']})")
+    if calls:
+        return calls
+
+    for spl_query in _SPL_RE.findall(re.sub(r'```\w*\n?', '', content)):
+        spl_query = spl_query.strip()
+        if not spl_query.startswith('search '):
+            spl_query = 'search ' + spl_query
+        calls.append(_call("search_splunk", {"search_query": spl_query}))
+        logger.info(f"Detected bare SPL query: {spl_query}")
+    return calls
+
+def call_key(call: dict) -> tuple:
+    fn = call.get("function", {})
+    return fn.get("name", ""), json.dumps(fn.get("arguments", {}), sort_keys=True, default=str)
+
+class SpeculativeToolRunner:
+    """
+    Starts MCP calls while the model is still streaming. Native tool calls, complete fenced JSON calls and complete
+    name(key="value") calls of a known tool are dispatched as soon as their closing token arrives. After the stream,
+    the calls actually chosen pick up the running task with the same name and arguments; calls that lost to a
+    preferred pattern are dropped.
+    """
+
+    def __init__(self, tool_names, run_tool):
+        self.tool_names = set(tool_names)
+        self.run_tool = run_tool
+        self.tasks = {}
+        self.text = ""
+        self.fenced_pos = 0
+        self.func_pos = 0
+        # Time spent scanning streamed text for calls
+        self.scan_seconds = 0.0
+
+    def dispatch(self, call: dict):
+        key = call_key(call)
+        if key[0] not in self.tool_names or key in self.tasks:
+            return
+        fn = call["function"]
+        logger.info(f"Speculatively starting `{fn['name']}` with args {fn['arguments']}")
+        task = asyncio.create_task(self.run_tool(fn["name"], fn["arguments"]))
+        self.tasks[key] = (task, time.monotonic())
+
+    def feed(self, content: str):
+        """Scan streamed text for calls completed by this chunk."""
+        started = time.perf_counter()
+        self.text += content
+        for match in _FENCED_RE.finditer(self.text, self.fenced_pos):
+            self.fenced_pos = match.end()
+            call = json_call(match.group(1))
+            if call:
+                self.dispatch(call)
+        for match in _FUNC_RE.finditer(self.text, self.func_pos):
+            self.func_pos = match.end()
+            if match.group(1) in self.tool_names:
+                call = function_call(match.group(1), match.group(2))
+                if call:
+                    self.dispatch(call)
+        self.scan_seconds += time.perf_counter() - started
+
+    async def result(self, call: dict) -> str:
+        """Result of a chosen call: the speculative task if one was started, else a call made now."""
+        entry = self.tasks.pop(call_key(call), None)
+        fn = call.get("function", {})
+        if entry is None:
+            return await self.run_tool(fn.get("name", ""), fn.get("arguments", {}))
+        task, started = entry
+        if task.done():
+            logger.info(f"Speculative `{fn.get('name')}` was ready when the stream ended ({time.monotonic() - started:.2f}s since dispatch)")
+        return await task
+
+    def discard(self):
+        """Drop the speculative calls that were not chosen."""
+        for task, _ in self.tasks.values():
+            if task.done():
+                if not task.cancelled():
+                    task.exception()
+            else:
+                task.cancel()
+        if self.tasks:
+            logger.info(f"Discarded {len(self.tasks)} unused speculative tool call(s)")
+        self.tasks.clear()
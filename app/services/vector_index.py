@@ -0,0 +1,203 @@
+import os
+import re
+import json
+import zlib
+import logging
+from collections import Counter
+
+import httpx
+import numpy as np
+
+from config import VECTOR_DIR, OLLAMA_BASE, OLLAMA_EMBED_MODEL
+from services.evtx_parser import record_value, record_host
+
+logger = logging.getLogger("evtx_uploader")
+
+HASH_DIM = 1024
+HASH_EMBEDDER = f"hash-{HASH_DIM}"
+# EventData fields that say the most about a hit; the first few present are shown next to its rule
+KEY_FIELDS = ("CommandLine", "Image", "ParentImage", "TargetUserName", "SubjectUserName", "IpAddress", "ServiceName",
+              "ImagePath", "TargetFilename", "TargetObject", "QueryName", "DestinationIp", "ScriptBlockText")
+SAMPLE_FIELDS = 3
+MAX_FIELD_CHARS = 160
+MAX_RULES_PER_HOST = 10
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+
+# Loaded indexes keyed by session_id -> (mtime, index)
+_index_cache = {}
+_INDEX_CACHE_SIZE = 16
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def _hash_vectors(texts: list[str]) -> np.ndarray:
+    """Signed feature hashing of words and word pairs: needs no model and still ranks by shared terms."""
+    vectors = np.zeros((len(texts), HASH_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = _WORD_RE.findall(text.lower())
+        for term in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            h = zlib.crc32(term.encode())
+            vectors[row, h % HASH_DIM] += 1.0 if h & 0x80000000 else -1.0
+    return _normalize(vectors)
+
+def _ollama_vectors(texts: list[str]) -> np.ndarray:
+    with httpx.Client(timeout=120.0) as client:
+        resp = client.post(f"{OLLAMA_BASE}/api/embed", json={"model": OLLAMA_EMBED_MODEL, "input": texts})
+        resp.raise_for_status()
+    return _normalize(np.asarray(resp.json()["embeddings"], dtype=np.float32))
+
+def embed(texts: list[str], embedder: str = None) -> tuple[np.ndarray, str]:
+    """
+    Unit vectors and the name of the embedder that made them: OLLAMA_EMBED_MODEL when Ollama answers, else feature
+    hashing. Passing an embedder pins it, since a query is only comparable with vectors of the same embedder.
+    """
+    ollama_embedder = f"ollama:{OLLAMA_EMBED_MODEL}"
+    if OLLAMA_EMBED_MODEL and embedder in (None, ollama_embedder):
+        try:
+            return _ollama_vectors(texts), ollama_embedder
+        except Exception as e:
+            if embedder is not None:
+                raise
+            logger.warning(f"Ollama embeddings unavailable ({e}), using hashed bag-of-words vectors")
+    if embedder not in (None, HASH_EMBEDDER):
+        raise ValueError(f"Embedder {embedder} is not available")
+    return _hash_vectors(texts), HASH_EMBEDDER
+
+def _sample_fields(record: dict) -> str:
+    parts = []
+    for field in KEY_FIELDS:
+        value = record_value(record, f"Event.EventData.{field}")
+        if value not in (None, "", "-") and not isinstance(value, (dict, list)):
+            parts.append(f"{field}={str(value)[:MAX_FIELD_CHARS]}")
+            if len(parts) == SAMPLE_FIELDS:
+                break
+    return ", ".join(parts)
+
+def build_documents(detections: list[dict], case_stats: dict = None) -> list[dict]:
+    """
+    One document per detection rule (name, description, tags, hosts, a sample of key fields) and one per host
+    (event count, detections by rule). "text" is what gets embedded, "line" what goes into the prompt.
+    """
+    rules = {}
+    hosts = {}
+    for det in detections:
+        record = (det.get("document") or {}).get("data") or {}
+        name = det.get("name", "Unknown Rule")
+        level = det.get("level", "info")
+        host = record_host(record) or ""
+        rule = rules.get(name)
+        if rule is None:
+            rule = rules[name] = {
+                "level": level, "group": det.get("group", ""), "tags": list(det.get("tags") or []),
+                "description": det.get("description") or "", "count": 0, "hosts": Counter(),
+                "first": None, "last": None, "sample": _sample_fields(record),
+            }
+        rule["count"] += 1
+        # SystemTime is ISO-8601 UTC, so string order is time order
+        ts = str(det.get("timestamp") or "")
+        if ts:
+            rule["first"] = ts if rule["first"] is None or ts < rule["first"] else rule["first"]
+            rule["last"] = ts if rule["last"] is None or ts > rule["last"] else rule["last"]
+        if host:
+            rule["hosts"][host] += 1
+            counters = hosts.setdefault(host, (Counter(), Counter()))
+            counters[0][name] += 1
+            counters[1][level] += 1
+
+    documents = []
+    for name, rule in rules.items():
+        top_hosts = ", ".join(h for h, _ in rule["hosts"].most_common(5))
+        line = f"[{rule['level']}] {name}: {rule['count']} hit(s)"
+        if top_hosts:
+            line += f" on {top_hosts}"
+        if rule["first"]:
+            line += f", {rule['first']} to {rule['last']}"
+        if rule["sample"]:
+            line += f"; e.g. {rule['sample']}"
+        text = " ".join(filter(None, [name, rule["description"], rule["group"], " ".join(rule["tags"]).replace("_", " "), top_hosts, rule["sample"]]))
+        documents.append({"kind": "detection", "name": name, "text": text, "line": line})
+
+    events_by_host = {h["host"]: h["count"] for h in (case_stats or {}).get("hosts", []) if h.get("host")}
+    for host in sorted(set(hosts) | set(events_by_host)):
+        by_rule, by_level = hosts.get(host, (Counter(), Counter()))
+        rules_text = ", ".join(f"{n} ({c})" for n, c in by_rule.most_common(MAX_RULES_PER_HOST))
+        line = f"Host {host}: {events_by_host.get(host, 'unknown number of')} events"
+        if rules_text:
+            line += f"; detections by level {dict(by_level)}: {rules_text}"
+        else:
+            line += "; no detections"
+        documents.append({"kind": "host", "name": host, "text": f"host computer {host} {rules_text}", "line": line})
+    return documents
+
+def _paths(session_id: str) -> tuple[str, str]:
+    base = os.path.join(VECTOR_DIR, session_id)
+    return base + ".npy", base + ".json"
+
+def build_vector_index(session_id: str, detections: list[dict], case_stats: dict = None) -> int:
+    """Embed the session's rule and host documents and store them as a NumPy matrix; returns the document count."""
+    vectors_path, meta_path = _paths(session_id)
+    documents = build_documents(detections, case_stats)
+    _index_cache.pop(session_id, None)
+    if not documents:
+        for path in (vectors_path, meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+        return 0
+
+    vectors, embedder = embed([d["text"] for d in documents])
+    with open(vectors_path + ".tmp", "wb") as f:
+        np.save(f, vectors)
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump({"embedder": embedder, "documents": documents}, f)
+    os.replace(vectors_path + ".tmp", vectors_path)
+    # The metadata goes last: a reader that finds it also finds the matching vectors
+    os.replace(meta_path + ".tmp", meta_path)
+    logger.info(f"Indexed {len(documents)} context documents for session {session_id} ({embedder})")
+    return len(documents)
+
+def _load(session_id: str) -> dict | None:
+    if os.path.basename(session_id) != session_id:
+        return None
+    vectors_path, meta_path = _paths(session_id)
+    if not os.path.exists(meta_path) or not os.path.exists(vectors_path):
+        return None
+    mtime = os.path.getmtime(meta_path)
+    cached = _index_cache.get(session_id)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(meta_path, "r") as f:
+        index = json.load(f)
+    index["vectors"] = np.load(vectors_path)
+    if len(_index_cache) >= _INDEX_CACHE_SIZE:
+        _index_cache.pop(next(iter(_index_cache)))
+    _index_cache[session_id] = (mtime, index)
+    return index
+
+def search_context(session_id: str, question: str, k: int) -> list[dict] | None:
+    """The k documents closest to the question (cosine similarity), best first; None if the session has no index."""
+    index = _load(session_id)
+    if index is None:
+        return None
+    vectors = index["vectors"]
+    try:
+        query, _ = embed([question], index["embedder"])
+    except Exception as e:
+        # The embedding model went away since ingest: rank with hashed vectors of the same documents instead
+        logger.warning(f"Context search falls back to hashed vectors: {e}")
+        if "hash_vectors" not in index:
+            index["hash_vectors"] = _hash_vectors([d["text"] for d in index["documents"]])
+        vectors = index["hash_vectors"]
+        query, _ = embed([question], HASH_EMBEDDER)
+
+    scores = vectors @ query[0]
+    k = min(k, len(scores))
+    if k <= 0:
+        return []
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [{**index["documents"][i], "score": round(float(scores[i]), 4)} for i in top]
+
+def format_context(hits: list[dict]) -> str:
+    return "\n".join(f"- {hit['line']}" for hit in hits)
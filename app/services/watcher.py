@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+from config import (
+    STATE_DIR, WATCH_DIR, WATCH_POLL_INTERVAL, WATCH_SETTLE_SECONDS, WATCH_DESTINATION,
+    WATCH_INDEX, WATCH_CASE_NAME, WATCH_HUNT, WATCH_INCREMENTAL,
+)
+from utils import delete_later
+from services.archive import is_archive
+from services.pipeline import IngestSession
+
+logger = logging.getLogger("evtx_uploader")
+
+CHECKPOINT_PATH = os.path.join(STATE_DIR, "watcher_checkpoint.json")
+# Files that can't be read are moved here, inside the drop folder; the scan skips hidden folders
+FAILED_DIRNAME = ".failed"
+
+class DropFolderWatcher:
+    """
+    Polls a drop folder for new or grown EVTX files (and archives), waits until a file has stopped changing
+    for WATCH_SETTLE_SECONDS, then runs it through the ingest pipeline. Handled files are checkpointed by
+    (size, mtime) so restarts don't re-ingest them. Files in a first-level subfolder are grouped into a case
+    named after that subfolder.
+    """
+
+    def __init__(self, watch_dir: str = WATCH_DIR, checkpoint_path: str = CHECKPOINT_PATH):
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint = self._load_checkpoint()
+        # Files that changed recently: rel path -> ((size, mtime), time the signature was first seen)
+        self.pending = {}
+        self.sessions = []
+        self.last_scan = None
+        self.errors = 0
+
+    def _load_checkpoint(self) -> dict:
+        if not os.path.exists(self.checkpoint_path):
+            return {}
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Watcher checkpoint unreadable, starting fresh: {e}")
+            return {}
+
+    def _save_checkpoint(self):
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def scan(self) -> dict:
+        """Current (size, mtime) of every candidate file, keyed by path relative to the drop folder."""
+        found = {}
+        for dirpath, dirnames, filenames in os.walk(self.watch_dir):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in filenames:
+                if not (name.lower().endswith(".evtx") or is_archive(name)):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found[os.path.relpath(path, self.watch_dir)] = [st.st_size, st.st_mtime]
+        return found
+
+    def ready_files(self, found: dict, now: float) -> list[str]:
+        """Debounce: a new or changed file is ready once its signature has been stable for the settle time."""
+        ready = []
+        for rel, sig in found.items():
+            if self.checkpoint.get(rel) == sig:
+                self.pending.pop(rel, None)
+                continue
+            seen = self.pending.get(rel)
+            if seen is None or seen[0] != sig:
+                self.pending[rel] = (sig, now)
+            elif now - seen[1] >= WATCH_SETTLE_SECONDS and sig[0] > 0:
+                ready.append(rel)
+        for rel in list(self.pending):
+            if rel not in found:
+                self.pending.pop(rel)
+        return ready
+
+    def _move_to_failed(self, rel: str) -> bool:
+        """Move an unreadable file into the hidden FAILED_DIRNAME folder, which the scan skips. False if it can't be moved."""
+        target = os.path.join(self.watch_dir, FAILED_DIRNAME, rel)
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(os.path.join(self.watch_dir, rel), target)
+        except OSError as e:
+            logger.error(f"Watcher: cannot move {rel} to {FAILED_DIRNAME}: {e}")
+            return False
+        logger.info(f"Watcher: moved {rel} to {os.path.join(FAILED_DIRNAME, rel)}")
+        self.checkpoint.pop(rel, None)
+        return True
+
+    def _case_for(self, rel: str) -> str:
+        parts = rel.split(os.sep)
+        return parts[0] if len(parts) > 1 else WATCH_CASE_NAME
+
+    async def process_batch(self, ready: list[str], found: dict):
+        by_case = {}
+        for rel in ready:
+            by_case.setdefault(self._case_for(rel), []).append(rel)
+
+        for case_name, rels in by_case.items():
+            session = IngestSession(case_name=case_name, destination=WATCH_DESTINATION, index=WATCH_INDEX,
+                                    incremental=WATCH_INCREMENTAL)
+            session.progress["total"] = len(rels)
+            session.progress["status"] = "parsing"
+            logger.info(f"Watcher: ingesting {len(rels)} file(s) for case '{case_name}' (session {session.session_id})")
+
+            async def process(rel: str):
+                path = os.path.join(self.watch_dir, rel)
+                try:
+                    if is_archive(path):
+                        with open(path, "rb") as f:
+                            results = await session.process_archive(f, os.path.basename(path))
+                    else:
+                        # Opened first so an unreadable file is moved aside rather than logged as a parse error
+                        open(path, "rb").close()
+                        result = await session.process_evtx(session.reserve_name(os.path.basename(path)), path)
+                        results = [result] if result else []
+                except OSError as e:
+                    logger.error(f"Watcher: cannot read {rel}: {e}")
+                    session.progress["completed"] += 1
+                    self.errors += 1
+                    self.pending.pop(rel, None)
+                    if not await asyncio.to_thread(self._move_to_failed, rel):
+                        # Left in place: checkpoint it so it isn't retried every poll
+                        self.checkpoint[rel] = found[rel]
+                    return
+                if not results:
+                    self.errors += 1
+                # Checkpoint the signature we decided on, even on failure, so a broken file isn't retried every poll
+                self.checkpoint[rel] = found[rel]
+                self.pending.pop(rel, None)
+
+            await asyncio.gather(*(process(rel) for rel in rels))
+            self._save_checkpoint()
+
+            # Working files go after the same delay as an upload's, so a long-running watcher doesn't fill UPLOAD_DIR
+            response_data = await session.finalize() if WATCH_HUNT else await session.flush()
+            if response_data is None:
+                # finalize only schedules the cleanup when something was parsed
+                asyncio.create_task(delete_later([session.session_folder, session.evtx_dir]))
+            self.sessions.append({"session_id": session.session_id, "case_name": case_name,
+                                  "files": rels, "finished": time.time()})
+            self.sessions = self.sessions[-50:]
+
+    async def run(self):
+        logger.info(f"Watching drop folder {self.watch_dir} (poll {WATCH_POLL_INTERVAL}s, settle {WATCH_SETTLE_SECONDS}s)")
+        os.makedirs(self.watch_dir, exist_ok=True)
+        while True:
+            try:
+                found = await asyncio.to_thread(self.scan)
+                now = time.time()
+                self.last_scan = now
+                ready = self.ready_files(found, now)
+                if ready:
+                    await self.process_batch(ready, found)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Watcher error: {e}")
+            await asyncio.sleep(WATCH_POLL_INTERVAL)
+
+    def status(self) -> dict:
+        return {
+            "watch_dir": self.watch_dir,
+            "tracked_files": len(self.checkpoint),
+            "pending_files": sorted(self.pending),
+            "last_scan": self.last_scan,
+            "errors": self.errors,
+            "recent_sessions": self.sessions[-10:],
+        }
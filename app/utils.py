@@ -1,7 +1,10 @@
 import os
+import time
 import shutil
 import asyncio
 import logging
+import threading
+from contextlib import contextmanager
 
 logger = logging.getLogger("evtx_uploader")
 
@@ -18,3 +21,48 @@ async def delete_later(paths, delay=300):
                 logger.debug(f"Deleted {path}")
         except Exception as e:
             logger.error(f"Failed to delete {path}: {e}")
+
+def unique_name(name: str, used: set) -> str:
+    """Return name, or name with a numeric suffix, so that it is not already in used (case-insensitive)."""
+    candidate = name
+    n = 1
+    while candidate.lower() in used:
+        stem, ext = os.path.splitext(name)
+        candidate = f"{stem}_{n}{ext}"
+        n += 1
+    used.add(candidate.lower())
+    return candidate
+
+class StageTimer:
+    """
+    Time spent in each pipeline stage: busy seconds summed over concurrent calls (worker threads, parallel
+    files) and wall seconds from the first call's start to the last call's end.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            ended = time.perf_counter()
+            with self.lock:
+                entry = self.stages.get(name)
+                if entry is None:
+                    self.stages[name] = {"calls": 1, "busy": ended - started, "start": started, "end": ended}
+                else:
+                    entry["calls"] += 1
+                    entry["busy"] += ended - started
+                    entry["start"] = min(entry["start"], started)
+                    entry["end"] = max(entry["end"], ended)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                name: {"calls": e["calls"], "busy_seconds": round(e["busy"], 3), "wall_seconds": round(e["end"] - e["start"], 3)}
+                for name, e in self.stages.items()
+            }
@@ -1,12 +1,16 @@
 # Import packages
+import asyncio
 import json
 import logging
 import os
+import re
 import ssl
+import time
 import traceback
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Dict, List, Any, Optional, Union
 
+import httpx
 import splunklib.client
 from decouple import config
 from fastmcp import FastMCP
@@ -57,6 +61,14 @@ SPLUNK_SCHEME = os.environ.get("SPLUNK_SCHEME", "https")
 SPLUNK_PASSWORD = os.environ.get("SPLUNK_PASSWORD", "admin")
 VERIFY_SSL = config("VERIFY_SSL", default="true", cast=bool)
 SPLUNK_TOKEN = os.environ.get("SPLUNK_TOKEN")  # New: support for token-based auth
+EVTXORCIST_URL = os.environ.get("EVTXORCIST_URL", "http://evtx-uploader:8000")
+# search_splunk rewrite stage and cost guard
+SEARCH_DEFAULT_INDEX = os.environ.get("SEARCH_DEFAULT_INDEX", "main")
+# Used when the case time span is unknown; events carry their own (often old) time, so the default is all time
+SEARCH_DEFAULT_EARLIEST = os.environ.get("SEARCH_DEFAULT_EARLIEST", "0")
+SEARCH_SCAN_BUDGET = int(os.environ.get("SEARCH_SCAN_BUDGET", "5000000"))  # events; 0 disables the guard
+SEARCH_POLL_SECONDS = 0.25
+METADATA_REFRESH_SECONDS = int(os.environ.get("METADATA_REFRESH_SECONDS", "300"))
 
 def get_splunk_connection() -> splunklib.client.Service:
     """
@@ -93,92 +105,573 @@ def get_splunk_connection() -> splunklib.client.Service:
         logger.error(f"❌ Failed to connect to Splunk: {str(e)}")
         raise
 
+# Fields Splunk keeps in its index files: constraints on them prune buckets and can be answered by tstats
+INDEXED_FIELDS = ("index", "sourcetype", "source", "host")
+# EVTXorcist sends every event (and detection) with its Computer as the HEC host, so these fields are `host`
+FIELD_ALIASES = {"event.system.computer": "host", "document.data.event.system.computer": "host"}
+TIME_MODIFIERS = ("earliest", "latest")
+ALL_TIME = ("", "0", "all", "alltime", "all time")
+_QUOTED_RE = re.compile(r'"(?:[^"\\]|\\.)*"')
+_TERM_RE = re.compile(r'^([\w.]+)=("(?:[^"\\]|\\.)*"|[^\s"()]+)$')
+_STATS_RE = re.compile(r'^stats\s+(.+?)(?:\s+by\s+(.+))?$', re.IGNORECASE | re.DOTALL)
+_AGG_RE = re.compile(
+    r'(count|(?:dc|distinct_count)\(([\w.]+)\)|(?:min|max|earliest|latest)\(_time\))(?:\s+as\s+([\w.]+|"[^"]*"))?',
+    re.IGNORECASE,
+)
+_JSON_FIELD_RE = re.compile(r'(?<![\w.])Event\.')
+_CHAINSAW_FIELD_RE = re.compile(r'(?<![\w.])(?:document\.|level\b|name\b|tags\b)')
+_LEADING_WILDCARD_RE = re.compile(r'(?:^|=)"?\*[^*\s"]')
+
+def _mask_quotes(text: str) -> str:
+    return _QUOTED_RE.sub('""', text)
+
+def _split_spl(text: str, sep: Optional[str]) -> List[str]:
+    """Split on `sep` ("|", or whitespace when None) outside double quotes and [subsearches]."""
+    parts, current = [], []
+    quoted = escaped = False
+    depth = 0
+    for ch in text:
+        if quoted:
+            current.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                quoted = False
+            continue
+        if ch == '"':
+            quoted = True
+        elif ch == "[":
+            depth += 1
+        elif ch == "]":
+            depth -= 1
+        elif depth == 0 and (ch == sep if sep else ch.isspace()):
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        current.append(ch)
+    parts.append("".join(current).strip())
+    return [p for p in parts if p]
+
+def _indexed_term(token: str) -> Optional[tuple]:
+    """(field, value) of a field=value term on an indexed field (or an alias of one) or a time modifier."""
+    match = _TERM_RE.match(token)
+    if not match:
+        return None
+    field = match.group(1).lower()
+    field = FIELD_ALIASES.get(field, field)
+    if field in INDEXED_FIELDS or field in TIME_MODIFIERS:
+        return field, match.group(2)
+    return None
+
+def _infer_sourcetype(masked_query: str) -> Optional[str]:
+    """_json when the query only uses raw EVTX fields, chainsaw when it only uses detection fields."""
+    raw = bool(_JSON_FIELD_RE.search(masked_query))
+    detections = bool(_CHAINSAW_FIELD_RE.search(masked_query))
+    if raw != detections:
+        return "_json" if raw else "chainsaw"
+    return None
+
+def _to_tstats(terms: List[str], commands: List[str]) -> Optional[str]:
+    """
+    `<indexed constraints> | stats count/dc/min/max by <indexed fields>` as the equivalent tstats, which reads the
+    index files instead of every raw event. None if the search doesn't qualify.
+    """
+    match = _STATS_RE.match(commands[0]) if commands else None
+    if not match:
+        return None
+    where = []
+    for token in terms:
+        term = _indexed_term(token)
+        if term is None:
+            return None
+        where.append(f"{term[0]}={term[1]}")
+
+    aggs_text = match.group(1).strip()
+    aggs = []
+    pos = 0
+    for agg in _AGG_RE.finditer(aggs_text):
+        if aggs_text[pos:agg.start()].strip(" ,"):
+            return None
+        pos = agg.end()
+        text, field, alias = agg.groups()
+        rendered = text.lower() if not field else f"dc({FIELD_ALIASES.get(field.lower(), field.lower())})"
+        if field and rendered[3:-1] not in INDEXED_FIELDS:
+            return None
+        # Keep the output column the agent asked for
+        if not alias and rendered != text:
+            alias = f'"{text}"'
+        aggs.append(f"{rendered} AS {alias}" if alias else rendered)
+    if not aggs or aggs_text[pos:].strip(" ,"):
+        return None
+
+    by, renames = [], []
+    for field in re.split(r"[\s,]+", (match.group(2) or "").strip()):
+        if not field:
+            continue
+        mapped = FIELD_ALIASES.get(field.lower(), field.lower())
+        if mapped not in INDEXED_FIELDS:
+            return None
+        by.append(mapped)
+        if mapped != field:
+            renames.append(f'{mapped} AS "{field}"')
+
+    query = f"| tstats {' '.join(aggs)} where {' '.join(where)}"
+    if by:
+        query += f" by {', '.join(by)}"
+    if renames:
+        query += f" | rename {', '.join(renames)}"
+    return query + "".join(f" | {c}" for c in commands[1:])
+
+def optimize_query(search_query: str) -> Dict[str, Any]:
+    """
+    Rewrite an agent-written search into a cheaper equivalent: add the missing index, add the sourcetype its
+    fields imply, and turn stats over indexed fields into tstats. Generating searches (| tstats, | rest ...)
+    are left as they are. Also returns the indexed constraints the scan estimate can use.
+    """
+    query = search_query.strip()
+    if query.startswith("|"):
+        return {"query": query, "rewrites": [], "constraints": None, "notes": []}
+    if re.match(r"search\s", query, re.IGNORECASE):
+        query = query[6:].strip()
+
+    segments = _split_spl(query, "|")
+    base, commands = (segments[0], segments[1:]) if segments else ("", [])
+    masked = _mask_quotes(base)
+    rewrites, added = [], []
+    if not re.search(r'(?<![\w.])index\s*(?:!?=|\s+in\s*\()', masked, re.IGNORECASE):
+        added.append(f"index={SEARCH_DEFAULT_INDEX}")
+        rewrites.append(f"added index={SEARCH_DEFAULT_INDEX}")
+    if not re.search(r'(?<![\w.])sourcetype\s*(?:!?=|\s+in\s*\()', masked, re.IGNORECASE):
+        sourcetype = _infer_sourcetype(_mask_quotes(query))
+        if sourcetype:
+            added.append(f"sourcetype={sourcetype}")
+            rewrites.append(f"added sourcetype={sourcetype} (the fields used only exist there)")
+    base = " ".join(added + [base]).strip()
+    terms = _split_spl(base, None)
+
+    notes = [
+        f"{t} has a leading wildcard, so Splunk must read every event in range to test it"
+        for t in terms if _LEADING_WILDCARD_RE.search(t)
+    ]
+    tstats = None if "[" in masked else _to_tstats(terms, commands)
+    if tstats:
+        rewrites.append("stats over indexed fields run as tstats")
+        return {"query": tstats, "rewrites": rewrites, "constraints": None, "notes": notes}
+
+    # With boolean logic an indexed term may be optional, so only the index / sourcetype terms bound the scan
+    boolean = re.search(r'\b(?:OR|NOT)\b|\(', masked)
+    constraints = []
+    for token in terms:
+        term = _indexed_term(token)
+        if term and (not boolean or term[0] in ("index", "sourcetype")):
+            constraints.append(f"{term[0]}={term[1]}")
+    query = "search " + base + "".join(f" | {c}" for c in commands)
+    return {"query": query, "rewrites": rewrites, "constraints": constraints, "notes": notes}
+
+def _epoch(timestamp: Optional[str]) -> Optional[float]:
+    if not timestamp:
+        return None
+    text = str(timestamp).replace("Z", "+00:00")
+    # fromisoformat (3.10) only takes 3 or 6 fractional digits; EVTX has 7
+    text = re.sub(r"\.(\d+)", lambda m: "." + (m.group(1) + "000000")[:6], text)
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+async def _case_time_range(query: str) -> Optional[tuple]:
+    """
+    (earliest, latest, description) spanning the case named by source="..." in the query, or every stored case.
+    Events are indexed at their own time, so a relative default such as -24h misses most evidence.
+    """
+    try:
+        async with httpx.AsyncClient(base_url=EVTXORCIST_URL, timeout=5.0) as client:
+            resp = await client.get("/api/cases")
+            resp.raise_for_status()
+            cases = resp.json().get("cases", [])
+    except Exception as e:
+        logger.warning(f"⚠️ Could not fetch case time ranges: {str(e)}")
+        return None
+
+    label = f"all {len(cases)} case(s)"
+    named = re.search(r'(?<![\w.])source\s*=\s*"?([^"\s|()*]+)"?(?=[\s|)]|$)', query, re.IGNORECASE)
+    if named:
+        matches = [c for c in cases if (c.get("case_name") or "").lower() == named.group(1).lower()]
+        if matches:
+            cases, label = matches, f"case '{named.group(1)}'"
+    firsts = [t for t in (_epoch(c.get("first_seen")) for c in cases) if t is not None]
+    lasts = [t for t in (_epoch(c.get("last_seen")) for c in cases) if t is not None]
+    if not firsts or not lasts:
+        return None
+    earliest, latest = int(min(firsts)), int(max(lasts)) + 1
+    span = f"{datetime.fromtimestamp(earliest, timezone.utc):%Y-%m-%dT%H:%M:%SZ} to {datetime.fromtimestamp(latest, timezone.utc):%Y-%m-%dT%H:%M:%SZ}"
+    return str(earliest), str(latest), f"{label}: {span}"
+
+def _estimate_scan(service: splunklib.client.Service, constraints: List[str], kwargs_time: Dict[str, str]) -> int:
+    """Events in the buckets the search has to read, counted from the index files by tstats."""
+    stream = service.jobs.oneshot(f"| tstats count where {' '.join(constraints)}", output_mode="json", **kwargs_time)
+    rows = json.loads(stream.read().decode("utf-8")).get("results", [])
+    return int(rows[0].get("count", 0)) if rows else 0
+
+def _read_results(job, max_results: int) -> Dict[str, Any]:
+    result_stream = job.results(output_mode='json', count=max_results)
+    return json.loads(result_stream.read().decode('utf-8'))
+
 @mcp.tool()
-async def search_splunk(search_query: str, earliest_time: str = "-24h", latest_time: str = "now", max_results: int = 100) -> List[Dict[str, Any]]:
+async def search_splunk(
+    search_query: str,
+    earliest_time: Optional[str] = None,
+    latest_time: Optional[str] = None,
+    max_results: int = 100,
+    allow_expensive: bool = False,
+) -> Dict[str, Any]:
     """
     Execute a Splunk search query and return the results.
-    
+
+    The query is optimized before it runs: a missing index / sourcetype is added, stats by host/source/sourcetype
+    become tstats, and without a time range the search covers the case's own time span. Searches that would scan
+    more than the event budget are rejected with suggestions. The response shows the query that actually ran and
+    what it cost (job.scanCount events read, job.runDuration seconds).
+
     Args:
         search_query: The search query to execute
-        earliest_time: Start time for the search (default: 24 hours ago)
-        latest_time: End time for the search (default: now)
+        earliest_time: Start time for the search (default: start of the case's events)
+        latest_time: End time for the search (default: end of the case's events)
         max_results: Maximum number of results to return (default: 100)
-        
+        allow_expensive: Run even if the estimated scan is over budget
+
     Returns:
-        List of search results
+        Dict with the query run, the rewrites applied, job statistics and the results
     """
     if not search_query:
         raise ValueError("Search query cannot be empty")
-    
-    # Prepend 'search' if not starting with '|' or 'search' (case-insensitive)
-    stripped_query = search_query.lstrip()
-    if not (stripped_query.startswith('|') or stripped_query.lower().startswith('search')):
-        search_query = f"search {search_query}"
-    
+
+    optimized = optimize_query(search_query)
+    query, rewrites = optimized["query"], optimized["rewrites"]
+
+    # Time modifiers written in the query itself take precedence over the job's range
+    if re.search(r'(?<![\w.])(?:earliest|latest)\s*=', _mask_quotes(query), re.IGNORECASE):
+        kwargs_time = {}
+    elif earliest_time and earliest_time.strip().lower() not in ALL_TIME:
+        kwargs_time = {"earliest_time": earliest_time, "latest_time": latest_time or "now"}
+    else:
+        case_range = await _case_time_range(query)
+        if case_range:
+            kwargs_time = {"earliest_time": case_range[0], "latest_time": latest_time or case_range[1]}
+            rewrites.append(f"time range set to {case_range[2]}")
+        else:
+            kwargs_time = {"earliest_time": SEARCH_DEFAULT_EARLIEST, "latest_time": latest_time or "now"}
+            rewrites.append("time range set to all time" if SEARCH_DEFAULT_EARLIEST.strip().lower() in ALL_TIME
+                            else f"time range set to {SEARCH_DEFAULT_EARLIEST}")
+
+    response = {"query": query, **kwargs_time, "rewrites": rewrites}
+    if optimized["notes"]:
+        response["notes"] = optimized["notes"]
+
     try:
-        service = get_splunk_connection()
-        logger.info(f"🔍 Executing search: {search_query}")
-        
-        # Create the search job
-        kwargs_search = {
-            "earliest_time": earliest_time,
-            "latest_time": latest_time,
-            "preview": False,
-            "exec_mode": "blocking"
+        service = await asyncio.to_thread(get_splunk_connection)
+
+        if optimized["constraints"] and SEARCH_SCAN_BUDGET > 0 and not allow_expensive:
+            try:
+                estimate = await asyncio.to_thread(_estimate_scan, service, optimized["constraints"], kwargs_time)
+            except Exception as e:
+                logger.warning(f"⚠️ Scan estimate failed, running without the cost guard: {str(e)}")
+                estimate = None
+            if estimate is not None:
+                response["estimated_scan"] = estimate
+                if estimate > SEARCH_SCAN_BUDGET:
+                    logger.info(f"🛑 Rejected search over budget ({estimate} > {SEARCH_SCAN_BUDGET} events): {query}")
+                    response["error"] = (
+                        f"Search rejected: it would scan about {estimate:,} events, over the budget of {SEARCH_SCAN_BUDGET:,}."
+                    )
+                    response["suggestions"] = [
+                        "Narrow earliest_time / latest_time",
+                        "Add source=\"<case>\" or host=<computer> (both are indexed)",
+                        "Count by host, source or sourcetype (runs as tstats), or use get_case_stats / get_timeline",
+                        "Avoid leading wildcards such as *keyword*",
+                        "Pass allow_expensive=true if the full scan is really needed",
+                    ]
+                    return response
+
+        logger.info(f"🔍 Executing search: {query} ({kwargs_time or 'inline time range'})")
+        job = await asyncio.to_thread(service.jobs.create, query, preview=False, **kwargs_time)
+        try:
+            # Polled rather than exec_mode=blocking, so a cancelled tool call (the user pressed stop or left) also
+            # stops the Splunk job instead of letting it run to the end
+            while not await asyncio.to_thread(job.is_done):
+                await asyncio.sleep(SEARCH_POLL_SECONDS)
+        except asyncio.CancelledError:
+            logger.info(f"🛑 Search cancelled, cancelling Splunk job {job.sid}")
+            await asyncio.to_thread(job.cancel)
+            raise
+
+        # Get the results; splunklib blocks, so every call runs off the event loop
+        results_data = await asyncio.to_thread(_read_results, job, max_results)
+
+        content = (await asyncio.to_thread(job.refresh)).content
+        response["job"] = {
+            "scanCount": int(float(content.get("scanCount", 0))),
+            "eventCount": int(float(content.get("eventCount", 0))),
+            "resultCount": int(float(content.get("resultCount", 0))),
+            "runDuration": round(float(content.get("runDuration", 0)), 3),
         }
-        
-        job = service.jobs.create(search_query, **kwargs_search)
-        
-        # Get the results
-        result_stream = job.results(output_mode='json', count=max_results)
-        results_data = json.loads(result_stream.read().decode('utf-8'))
-        
-        return results_data.get("results", [])
-        
+        response["results"] = results_data.get("results", [])
+        logger.info(f"✅ Search scanned {response['job']['scanCount']} events in {response['job']['runDuration']}s")
+        return response
+
     except Exception as e:
         logger.error(f"❌ Search failed: {str(e)}")
         raise
 
 @mcp.tool()
-async def list_indexes() -> Dict[str, List[str]]:
+async def get_case_stats(case: Optional[str] = None) -> Dict[str, Any]:
     """
-    Get a list of all available Splunk indexes.
-    
+    Get precomputed statistics for an ingested case without running a Splunk search: event count, first/last
+    timestamps, EventID histogram, hosts, channels, providers, accounts, hourly volume and Chainsaw detection summary.
+
+    Args:
+        case: Case name (the Splunk 'source') or session id; defaults to the most recent case
+
     Returns:
-        Dictionary containing list of indexes
+        Dict with the case statistics, or the list of known cases if no match was found
     """
     try:
-        service = get_splunk_connection()
-        indexes = [index.name for index in service.indexes]
-        logger.info(f"📊 Found {len(indexes)} indexes")
-        return {"indexes": indexes}
+        async with httpx.AsyncClient(base_url=EVTXORCIST_URL, timeout=10.0) as client:
+            resp = await client.get("/api/cases")
+            resp.raise_for_status()
+            cases = resp.json().get("cases", [])
+            if case:
+                wanted = case.strip().lower()
+                matches = [c for c in cases if wanted in ((c.get("session_id") or "").lower(), (c.get("case_name") or "").lower())]
+            else:
+                matches = cases
+            if not matches:
+                return {"error": f"No stats for case '{case}'", "cases": cases}
+
+            resp = await client.get(f"/api/results/{matches[0]['session_id']}/stats")
+            resp.raise_for_status()
+            return resp.json()
     except Exception as e:
-        logger.error(f"❌ Failed to list indexes: {str(e)}")
+        logger.error(f"❌ Failed to fetch case stats: {str(e)}")
         raise
 
 @mcp.tool()
-async def get_index_info(index_name: str) -> Dict[str, Any]:
+async def get_timeline(
+    case: Optional[str] = None,
+    host: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    detections_only: bool = False,
+    limit: int = 200,
+) -> Dict[str, Any]:
     """
-    Get metadata for a specific Splunk index.
-    
+    Get the time-ordered events and detections of an ingested case, e.g. "what happened on host X between T1 and T2",
+    without running a Splunk search. Rows are compact: timestamp, type (event/detection), host, channel, event_id,
+    rule/level for detections and a short EventData summary for events.
+
     Args:
-        index_name: Name of the index to get metadata for
-        
+        case: Case name (the Splunk 'source') or session id; defaults to the most recent case
+        host: Computer name (Event.System.Computer), case-insensitive; a short name also matches its FQDN
+        start: ISO-8601 start time (UTC), e.g. 2024-05-01T10:00:00Z
+        end: ISO-8601 end time (UTC)
+        detections_only: Only return detections
+        limit: Maximum rows to return (default 200)
+
     Returns:
-        Dictionary containing index metadata
+        Dict with the session id and the timeline rows
     """
     try:
-        service = get_splunk_connection()
-        index = service.indexes[index_name]
-        
-        return {
-            "name": index_name,
+        async with httpx.AsyncClient(base_url=EVTXORCIST_URL, timeout=30.0) as client:
+            resp = await client.get("/api/cases")
+            resp.raise_for_status()
+            cases = resp.json().get("cases", [])
+            if case:
+                wanted = case.strip().lower()
+                cases = [c for c in cases if wanted in ((c.get("session_id") or "").lower(), (c.get("case_name") or "").lower())]
+            if not cases:
+                return {"error": f"No case '{case}'"}
+
+            session_id = cases[0]["session_id"]
+            params = {"host": host, "start": start, "end": end, "limit": max(1, min(limit, 5000))}
+            if detections_only:
+                params["events"] = "false"
+            resp = await client.get(f"/api/timeline/{session_id}", params={k: v for k, v in params.items() if v is not None})
+            if resp.status_code == 404:
+                return {"error": f"No timeline for session {session_id}"}
+            resp.raise_for_status()
+            rows = [json.loads(line) for line in resp.text.splitlines() if line]
+            return {"session_id": session_id, "count": len(rows), "rows": rows}
+    except Exception as e:
+        logger.error(f"❌ Failed to fetch timeline: {str(e)}")
+        raise
+
+def _load_indexes() -> Dict[str, Dict[str, Any]]:
+    service = get_splunk_connection()
+    indexes = {}
+    for index in service.indexes:
+        indexes[index.name] = {
+            "name": index.name,
             "total_event_count": str(index["totalEventCount"]),
             "current_size": str(index["currentDBSizeMB"]),
             "max_size": str(index["maxTotalDataSizeMB"]),
             "min_time": str(index["minTime"]),
             "max_time": str(index["maxTime"])
         }
+    logger.info(f"📊 Found {len(indexes)} indexes")
+    return indexes
+
+def _load_sourcetypes() -> Dict[str, List[Dict[str, Any]]]:
+    service = get_splunk_connection()
+    # tstats only reads the index files; over all time because events are indexed at their own (often old) time
+    search_query = """
+    | tstats count WHERE index=* BY index, sourcetype
+    | sort - count
+    """
+    job = service.jobs.create(search_query, earliest_time="0", latest_time="now", preview=False, exec_mode="blocking")
+    result_stream = job.results(output_mode='json', count=0)
+    results_data = json.loads(result_stream.read().decode('utf-8'))
+
+    sourcetypes_by_index = {}
+    for result in results_data.get('results', []):
+        sourcetypes_by_index.setdefault(result.get('index', ''), []).append({
+            'sourcetype': result.get('sourcetype', ''),
+            'count': result.get('count', '0')
+        })
+    return sourcetypes_by_index
+
+def _load_saved_searches() -> List[Dict[str, Any]]:
+    service = get_splunk_connection()
+    saved_searches = []
+    for saved_search in service.saved_searches:
+        try:
+            saved_searches.append({
+                "name": saved_search.name,
+                "description": saved_search.description or "",
+                "search": saved_search.search
+            })
+        except Exception as e:
+            logger.warning(f"⚠️ Error processing saved search: {str(e)}")
+            continue
+    return saved_searches
+
+def _load_apps() -> List[Dict[str, Any]]:
+    service = get_splunk_connection()
+    apps = []
+    for app in service.apps:
+        try:
+            apps.append({
+                "name": app['name'],
+                "label": app['label'],
+                "version": app['version']
+            })
+        except Exception as e:
+            logger.warning(f"⚠️ Error getting info for app {app['name']}: {str(e)}")
+            continue
+    return apps
+
+class MetadataCache:
+    """
+    Splunk metadata the agent asks for at the start of most chats, loaded by a background task every `interval`
+    seconds and served from memory. Only the very first request for an entry waits for Splunk; after that a failed
+    refresh keeps serving the last good copy and reports the error.
+    """
+
+    def __init__(self, loaders: Dict[str, Any], interval: int):
+        self.loaders = loaders
+        self.interval = interval
+        self.entries = {}
+        self.errors = {}
+        self.locks = {name: asyncio.Lock() for name in loaders}
+        self.task = None
+
+    async def refresh(self, name: str):
+        async with self.locks[name]:
+            started = time.time()
+            try:
+                data = await asyncio.to_thread(self.loaders[name])
+            except Exception as e:
+                self.errors[name] = str(e)
+                logger.warning(f"⚠️ Refreshing {name} metadata failed: {str(e)}")
+                return
+            self.entries[name] = (data, time.time())
+            self.errors.pop(name, None)
+            logger.debug(f"🗂️ Refreshed {name} metadata in {time.time() - started:.2f}s")
+
+    async def _run(self):
+        while True:
+            for name in self.loaders:
+                # Skip entries a request just loaded (the first pass races the request that started the task)
+                entry = self.entries.get(name)
+                if entry is None or time.time() - entry[1] >= self.interval / 2:
+                    await self.refresh(name)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Start the refresher in the server's event loop; called lazily by the tools."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def get(self, name: str) -> tuple:
+        """(data, staleness info) of one entry."""
+        self.start()
+        if name not in self.entries:
+            await self.refresh(name)
+        if name not in self.entries:
+            raise RuntimeError(f"Splunk {name} metadata unavailable: {self.errors.get(name)}")
+        data, refreshed = self.entries[name]
+        age = time.time() - refreshed
+        return data, {
+            "refreshed_at": datetime.fromtimestamp(refreshed, timezone.utc).isoformat(),
+            "age_seconds": round(age, 1),
+            "stale": age > 2 * self.interval,
+            "refresh_error": self.errors.get(name),
+        }
+
+metadata_cache = MetadataCache(
+    {"indexes": _load_indexes, "sourcetypes": _load_sourcetypes, "saved_searches": _load_saved_searches, "apps": _load_apps},
+    METADATA_REFRESH_SECONDS,
+)
+
+@mcp.tool()
+async def list_indexes() -> Dict[str, Any]:
+    """
+    Get a list of all available Splunk indexes (cached, refreshed in the background).
+    
+    Returns:
+        Dictionary containing list of indexes and the cache age
+    """
+    try:
+        indexes, cache = await metadata_cache.get("indexes")
+        return {"indexes": list(indexes), "cache": cache}
+    except Exception as e:
+        logger.error(f"❌ Failed to list indexes: {str(e)}")
+        raise
+
+@mcp.tool()
+async def get_index_info(index_name: str) -> Dict[str, Any]:
+    """
+    Get metadata for a specific Splunk index (cached, refreshed in the background).
+    
+    Args:
+        index_name: Name of the index to get metadata for
+        
+    Returns:
+        Dictionary containing index metadata and the cache age
+    """
+    try:
+        indexes, cache = await metadata_cache.get("indexes")
+        if index_name not in indexes:
+            # The index may have been created since the last refresh
+            await metadata_cache.refresh("indexes")
+            indexes, cache = await metadata_cache.get("indexes")
+        if index_name not in indexes:
+            raise KeyError(index_name)
+        return {**indexes[index_name], "cache": cache}
     except KeyError:
         logger.error(f"❌ Index not found: {index_name}")
         raise ValueError(f"Index not found: {index_name}")
@@ -187,30 +680,16 @@ async def get_index_info(index_name: str) -> Dict[str, Any]:
         raise
 
 @mcp.tool()
-async def list_saved_searches() -> List[Dict[str, Any]]:
+async def list_saved_searches() -> Dict[str, Any]:
     """
-    List all saved searches in Splunk
+    List all saved searches in Splunk (cached, refreshed in the background)
     
     Returns:
-        List of saved searches with their names, descriptions, and search queries
+        Saved searches with their names, descriptions, and search queries, and the cache age
     """
     try:
-        service = get_splunk_connection()
-        saved_searches = []
-        
-        for saved_search in service.saved_searches:
-            try:
-                saved_searches.append({
-                    "name": saved_search.name,
-                    "description": saved_search.description or "",
-                    "search": saved_search.search
-                })
-            except Exception as e:
-                logger.warning(f"⚠️ Error processing saved search: {str(e)}")
-                continue
-            
-        return saved_searches
-        
+        saved_searches, cache = await metadata_cache.get("saved_searches")
+        return {"saved_searches": saved_searches, "cache": cache}
     except Exception as e:
         logger.error(f"❌ Failed to list saved searches: {str(e)}")
         raise
@@ -430,27 +909,14 @@ async def list_kvstore_collections() -> List[Dict[str, Any]]:
 
 @mcp.tool()
 async def health_check() -> Dict[str, Any]:
-    """Get basic Splunk connection information and list available apps"""
+    """Get basic Splunk connection information and list available apps (cached, refreshed in the background)"""
     try:
-        service = get_splunk_connection()
         logger.info("🏥 Performing health check...")
-        
-        # List available apps
-        apps = []
-        for app in service.apps:
-            try:
-                app_info = {
-                    "name": app['name'],
-                    "label": app['label'],
-                    "version": app['version']
-                }
-                apps.append(app_info)
-            except Exception as e:
-                logger.warning(f"⚠️ Error getting info for app {app['name']}: {str(e)}")
-                continue
+        apps, cache = await metadata_cache.get("apps")
         
         response = {
-            "status": "healthy",
+            # The last background refresh is the latest connection attempt
+            "status": "degraded" if cache["refresh_error"] else "healthy",
             "connection": {
                 "host": SPLUNK_HOST,
                 "port": SPLUNK_PORT,
@@ -459,7 +925,8 @@ async def health_check() -> Dict[str, Any]:
                 "ssl_verify": VERIFY_SSL
             },
             "apps_count": len(apps),
-            "apps": apps
+            "apps": apps,
+            "cache": cache
         }
         
         logger.info(f"✅ Health check successful. Found {len(apps)} apps")
@@ -472,72 +939,34 @@ async def health_check() -> Dict[str, Any]:
 @mcp.tool()
 async def get_indexes_and_sourcetypes() -> Dict[str, Any]:
     """
-    Get a list of all indexes and their sourcetypes.
+    Get a list of all indexes and their sourcetypes (cached, refreshed in the background).
     
-    This endpoint performs a search to gather:
+    The background refresh gathers:
     - All available indexes
     - All sourcetypes within each index
-    - Event counts for each sourcetype
-    - Time range information
+    - Event counts for each sourcetype, over all time
     
     Returns:
         Dict[str, Any]: Dictionary containing:
             - indexes: List of all accessible indexes
             - sourcetypes: Dictionary mapping indexes to their sourcetypes
             - metadata: Additional information about the search
+            - cache: Age of the cached indexes and sourcetypes
     """
     try:
-        service = get_splunk_connection()
         logger.info("📊 Fetching indexes and sourcetypes...")
-        
-        # Get list of indexes
-        indexes = [index.name for index in service.indexes]
-        logger.info(f"Found {len(indexes)} indexes")
-        
-        # Search for sourcetypes across all indexes
-        search_query = """
-        | tstats count WHERE index=* BY index, sourcetype
-        | stats count BY index, sourcetype
-        | sort - count
-        """
-        
-        kwargs_search = {
-            "earliest_time": "-24h",
-            "latest_time": "now",
-            "preview": False,
-            "exec_mode": "blocking"
-        }
-        
-        logger.info("🔍 Executing search for sourcetypes...")
-        job = service.jobs.create(search_query, **kwargs_search)
-        
-        # Get the results
-        result_stream = job.results(output_mode='json')
-        results_data = json.loads(result_stream.read().decode('utf-8'))
-        
-        # Process results
-        sourcetypes_by_index = {}
-        for result in results_data.get('results', []):
-            index = result.get('index', '')
-            sourcetype = result.get('sourcetype', '')
-            count = result.get('count', '0')
-            
-            if index not in sourcetypes_by_index:
-                sourcetypes_by_index[index] = []
-            
-            sourcetypes_by_index[index].append({
-                'sourcetype': sourcetype,
-                'count': count
-            })
+        indexes, indexes_cache = await metadata_cache.get("indexes")
+        sourcetypes_by_index, sourcetypes_cache = await metadata_cache.get("sourcetypes")
         
         response = {
-            'indexes': indexes,
+            'indexes': list(indexes),
             'sourcetypes': sourcetypes_by_index,
             'metadata': {
                 'total_indexes': len(indexes),
                 'total_sourcetypes': sum(len(st) for st in sourcetypes_by_index.values()),
-                'search_time_range': '24 hours'
-            }
+                'search_time_range': 'all time'
+            },
+            'cache': {'indexes': indexes_cache, 'sourcetypes': sourcetypes_cache}
         }
         
         logger.info(f"✅ Successfully retrieved indexes and sourcetypes")
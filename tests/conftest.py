@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# The app imports its modules flat from app/, and config.py creates its state directories on import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+os.environ.setdefault("STATE_DIR", tempfile.mkdtemp(prefix="evtx-tests-"))
@@ -0,0 +1,32 @@
+import io
+import os
+import tarfile
+
+import pytest
+
+from services.archive import ARCHIVE_ERRORS, extract_evtx_members
+
+def tar_gz(members: dict) -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tf:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+def test_members_are_yielded_as_they_are_extracted(tmp_path):
+    data = tar_gz({"a/Security.evtx": b"1" * 1000, "notes.txt": b"x", "b/Security.evtx": os.urandom(1000)})
+    members = extract_evtx_members(io.BytesIO(data), "case.tar.gz", str(tmp_path))
+
+    name, path = next(members)
+    assert name == "Security.evtx"
+    # The second member is not inflated until the caller asks for it
+    assert os.listdir(tmp_path) == ["Security.evtx"]
+    assert [n for n, _ in members] == ["Security_1.evtx"]
+
+def test_truncated_archive_removes_the_partial_member(tmp_path):
+    data = tar_gz({"Security.evtx": os.urandom(200_000)})
+    with pytest.raises(ARCHIVE_ERRORS):
+        list(extract_evtx_members(io.BytesIO(data[:len(data) // 2]), "case.tar.gz", str(tmp_path)))
+    assert os.listdir(tmp_path) == []
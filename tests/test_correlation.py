@@ -0,0 +1,26 @@
+from services.correlation import load_sequences, correlate
+
+def detection(name: str, level: str, timestamp: str, group: str = "", tags=(), host: str = "DC01.corp.local") -> dict:
+    return {"name": name, "level": level, "group": group, "tags": list(tags), "timestamp": timestamp,
+            "document": {"data": {"Event": {"System": {"Computer": host}}}}}
+
+def test_one_detection_does_not_fill_two_steps():
+    sequences = load_sequences([{"name": "IOC after a high alert", "window": "1h", "by": "case",
+                                 "steps": [{"level": "high"}, {"group": "IOC Sweep"}]}], "case")
+    ioc_hit = detection("IOC: 10.13.37.5", "high", "2024-05-01T10:00:00Z", group="IOC Sweep")
+    assert correlate([ioc_hit], sequences) == []
+
+    alert = detection("Mimikatz Use", "critical", "2024-05-01T09:30:00Z")
+    incidents = correlate([alert, ioc_hit], sequences)
+    assert [[s["rule"] for s in i["steps"]] for i in incidents] == [["Mimikatz Use", "IOC: 10.13.37.5"]]
+
+def test_identical_steps_need_two_detections():
+    sequences = load_sequences([{"name": "Repeated dumping", "window": "10m",
+                                 "steps": [{"tag": "attack.credential_access"}, {"tag": "attack.credential_access"}]}], "case")
+    first = detection("Mimikatz Use", "high", "2024-05-01T10:00:00Z", tags=["attack.credential_access"])
+    assert correlate([first], sequences) == []
+
+    second = detection("LSASS Access", "high", "2024-05-01T10:00:00Z", tags=["attack.credential_access.t1003"])
+    incidents = correlate([first, second], sequences)
+    assert len(incidents) == 1
+    assert sorted(s["rule"] for s in incidents[0]["steps"]) == ["LSASS Access", "Mimikatz Use"]
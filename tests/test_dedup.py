@@ -0,0 +1,24 @@
+import hashlib
+
+from services.dedup import RecordDeduplicator, _ScalableBloomFilter
+
+def record(record_id, computer: str = "DC01") -> dict:
+    system = {"Computer": computer, "Channel": "Security", "TimeCreated": {"#attributes": {"SystemTime": "2024-05-01T10:00:00Z"}}}
+    if record_id is not None:
+        system["EventRecordID"] = record_id
+    return {"Event": {"System": system}}
+
+def test_records_without_identity_are_never_duplicates():
+    for mode in ("exact", "bloom"):
+        dedup = RecordDeduplicator(mode)
+        assert len(dedup.filter([record(None), record(None), record(1), record(1)])) == 3
+        assert len(dedup.filter([record(None), record(1)])) == 1
+        assert dedup.suppressed == 2
+
+def test_bloom_filter_grows_and_still_finds_earlier_records():
+    bloom = _ScalableBloomFilter(100, 0.001)
+    digests = [hashlib.blake2b(str(i).encode(), digest_size=16).digest() for i in range(1000)]
+    new = sum(not bloom.add(d) for d in digests)
+    assert len(bloom.filters) > 1
+    assert new >= 995
+    assert all(bloom.add(d) for d in digests)
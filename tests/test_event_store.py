@@ -0,0 +1,33 @@
+from services.event_store import EventStore, search
+from services.profiles import IngestProfile
+
+def record(record_id: int, provider: str, user: str) -> dict:
+    return {"Event": {
+        "#attributes": {"xmlns": "http://schemas.microsoft.com/win/2004/08/events/event"},
+        "System": {
+            "Provider": {"#attributes": {"Name": provider, "Guid": "{54849625-5478-4994-A5BA-3E3B0328C30D}"}},
+            "EventID": {"#attributes": {"Qualifiers": 0}, "#text": 4624},
+            "EventRecordID": record_id,
+            "Computer": "DC01",
+            "Channel": "Security",
+            "TimeCreated": {"#attributes": {"SystemTime": f"2024-01-01T00:00:0{record_id}Z"}},
+        },
+        "EventData": {"TargetUserName": user},
+    }}
+
+def matches(session_id: str, **fields) -> list[int]:
+    result = search(session_id, fields=fields)
+    return sorted(e.get("Event.System.EventRecordID") or e["Event"]["System"]["EventRecordID"] for e in result["events"])
+
+def test_fields_match_attributes_and_element_text():
+    store = EventStore("case_fields")
+    flat = IngestProfile("flat")
+    store.add([record(1, "Microsoft-Windows-Security-Auditing", "admin"), record(2, "Other", "guest"),
+               flat.apply(record(3, "Microsoft-Windows-Security-Auditing", "guest"))])
+    store.close()
+
+    assert matches("case_fields", **{"System.Provider.Name": "microsoft-windows-security-auditing"}) == [1, 3]
+    assert matches("case_fields", **{"Event.System.Provider.#attributes.Name": "Other"}) == [2]
+    assert matches("case_fields", **{"System.TimeCreated.SystemTime": "2024-01-01T00:00:02Z"}) == [2]
+    assert matches("case_fields", **{"System.EventID": "4624"}) == [1, 2, 3]
+    assert matches("case_fields", **{"EventData.TargetUserName": "guest"}) == [2, 3]
@@ -0,0 +1,20 @@
+from services.filters import RecordFilter, load_rules
+
+def record(event_id: int) -> dict:
+    return {"Event": {"System": {"EventID": event_id, "EventRecordID": event_id, "Computer": "DC01"}, "EventData": {}}}
+
+def test_rules_with_the_same_name_keep_separate_counters():
+    case_rules = load_rules([{"when": "event_id == 4624", "action": "sample", "rate": 1.0}], "case")
+    global_rules = load_rules([{"when": "event_id == 4624"}, {"name": "noise", "when": "event_id == 4634"},
+                               {"name": "noise", "when": "event_id == 5156"}], "global")
+    kept = RecordFilter(case_rules, global_rules).filter([record(4624), record(4634), record(5156), record(4688)])
+    assert [r["Event"]["System"]["EventID"] for r in kept] == [4624, 4688]
+
+    counters = RecordFilter(case_rules, global_rules)
+    counters.filter([record(4624), record(4634), record(5156), record(5156)])
+    assert [(c["name"], c["scope"], c["action"], c["matched"], c["dropped"]) for c in counters.counters] == [
+        ("event_id == 4624", "case", "sample", 1, 0),
+        ("event_id == 4624", "global", "drop", 0, 0),
+        ("noise", "global", "drop", 1, 1),
+        ("noise", "global", "drop", 2, 2),
+    ]
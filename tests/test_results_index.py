@@ -0,0 +1,22 @@
+from services.results_index import build_results_index, load_results_index, query_detections
+
+def detection(name: str, level: str, computer: str, timestamp: str) -> dict:
+    return {"name": name, "level": level, "timestamp": timestamp,
+            "document": {"data": {"Event": {"System": {"Computer": computer, "Channel": "Security", "EventID": 4625}}}}}
+
+def test_index_pages_detections_by_rule():
+    detections = [detection("Brute force", "high", "DC01", f"2024-01-01T00:00:0{i}Z") for i in range(3)]
+    detections.append(detection("Mimikatz", "critical", "WS01", "2024-01-01T00:00:09Z"))
+    build_results_index("case_results", {"session_id": "case_results", "detections": detections})
+
+    index = load_results_index("case_results")
+    assert index["summary"] == {"total": 4, "by_severity": {"high": 3, "critical": 1}}
+    assert [r["name"] for r in index["rules"]] == ["Brute force", "Mimikatz"]
+
+    page = query_detections("case_results", index, rule="Brute force", order="asc", offset=1, limit=1)
+    assert page["total"] == 3
+    assert [d["timestamp"] for d in page["detections"]] == ["2024-01-01T00:00:01Z"]
+
+def test_unknown_session_has_no_index():
+    assert load_results_index("missing_case") is None
+    assert load_results_index("../case_results") is None